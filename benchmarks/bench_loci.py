@@ -0,0 +1,152 @@
+"""
+Benchmarks for Locus/Loci construction and rendering on the GenBank files in tests/data.
+
+Run from the git root:
+    python benchmarks/bench_loci.py --save baseline.json
+    python benchmarks/bench_loci.py --compare baseline.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import matplotlib
+
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gene_loci_comparison import Locus, Loci
+from gene_loci_comparison.GenbankIndex import GenbankIndex
+
+GENOMES = dict(
+    pgap='tests/data/PGAP/FAM3257.gbk',
+    prokka='tests/data/Prokka/FAM3257.gbk',
+    new_prokka='tests/data/Prokka/Lbombicola_ESL0228.gbk',
+    yeast='tests/data/yeast/R64-3-1.gbk',
+)
+SPANS = [3000, 10000, 30000]
+N_LOCI = [1, 5, 20]
+
+
+def measure(func, repeat: int) -> dict:
+    """:returns: best and mean wall time (s) over repeat runs, peak memory (KiB) of one extra run"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+        plt.close('all')
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    plt.close('all')
+
+    return dict(best=min(times), mean=sum(times) / len(times), peak_kib=peak / 1024)
+
+
+def pick_locus_tags(gbk_file: str, n: int) -> [str]:
+    """n locus tags, evenly spaced over the file"""
+    locus_tags = list(GenbankIndex.load(gbk_file).loci)
+    step = max(1, len(locus_tags) // n)
+    return locus_tags[::step][:n]
+
+
+def without_layout_memo(locus: Locus, func):
+    """:returns: function that clears the memoized layouts of locus (see Locus.layout), then calls func"""
+    def run():
+        locus.clear_layout_cache()
+        return func()
+    return run
+
+
+def benchmarks(genome: str, gbk_file: str):
+    """Yields (name, function) pairs."""
+    locus_tag = pick_locus_tags(gbk_file, 3)[1]
+
+    def build_index():
+        GenbankIndex._loaded.clear()
+        GenbankIndex.build(gbk_file)
+
+    yield F'{genome}: build index', build_index
+    yield F'{genome}: gene lookup', lambda: GenbankIndex.load(gbk_file).get_scaffold_and_geneposition(locus_tag)
+
+    for span in SPANS:
+        locus = Locus(gbk_file=gbk_file, locus_tag=locus_tag, span=span)
+        locus_to_color_dict = {tag: '#1984ff' for tag in locus.locus_tags()[::2]}
+
+        yield F'{genome}: Locus.__init__ span={span}', lambda: Locus(gbk_file=gbk_file, locus_tag=locus_tag, span=span)
+        yield F'{genome}: colorize span={span}', lambda: locus.colorize(locus_to_color_dict)
+        # every run lays out the features again: the layouts are memoized per Locus
+        yield F'{genome}: plot span={span}', without_layout_memo(locus, lambda: locus.plot(figure_width=12))
+        yield F'{genome}: plot_gc span={span}', without_layout_memo(
+            locus, lambda: locus.plot_gc(figure_width=12, window_bp=100))
+        yield F'{genome}: plot_bokeh span={span}', without_layout_memo(locus, lambda: locus.plot_bokeh(figure_width=12))
+        yield F'{genome}: plot_bokeh memoized span={span}', lambda: locus.plot_bokeh(figure_width=12)
+
+    for n in N_LOCI:
+        loci_of_interest = [dict(gbk=gbk_file, gene=tag, title=tag) for tag in pick_locus_tags(gbk_file, n)]
+        yield F'{genome}: Loci.generate n={n}', lambda: Loci.generate(loci_of_interest, locus_to_color_dict={})
+
+
+def run(repeat: int, filter: str = None) -> {str: dict}:
+    results = {}
+    for genome, gbk_file in GENOMES.items():
+        if not os.path.isfile(gbk_file):
+            print(F'skipping {genome}: {gbk_file} not found', file=sys.stderr)
+            continue
+        for name, func in benchmarks(genome, gbk_file):
+            if filter and filter not in name:
+                continue
+            results[name] = measure(func, repeat)
+            r = results[name]
+            print(F'{name:<45} best {r["best"] * 1000:10.2f} ms   mean {r["mean"] * 1000:10.2f} ms   '
+                  F'peak {r["peak_kib"]:10.0f} KiB')
+    return results
+
+
+def compare(results: {str: dict}, baseline: {str: dict}, tolerance: float) -> [str]:
+    """:returns: names of benchmarks that are slower than baseline by more than tolerance (fraction)"""
+    regressions = []
+    for name, r in results.items():
+        if name not in baseline:
+            continue
+        ratio = r['best'] / baseline[name]['best']
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            print(F'REGRESSION {name}: {ratio:.2f}x slower than baseline')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Locus/Loci construction and rendering.')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per benchmark')
+    parser.add_argument('--filter', default=None, help='only run benchmarks whose name contains this string')
+    parser.add_argument('--save', default=None, help='save results to this JSON file')
+    parser.add_argument('--compare', default=None, help='compare results to this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before reporting regression')
+    args = parser.parse_args()
+
+    assert os.path.isfile('tests/test_loci.py'), f'Please set working directory to git root!'
+
+    results = run(args.repeat, args.filter)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,272 @@
+import os
+import json
+import argparse
+import threading
+import functools
+from urllib.parse import urlparse, parse_qs, quote, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from Bio.SeqRecord import SeqRecord
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from dna_features_viewer import GraphicFeature, GraphicRecord
+from dna_features_viewer.compute_features_levels import compute_features_levels
+
+from .Locus import Locus, _window_features, _translate, _drawn_location, _glyph_columns
+from .utils import get_locus_tag
+from .GenbankIndex import load_index
+from .FeatureStore import FeatureStore
+
+
+class FeatureServer:
+    """
+    Local HTTP service that sends the features of a scaffold in chunks of chunk_size bp, for
+    Locus.plot_bokeh(feature_server=...): the browser loads the features of the visible range on demand.
+
+    with FeatureServer([gbk_file, store]) as server:
+        save(locus.plot_bokeh(feature_server=server))
+        ...  # the page works for as long as the server runs
+
+    Sources are GenBank files or FeatureStores, served as /features/<name>/<locus_tag>?first=..&last=..&width=..
+    where name is the file name without extension and locus_tag is any gene on the scaffold.
+    Each chunk is laid out separately, with the features that overlap it: features belong to the chunk that contains
+    their start, features that reach into the next chunk keep their level there, so that they do not collide.
+    From the command line: python -m gene_loci_comparison.FeatureServer file1.gbk file2.gbk --port 8000
+    """
+
+    def __init__(self, sources=(), host='127.0.0.1', port=0, chunk_size=20000, max_chunks=8):
+        self.host = host
+        self.port = port
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.sources: {str: object} = {}
+        for source in sources:
+            self.register(source)
+        self._server = None
+        self._thread = None
+        self._scaffold = functools.lru_cache(maxsize=8)(self._load_scaffold)
+        self._levels: {(str, str, int): {tuple: float}} = {}  # see chunk_levels
+        self._levels_lock = threading.Lock()
+        self.chunk = functools.lru_cache(maxsize=256)(self._chunk)
+
+    def __str__(self) -> str:
+        return f'FeatureServer: {self.url} ({len(self.sources)} sources)'
+
+    def __enter__(self) -> 'FeatureServer':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        return F'http://{self.host}:{self.port}'
+
+    def register(self, source) -> str:
+        """:returns: name of source (GenBank file or FeatureStore), added if new"""
+        path = source.db_file if isinstance(source, FeatureStore) else source
+        name = os.path.splitext(os.path.basename(path))[0]
+        registered = self.sources.setdefault(name, source)
+        if registered is not source:
+            registered_path = registered.db_file if isinstance(registered, FeatureStore) else registered
+            assert os.path.abspath(registered_path) == os.path.abspath(path), \
+                F'Source name {name} is already used by {registered_path}'
+        return name
+
+    def source_url(self, source, locus_tag: str) -> str:
+        """:returns: base url of the chunks of the scaffold of locus_tag"""
+        return F'{self.url}/features/{quote(self.register(source))}/{quote(locus_tag)}'
+
+    def start(self):
+        """serve in a daemon thread. If port is 0, a free port is chosen."""
+        self._bind()
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = self._thread = None
+
+    def serve_forever(self):
+        self._bind()
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self._server = None
+
+    def _bind(self):
+        assert self._server is None, 'FeatureServer is already running'
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.feature_server = self
+        self.port = self._server.server_address[1]
+
+    def chunk_range(self, start: int, end: int, scaffold_length: int) -> (int, int):
+        """:returns: first and last chunk that the browser loads for the range start-end, see JAVASCRIPT_FETCH_CHUNKS"""
+        n_chunks = -(-scaffold_length // self.chunk_size)
+        left, right = min(start, end), max(start, end)
+        margin = (right - left) / 2
+        first = max(0, int((left - margin) // self.chunk_size))
+        last = min(n_chunks - 1, int((right + margin) // self.chunk_size))
+        if last - first >= self.max_chunks:
+            first = max(0, int((left + right) / 2 // self.chunk_size) - (self.max_chunks - 1) // 2)
+            last = min(n_chunks - 1, first + self.max_chunks - 1)
+        return first, last
+
+    def features(self, name: str, locus_tag: str, first: int, last: int, figure_width: float) -> dict:
+        """:returns: dict(patches=..., labels=..., segments=...) of the chunks first to last (inclusive)"""
+        if not (0 <= first <= last and last - first < self.max_chunks):
+            raise ValueError(F'Invalid chunks: {first} to {last} (at most {self.max_chunks})')
+        columns = dict(patches={}, labels={}, segments={})
+        for chunk in range(first, last + 1):
+            for glyph, data in self.chunk(name, locus_tag, chunk, figure_width).items():
+                for column, values in data.items():
+                    columns[glyph].setdefault(column, []).extend(values)
+        return columns
+
+    def _load_scaffold(self, name: str, locus_tag: str) -> SeqRecord:
+        scaffold, gene_location = load_index(self.sources[name]).get_scaffold_and_geneposition(locus_tag)
+        return scaffold
+
+    def _chunk(self, name: str, locus_tag: str, chunk: int, figure_width: float) -> dict:
+        """
+        :param figure_width: inches per chunk_size bp
+        :returns: dict(patches=..., labels=..., segments=...) of the features that start in the chunk
+        """
+        start = chunk * self.chunk_size
+        features = self._translate_chunk(name, locus_tag, chunk)
+        levels = self.chunk_levels(name, locus_tag, chunk)
+        for f in features:
+            f.data['fixed_level'] = levels[_feature_key(f)]
+        graphic_record = GraphicRecord(sequence_length=self.chunk_size, features=features, first_index=start)
+
+        # layout on a figure of auto height, without pyplot: chunks are laid out in parallel threads
+        fig = Figure(figsize=(figure_width, max([1, *levels.values()])))
+        FigureCanvasAgg(fig)
+        _, (features_levels, labels_data) = graphic_record.plot(ax=fig.add_subplot(1, 1, 1), figure_width=figure_width)
+
+        # features that start in a previous chunk are sent with it
+        features_levels = {f: level for f, level in features_levels.items() if f.start >= start}
+        labels_data = {f: data for f, data in labels_data.items() if f.start >= start}
+        return _glyph_columns(graphic_record, features_levels, labels_data, figure_width)
+
+    def chunk_levels(self, name: str, locus_tag: str, chunk: int) -> {tuple: float}:
+        """
+        :returns: levels of the features that overlap the chunk, by (start, end, strand, locus_tag), computed once.
+                  Features that start in a previous chunk keep their level from there.
+        """
+        with self._levels_lock:
+            if (name, locus_tag, chunk) not in self._levels:
+                # level the chunks from the last one that no feature reaches into: no recursion
+                first = chunk
+                while first > 0 and (name, locus_tag, first - 1) not in self._levels \
+                        and self._reaches_into(name, locus_tag, first):
+                    first -= 1
+                for leveled in range(first, chunk + 1):
+                    previous = self._levels.get((name, locus_tag, leveled - 1), {})
+                    features = self._translate_chunk(name, locus_tag, leveled)
+                    for f in features:
+                        if f.start < leveled * self.chunk_size:
+                            f.data['fixed_level'] = previous[_feature_key(f)]
+                    self._levels[name, locus_tag, leveled] = {
+                        _feature_key(f): level for f, level in compute_features_levels(features).items()
+                    }
+            return self._levels[name, locus_tag, chunk]
+
+    def _chunk_window(self, name: str, locus_tag: str, chunk: int) -> (int, int):
+        return chunk * self.chunk_size, min((chunk + 1) * self.chunk_size, len(self._scaffold(name, locus_tag)))
+
+    def _translate_chunk(self, name: str, locus_tag: str, chunk: int) -> [GraphicFeature]:
+        """:returns: translated features that overlap the chunk"""
+        scaffold = self._scaffold(name, locus_tag)
+        window = self._chunk_window(name, locus_tag, chunk)
+        return _translate(scaffold, _window_features(scaffold, window), Locus.default_description_order)
+
+    def _reaches_into(self, name: str, locus_tag: str, chunk: int) -> bool:
+        """:returns: whether a feature of a previous chunk overlaps the chunk"""
+        window = self._chunk_window(name, locus_tag, chunk)
+        return any(
+            _drawn_location(f).start < window[0] for f in _window_features(self._scaffold(name, locus_tag), window)
+        )
+
+
+def _feature_key(f: GraphicFeature) -> (int, int, int, str):
+    return int(f.start), int(f.end), f.strand, get_locus_tag(f)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_OPTIONS(self):
+        # CORS preflight: AjaxDataSource sets a Content-Type header
+        self.send_response(204)
+        self._cors_headers()
+        self.end_headers()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        query = parse_qs(url.query)
+        # explicit checks, not assert: requests are validated under python -O too
+        if len(parts) != 3 or parts[0] != 'features':
+            self.send_error(404, F'Not found: {url.path}')
+            return
+        name, locus_tag = unquote(parts[1]), unquote(parts[2])
+        feature_server = self.server.feature_server
+        if name not in feature_server.sources:
+            self.send_error(404, F'Not found: {name}')
+            return
+        try:
+            first, last = int(query['first'][0]), int(query['last'][0])
+            width = round(float(query['width'][0]), 2)
+        except (KeyError, ValueError) as e:
+            self.send_error(400, F'Invalid query: {e}')
+            return
+        if not 0 < width <= 1000:  # inches per chunk, also rejects nan and inf
+            self.send_error(400, F'Invalid width: {width}')
+            return
+        try:
+            body = json.dumps(feature_server.features(name, locus_tag, first, last, width)).encode('utf-8')
+        except KeyError as e:  # unknown locus_tag
+            self.send_error(404, str(e))
+            return
+        except ValueError as e:  # invalid chunks
+            self.send_error(400, str(e))
+            return
+        self.send_response(200)
+        self._cors_headers()
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _cors_headers(self):
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the features of GenBank files for Locus.plot_bokeh.')
+    parser.add_argument('sources', nargs='+', help='GenBank files or FeatureStores (.sqlite)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--chunk-size', type=int, default=20000)
+    args = parser.parse_args()
+
+    sources = [FeatureStore(s) if s.endswith('.sqlite') else s for s in args.sources]
+    server = FeatureServer(sources, host=args.host, port=args.port, chunk_size=args.chunk_size)
+    print(F'Serving {", ".join(server.sources)} at {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    main()
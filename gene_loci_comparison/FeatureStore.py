@@ -0,0 +1,212 @@
+import os
+import json
+import sqlite3
+from Bio import SeqIO
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from Bio.SeqFeature import SeqFeature, FeatureLocation, CompoundLocation
+
+from .utils import get_gene_location
+
+SEQUENCE_CHUNK_SIZE = 2 ** 16  # bytes per row of sequence_chunks: fixed, existing stores depend on it
+
+SCHEMA = """\
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    genome TEXT NOT NULL,
+    record_id TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    max_feature_length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sequence_chunks (
+    record INTEGER NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+    chunk INTEGER NOT NULL,
+    sequence BLOB NOT NULL,
+    PRIMARY KEY (record, chunk)
+);
+CREATE TABLE IF NOT EXISTS features (
+    record INTEGER NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    locus_tag TEXT,
+    location TEXT NOT NULL,
+    qualifiers TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS loci (
+    locus_tag TEXT PRIMARY KEY,
+    record INTEGER NOT NULL REFERENCES records(id) ON DELETE CASCADE,
+    gene_location INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_genome ON records(genome);
+CREATE INDEX IF NOT EXISTS features_locus_tag ON features(locus_tag);
+CREATE INDEX IF NOT EXISTS features_window ON features(record, start, end);\
+"""
+
+
+class FeatureStore:
+    """
+    SQLite store of the records and features of many GenBank files.
+
+    Can be used instead of a GenBank file path in Locus(gbk_file=...) and Loci.generate(dict(gbk=...)).
+    Only the features and the sequence in the crop window are loaded: sequences are stored in chunks of
+    SEQUENCE_CHUNK_SIZE bytes. Fuzzy positions are stored as exact positions.
+    Locus tags must be unique within the store.
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._connection = None
+
+    def __str__(self) -> str:
+        return f'FeatureStore: {self.db_file}'
+
+    def __getstate__(self) -> dict:
+        return dict(db_file=self.db_file)  # sqlite connections cannot be pickled
+
+    def __setstate__(self, state: dict):
+        self.__init__(**state)
+
+    def __contains__(self, locus_tag: str) -> bool:
+        return self.connection.execute('SELECT 1 FROM loci WHERE locus_tag = ?', (locus_tag,)).fetchone() is not None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            # the store may be used from executor threads (Locus.abuild), sqlite3 serializes the access
+            self._connection = sqlite3.connect(self.db_file, check_same_thread=False)
+            self._connection.execute('PRAGMA foreign_keys = ON')
+            self._connection.executescript(SCHEMA)
+            self._migrate()
+        return self._connection
+
+    def _migrate(self):
+        """stores written before sequence_chunks: move the sequences (records.sequence) into chunks"""
+        columns = [name for _, name, *_ in self._connection.execute('PRAGMA table_info(records)')]
+        if 'sequence' not in columns:
+            return
+        with self._connection as connection:
+            for record, sequence in connection.execute('SELECT id, sequence FROM records').fetchall():
+                _insert_sequence(connection, record, sequence)
+            connection.execute('ALTER TABLE records DROP COLUMN sequence')
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def genomes(self) -> [str]:
+        return [genome for genome, in self.connection.execute('SELECT DISTINCT genome FROM records ORDER BY genome')]
+
+    def import_genbank(self, gbk_file: str, genome: str = None):
+        """Import all records of gbk_file. Replaces the genome if it was imported before."""
+        assert os.path.isfile(gbk_file), F'File not found: {gbk_file}'
+        if genome is None:
+            genome = os.path.splitext(os.path.basename(gbk_file))[0]
+
+        with self.connection as connection:
+            connection.execute('DELETE FROM records WHERE genome = ?', (genome,))
+            loci = {}
+            with open(gbk_file) as input_handle:
+                for scf in SeqIO.parse(input_handle, 'genbank'):
+                    features = [f for f in scf.features if f.location is not None and f.type != 'source']
+                    record = connection.execute(
+                        'INSERT INTO records (genome, record_id, length, max_feature_length) VALUES (?, ?, ?, ?)',
+                        (
+                            genome, scf.id, len(scf),
+                            max([int(f.location.end) - int(f.location.start) for f in features], default=0)
+                        )
+                    ).lastrowid
+                    _insert_sequence(connection, record, str(scf.seq))
+                    connection.executemany(
+                        'INSERT INTO features (record, position, type, start, end, locus_tag, location, qualifiers) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        (
+                            (
+                                record, position, f.type, int(f.location.start), int(f.location.end),
+                                f.qualifiers['locus_tag'][0] if 'locus_tag' in f.qualifiers else None,
+                                json.dumps(_location_to_dict(f)), json.dumps(f.qualifiers)
+                            )
+                            for position, f in enumerate(features)
+                        )
+                    )
+                    for f in features:
+                        if f.type in ["gene", "CDS"] and "locus_tag" in f.qualifiers:
+                            loci.setdefault(f.qualifiers['locus_tag'][0], (record, get_gene_location(f)))
+            try:
+                connection.executemany(
+                    'INSERT INTO loci (locus_tag, record, gene_location) VALUES (?, ?, ?)',
+                    ((locus_tag, record, gene_location) for locus_tag, (record, gene_location) in loci.items())
+                )
+            except sqlite3.IntegrityError as e:
+                raise ValueError(F'{gbk_file}: locus tags must be unique within the store ({e})') from e
+
+    def get_scaffold_and_geneposition(self, locus_tag: str, span: int = None) -> (SeqRecord, int):
+        """
+        :returns: scaffold and gene location. The scaffold only contains the features and the sequence
+                  within gene_location ± span; its sequence is undefined elsewhere.
+        """
+        result = self.connection.execute(
+            'SELECT loci.record, loci.gene_location, records.record_id, records.length, records.max_feature_length '
+            'FROM loci JOIN records ON loci.record = records.id WHERE loci.locus_tag = ?',
+            (locus_tag,)
+        ).fetchone()
+        if result is None:
+            raise KeyError(F'Gene {locus_tag} was not found in store {self.db_file}')
+        record, gene_location, record_id, length, max_feature_length = result
+
+        if span is None:
+            start, end = 0, length
+        else:
+            start, end = max(0, gene_location - span), min(length, gene_location + span)
+
+        first_chunk = start // SEQUENCE_CHUNK_SIZE
+        chunks = self.connection.execute(
+            'SELECT sequence FROM sequence_chunks WHERE record = ? AND chunk BETWEEN ? AND ? ORDER BY chunk',
+            (record, first_chunk, (end - 1) // SEQUENCE_CHUNK_SIZE)
+        )
+        offset = start - first_chunk * SEQUENCE_CHUNK_SIZE
+        sequence = b''.join(chunk for chunk, in chunks)[offset:offset + end - start].decode('ascii')
+
+        features = [
+            _feature_from_row(*row) for row in self.connection.execute(
+                'SELECT type, location, qualifiers FROM features '
+                'WHERE record = ? AND start BETWEEN ? AND ? AND end >= ? ORDER BY position',
+                (record, start - max_feature_length, end, start)
+            )
+        ]
+
+        scaffold = SeqRecord(Seq({start: sequence}, length=length), id=record_id, features=features)
+        return scaffold, gene_location
+
+    def get_scaffolds_and_genepositions(self, locus_tags: [str], span: int = None) -> {str: (SeqRecord, int)}:
+        return {locus_tag: self.get_scaffold_and_geneposition(locus_tag, span=span) for locus_tag in locus_tags}
+
+
+def _insert_sequence(connection: sqlite3.Connection, record: int, sequence: str):
+    sequence = sequence.encode('ascii')
+    connection.executemany(
+        'INSERT INTO sequence_chunks (record, chunk, sequence) VALUES (?, ?, ?)',
+        (
+            (record, i // SEQUENCE_CHUNK_SIZE, sequence[i:i + SEQUENCE_CHUNK_SIZE])
+            for i in range(0, len(sequence), SEQUENCE_CHUNK_SIZE)
+        )
+    )
+
+
+def _location_to_dict(f: SeqFeature) -> dict:
+    return dict(
+        operator=getattr(f.location, 'operator', None),
+        parts=[[int(part.start), int(part.end), part.strand] for part in f.location.parts]
+    )
+
+
+def _feature_from_row(type: str, location: str, qualifiers: str) -> SeqFeature:
+    location = json.loads(location)
+    parts = [FeatureLocation(start, end, strand) for start, end, strand in location['parts']]
+    return SeqFeature(
+        parts[0] if len(parts) == 1 else CompoundLocation(parts, location['operator']),
+        type=type,
+        qualifiers=json.loads(qualifiers)
+    )
@@ -0,0 +1,88 @@
+import os
+import mmap
+import threading
+import numpy as np
+
+from .utils import gc_counts, gc_content_from_counts, gc_skew_from_counts
+from .SequenceStore import _SequenceWriter
+
+
+class GcTrackStore:
+    """
+    Cumulative G and C counts of many records in one flat file, read through mmap.
+
+    GC content and GC skew of any window size and step are differences of two counts: a figure reads the counts of
+    its window only, it does not read or scan the sequence. One track serves all window sizes and steps.
+    The counts are stored modulo 2 ** 16 (4 bytes per bp): differences are exact for windows up to max_window_bp.
+    The file is written with GcTrackStore.writer, the index (key -> (offset, size) in bytes) is kept by the caller.
+    """
+    dtype = np.dtype('<u2')
+    max_window_bp = 2 ** (8 * dtype.itemsize) - 1
+
+    def __init__(self, track_file: str, tracks: {object: (int, int)}):
+        self.track_file = track_file
+        self.tracks = tracks  # key -> (offset, size)
+        self._mmap = None
+        self._lock = threading.Lock()
+
+    def __str__(self) -> str:
+        return f'GcTrackStore: {self.track_file} ({len(self.tracks)} tracks)'
+
+    def __contains__(self, key) -> bool:
+        return key in self.tracks
+
+    def is_complete(self) -> bool:
+        """:returns: whether the file exists and has the size of the indexed tracks"""
+        try:
+            size = os.path.getsize(self.track_file)
+        except OSError:
+            return False
+        return size == sum(size for offset, size in self.tracks.values())
+
+    def sequence_length(self, key) -> int:
+        offset, size = self.tracks[key]
+        return size // (2 * self.dtype.itemsize) - 1
+
+    def counts(self, key, start: int, end: int) -> np.ndarray:
+        """:returns: cumulative G and C counts of the region start-end (see utils.gc_counts), a view of the file"""
+        length = self.sequence_length(key)
+        assert 0 <= start <= end <= length, F'Invalid region: {start}-{end} of {length} bp'
+        offset, size = self.tracks[key]
+        counts = np.frombuffer(self._map(), dtype=self.dtype, count=size // self.dtype.itemsize, offset=offset)
+        return counts.reshape(2, length + 1)[:, start:end + 1]
+
+    def gc_content(self, key, start: int, end: int, window_bp=100, step=1) -> (np.ndarray, np.ndarray):
+        """:returns: start of each window (relative to start), GC fraction of each window, see utils.calc_gc_content"""
+        return gc_content_from_counts(self.counts(key, start, end), window_bp, step)
+
+    def gc_skew(self, key, start: int, end: int, window_bp=100, step=1) -> (np.ndarray, np.ndarray):
+        """:returns: start of each window (relative to start), GC skew of each window, see utils.calc_gc_skew"""
+        return gc_skew_from_counts(self.counts(key, start, end), window_bp, step)
+
+    def _map(self) -> mmap.mmap:
+        with self._lock:
+            if self._mmap is None:
+                with open(self.track_file, 'rb') as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    @staticmethod
+    def writer(track_file: str) -> '_GcTrackWriter':
+        """
+        with GcTrackStore.writer(track_file) as writer:
+            writer.add(key, sequence)
+        store = writer.store  # None if the file could not be written
+
+        The file is replaced atomically when the block ends without error.
+        """
+        return _GcTrackWriter(track_file)
+
+
+class _GcTrackWriter(_SequenceWriter):
+    def add(self, key, sequence: bytes):
+        super().add(key, gc_counts(sequence).astype(GcTrackStore.dtype).tobytes())
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        super().__exit__(exc_type, exc_val, exc_tb)
+        if self.store is not None:
+            self.store = GcTrackStore(self.seq_file, self.sequences)
@@ -0,0 +1,272 @@
+import os
+import json
+import threading
+from io import StringIO
+from Bio import SeqIO
+from Bio.SeqRecord import SeqRecord
+
+from .utils import get_gene_location
+from .SequenceStore import SequenceStore
+from .GcTrackStore import GcTrackStore
+
+
+class GenbankIndex:
+    """
+    Persistent locus_tag -> (record offset, record id, gene location) index of a GenBank file.
+
+    The index is stored next to the GenBank file (gbk_file + index_suffix) and rebuilt whenever
+    the mtime or size of the GenBank file changes. If the index cannot be written, it is kept in memory only.
+
+    The sequences are stored in a SequenceStore (gbk_file + sequence_suffix): records are parsed without their
+    sequence and get a memory-mapped Seq, so that a Locus does not keep its whole chromosome in memory.
+    If the store cannot be written, records are parsed with their sequence.
+
+    The GC tracks (cumulative G and C counts) are stored in a GcTrackStore (gbk_file + gc_suffix), written from the
+    SequenceStore on the first get_gc_track: plot_gc reads the counts of its window instead of counting the sequence.
+    Indices that are never used for GC plots do not write the track.
+    """
+    index_suffix = '.locus_index.json'
+    sequence_suffix = '.locus_sequences'
+    gc_suffix = '.locus_gc'
+    version = 3
+
+    _loaded: {str: 'GenbankIndex'} = {}
+
+    def __init__(self, gbk_file: str, mtime: int, size: int, records: {int: int}, loci: {str: (int, str, int)},
+                 sequences: SequenceStore = None, gc_tracks: GcTrackStore = None):
+        self.gbk_file = gbk_file
+        self.mtime = mtime
+        self.size = size
+        self.records = records  # record offset -> record length (bytes)
+        self.loci = loci  # locus_tag -> (record offset, record id, gene location)
+        self.sequences = sequences  # record offset -> sequence, None: records are parsed with their sequence
+        self.gc_tracks = gc_tracks  # record offset -> GC track, None: not written (yet)
+        self._gc_lock = threading.Lock()
+        self._gc_unavailable = False
+
+    def __str__(self) -> str:
+        return f'GenbankIndex: {self.gbk_file} ({len(self.records)} records, {len(self.loci)} loci)'
+
+    def __contains__(self, locus_tag: str) -> bool:
+        return locus_tag in self.loci
+
+    @property
+    def index_file(self) -> str:
+        return self.gbk_file + self.index_suffix
+
+    @classmethod
+    def load(cls, gbk_file: str) -> 'GenbankIndex':
+        assert os.path.isfile(gbk_file), F'File not found: {gbk_file}'
+        stat = cls._stat(gbk_file)
+        key = os.path.abspath(gbk_file)
+
+        index = cls._loaded.get(key)
+        if index is None or not index.is_current(stat):
+            index = cls._read(gbk_file)
+            if index is None or not index.is_current(stat):
+                index = cls.build(gbk_file)
+                index.save()
+            cls._loaded[key] = index
+        return index
+
+    @classmethod
+    def build(cls, gbk_file: str) -> 'GenbankIndex':
+        mtime, size = cls._stat(gbk_file)
+        records = {}
+        loci = {}
+        with open(gbk_file, 'rb') as input_handle, SequenceStore.writer(gbk_file + cls.sequence_suffix) as writer:
+            for offset, raw_record in _iter_raw_records(input_handle):
+                records[offset] = len(raw_record)
+                scf = _parse_raw_record(raw_record)
+                for f in scf.features:
+                    if f.type in ["gene", "CDS"] and "locus_tag" in f.qualifiers:
+                        loci.setdefault(f.qualifiers['locus_tag'][0], (offset, scf.id, get_gene_location(f)))
+                if scf.seq.defined:
+                    writer.add(offset, bytes(scf.seq))
+        return cls(gbk_file, mtime=mtime, size=size, records=records, loci=loci, sequences=writer.store)
+
+    @classmethod
+    def _stat(cls, gbk_file: str) -> (int, int):
+        """:returns: mtime (ns) and size of the indexed file"""
+        stat = os.stat(gbk_file)
+        return stat.st_mtime_ns, stat.st_size
+
+    def is_current(self, stat: (int, int) = None) -> bool:
+        if stat is None:
+            stat = self._stat(self.gbk_file)
+        return (self.mtime, self.size) == stat and \
+            (self.sequences is None or self.sequences.is_complete())
+
+    def save(self) -> bool:
+        data = dict(
+            version=self.version,
+            mtime=self.mtime,
+            size=self.size,
+            records=[[offset, length] for offset, length in self.records.items()],
+            loci=self.loci,
+            sequences=None if self.sequences is None else [
+                [offset, sequence_offset, length]
+                for offset, (sequence_offset, length) in self.sequences.sequences.items()
+            ],
+            gc_tracks=None if self.gc_tracks is None else [
+                [offset, track_offset, size] for offset, (track_offset, size) in self.gc_tracks.tracks.items()
+            ],
+        )
+        tmp_file = F'{self.index_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.index_file)
+        except OSError:
+            if os.path.isfile(tmp_file):
+                os.remove(tmp_file)
+            return False
+        return True
+
+    @classmethod
+    def _read(cls, gbk_file: str):
+        try:
+            with open(gbk_file + cls.index_suffix) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != cls.version:
+            return None
+        return cls(
+            gbk_file,
+            mtime=data['mtime'],
+            size=data['size'],
+            records={offset: length for offset, length in data['records']},
+            loci={locus_tag: tuple(entry) for locus_tag, entry in data['loci'].items()},
+            sequences=None if data['sequences'] is None else SequenceStore(
+                gbk_file + cls.sequence_suffix,
+                {offset: (sequence_offset, length) for offset, sequence_offset, length in data['sequences']}
+            ),
+            gc_tracks=None if data['gc_tracks'] is None else GcTrackStore(
+                gbk_file + cls.gc_suffix,
+                {offset: (track_offset, size) for offset, track_offset, size in data['gc_tracks']}
+            ),
+        )
+
+    def get_gc_track(self, locus_tag: str) -> (GcTrackStore, int):
+        """
+        :returns: GcTrackStore and key of the record of locus_tag, None if the record has no GC track.
+                  The track is written on first use, None if it cannot be written.
+        """
+        offset = self.loci[locus_tag][0]
+        with self._gc_lock:
+            if self.gc_tracks is None or not self.gc_tracks.is_complete():
+                self._write_gc_tracks()
+            gc_tracks = self.gc_tracks
+        if gc_tracks is None or offset not in gc_tracks:
+            return None
+        return gc_tracks, offset
+
+    def _write_gc_tracks(self):
+        self.gc_tracks = None
+        if self.sequences is None or self._gc_unavailable:
+            return
+        with GcTrackStore.writer(self.gbk_file + self.gc_suffix) as writer:
+            for key in self.sequences.sequences:
+                writer.add(key, bytes(self.sequences.get(key)))
+        self.gc_tracks = writer.store
+        if self.gc_tracks is None:
+            self._gc_unavailable = True  # cannot be written: do not try again for every locus
+        else:
+            self.save()
+
+    def get_record(self, offset: int) -> SeqRecord:
+        with open(self.gbk_file, 'rb') as input_handle:
+            input_handle.seek(offset)
+            return self._parse(offset, input_handle.read(self.records[offset]))
+
+    def _parse(self, offset: int, raw_record: bytes) -> SeqRecord:
+        if self.sequences is None or offset not in self.sequences:
+            return _parse_raw_record(raw_record)
+        record = _parse_raw_record(_without_sequence(raw_record))
+        record.seq = self.sequences.get(offset)
+        return record
+
+    def get_scaffold_and_geneposition(self, locus_tag: str, span: int = None) -> (SeqRecord, int):
+        if locus_tag not in self.loci:
+            raise KeyError(F'Gene {locus_tag} was not found in file {self.gbk_file}')
+        offset, record_id, gene_location = self.loci[locus_tag]
+        return self.get_record(offset), gene_location
+
+    def get_scaffolds_and_genepositions(self, locus_tags: [str], span: int = None) -> {str: (SeqRecord, int)}:
+        """Resolve many locus tags in one pass through the file. Each record is parsed once and shared."""
+        for locus_tag in locus_tags:
+            if locus_tag not in self.loci:
+                raise KeyError(F'Gene {locus_tag} was not found in file {self.gbk_file}')
+
+        offsets = sorted(set(self.loci[locus_tag][0] for locus_tag in locus_tags))
+        scaffolds = {}
+        with open(self.gbk_file, 'rb') as input_handle:
+            for offset in offsets:
+                input_handle.seek(offset)
+                scaffolds[offset] = self._parse(offset, input_handle.read(self.records[offset]))
+
+        return {
+            locus_tag: (scaffolds[self.loci[locus_tag][0]], self.loci[locus_tag][2])
+            for locus_tag in locus_tags
+        }
+
+
+def load_index(gbk_file):
+    """
+    :param gbk_file: path to a GenBank file, a GFF3 file (.gff, .gff3) or another source of loci, e.g. a FeatureStore
+    :returns: GenbankIndex of the GenBank file, GffIndex of the GFF3 file, other sources are returned as they are
+    """
+    if isinstance(gbk_file, (str, os.PathLike)):
+        from .GffIndex import GffIndex, is_gff  # GffIndex imports GenbankIndex
+        return GffIndex.load(gbk_file) if is_gff(gbk_file) else GenbankIndex.load(gbk_file)
+    return gbk_file
+
+
+def resolve_loci(requests: [(str, str)], span: int = None) -> [(SeqRecord, int)]:
+    """
+    Resolve (gbk_file, locus_tag) pairs, grouped by file.
+
+    :param span: sources that support it (FeatureStore) only load the features within gene_location ± span
+    :returns: list of (scaffold, gene_location), in the order of requests. Loci on the same scaffold share the SeqRecord.
+    """
+    locus_tags_per_file: {str: [str]} = {}
+    for gbk_file, locus_tag in requests:
+        locus_tags_per_file.setdefault(gbk_file, []).append(locus_tag)
+
+    resolved = {
+        gbk_file: load_index(gbk_file).get_scaffolds_and_genepositions(locus_tags, span=span)
+        for gbk_file, locus_tags in locus_tags_per_file.items()
+    }
+
+    return [resolved[gbk_file][locus_tag] for gbk_file, locus_tag in requests]
+
+
+def _iter_raw_records(input_handle) -> (int, bytes):
+    """Yields (byte offset, raw bytes) of each record in a binary GenBank file handle."""
+    offset = 0
+    record_start = None
+    lines = []
+    for line in input_handle:
+        if line.startswith(b'LOCUS'):
+            if record_start is not None:
+                yield record_start, b''.join(lines)
+            record_start = offset
+            lines = []
+        if record_start is not None:
+            lines.append(line)
+        offset += len(line)
+    if record_start is not None:
+        yield record_start, b''.join(lines)
+
+
+def _without_sequence(raw_record: bytes) -> bytes:
+    """:returns: raw record with an empty ORIGIN section: Biopython creates an undefined sequence of the same length"""
+    origin = raw_record.rfind(b'\nORIGIN')
+    if origin == -1:
+        return raw_record
+    return raw_record[:origin + 1] + b'ORIGIN\n//\n'
+
+
+def _parse_raw_record(raw_record: bytes) -> SeqRecord:
+    return SeqIO.read(StringIO(raw_record.decode('utf-8')), 'genbank')
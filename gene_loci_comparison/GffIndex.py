@@ -0,0 +1,283 @@
+import os
+import re
+from urllib.parse import unquote
+from Bio.Seq import Seq
+from Bio.SeqRecord import SeqRecord
+from Bio.SeqFeature import SeqFeature, FeatureLocation, CompoundLocation
+
+from .utils import get_gene_location
+from .GenbankIndex import GenbankIndex
+from .SequenceStore import SequenceStore
+
+
+class GffIndex(GenbankIndex):
+    """
+    Persistent index of a GFF3 file (e.g. from Prokka or PGAP), used like a GenbankIndex: load_index returns it for
+    files ending in .gff or .gff3.
+
+    The sequences are read from the ##FASTA section of the GFF3 file or, if there is none, from the FASTA file with
+    the same name (fasta_extensions) and kept in a SequenceStore. The index stores the byte ranges of the feature
+    lines of each sequence and the extents of its joined (multi-line) features
+    (records: seqid -> (length, [(offset, size), ...], [(start, end), ...])): a locus streams through the lines of
+    its sequence and only parses the attributes of the features that overlap gene_location ± span, extended to the
+    whole extent of the joined features it overlaps.
+
+    Attributes become qualifiers (Note -> note, Dbxref -> db_xref), lines with the same ID are joined.
+    """
+    fasta_extensions = ('.fna', '.fasta', '.fa')
+    qualifier_names = {'Note': 'note', 'Dbxref': 'db_xref'}
+    version = 4  # format of GenbankIndex.version 3, records with the extents of joined features
+
+    @classmethod
+    def fasta_file(cls, gff_file: str):
+        """:returns: path of the FASTA file next to gff_file, None if there is none"""
+        stem = os.path.splitext(gff_file)[0]
+        for extension in cls.fasta_extensions:
+            if os.path.isfile(stem + extension):
+                return stem + extension
+        return None
+
+    @classmethod
+    def _stat(cls, gff_file: str) -> (int, int):
+        """:returns: mtime (ns) and size of the GFF3 file and its FASTA file (latest mtime, total size)"""
+        stats = [os.stat(path) for path in (gff_file, cls.fasta_file(gff_file)) if path is not None]
+        return max(stat.st_mtime_ns for stat in stats), sum(stat.st_size for stat in stats)
+
+    @classmethod
+    def build(cls, gff_file: str) -> 'GffIndex':
+        mtime, size = cls._stat(gff_file)
+        blocks: {str: [[int, int]]} = {}
+        lengths: {str: int} = {}
+        gene_lines: {str: [bytes]} = {}
+        extents: {str: {(bytes, bytes): [int, int, int]}} = {}  # seqid -> (type, ID) -> start, end, lines
+
+        with open(gff_file, 'rb') as input_handle, SequenceStore.writer(gff_file + cls.sequence_suffix) as writer:
+            offset = 0
+            previous = None
+            fasta_lines = None
+            for line in input_handle:
+                if line.startswith(b'##FASTA') or line.startswith(b'>'):
+                    fasta_lines = input_handle if line.startswith(b'##FASTA') else _chain(line, input_handle)
+                    break
+                if line.startswith(b'##sequence-region'):
+                    seqid, start, end = line.split()[1:4]
+                    lengths[unquote(seqid.decode('utf-8'))] = int(end)
+                elif line.strip() and not line.startswith(b'#'):
+                    columns = line.rstrip(b'\r\n').split(b'\t', 8)
+                    seqid = unquote(columns[0].decode('utf-8'))
+                    if seqid == previous:
+                        # comment lines within the block are skipped by _window_rows
+                        blocks[seqid][-1][1] = offset + len(line) - blocks[seqid][-1][0]
+                    else:
+                        blocks.setdefault(seqid, []).append([offset, len(line)])
+                        previous = seqid
+                    lengths[seqid] = max(lengths.get(seqid, 0), int(columns[4]))
+                    feature_id = _ID.search(columns[8]) if len(columns) == 9 else None
+                    if feature_id is not None:
+                        extent = extents.setdefault(seqid, {}).setdefault(
+                            (columns[2], feature_id.group(1)), [int(columns[3]) - 1, int(columns[4]), 0])
+                        extent[0], extent[1] = min(extent[0], int(columns[3]) - 1), max(extent[1], int(columns[4]))
+                        extent[2] += 1
+                    if columns[2] in (b'gene', b'CDS') and b'locus_tag=' in line:
+                        gene_lines.setdefault(seqid, []).append(line)
+                offset += len(line)
+
+            fasta_file = cls.fasta_file(gff_file)
+            assert fasta_lines is not None or fasta_file is not None, \
+                F'{gff_file} has no ##FASTA section and no FASTA file ({", ".join(cls.fasta_extensions)})'
+            if fasta_lines is not None:
+                cls._add_sequences(_iter_fasta(fasta_lines), lengths, writer)
+            else:
+                with open(fasta_file, 'rb') as fasta_handle:
+                    cls._add_sequences(_iter_fasta(fasta_handle), lengths, writer)
+
+        loci = {}
+        for seqid, lines in gene_lines.items():
+            for f in _to_features([_parse_row(line) for line in lines], cls.qualifier_names):
+                if "locus_tag" in f.qualifiers:
+                    loci.setdefault(f.qualifiers['locus_tag'][0], (seqid, seqid, get_gene_location(f)))
+
+        records = {
+            seqid: (lengths[seqid], blocks.get(seqid, []), [
+                (start, end) for start, end, n_lines in extents.get(seqid, {}).values() if n_lines > 1
+            ])
+            for seqid in lengths
+        }
+        return cls(gff_file, mtime=mtime, size=size, records=records, loci=loci, sequences=writer.store)
+
+    @staticmethod
+    def _add_sequences(sequences, lengths: {str: int}, writer):
+        for seqid, sequence in sequences:
+            lengths[seqid] = len(sequence)
+            writer.add(seqid, sequence)
+
+    def get_record(self, seqid: str, window: (int, int) = None) -> SeqRecord:
+        """
+        :returns: record of seqid, with the features that overlap window (boundaries included) or all features.
+                  Joined features that overlap window are complete.
+        """
+        length, blocks, joined = self.records[seqid]
+        if window is not None:
+            window = _joined_window(window, joined)
+        rows = []
+        with open(self.gbk_file, 'rb') as input_handle:
+            for offset, size in blocks:
+                input_handle.seek(offset)
+                rows.extend(_window_rows(input_handle, size, window))
+        return SeqRecord(self._sequence(seqid, length), id=seqid, name=seqid,
+                         features=_to_features(rows, self.qualifier_names))
+
+    def _sequence(self, seqid: str, length: int) -> Seq:
+        if self.sequences is not None and seqid in self.sequences:
+            return self.sequences.get(seqid)
+        # the SequenceStore could not be written: read the sequence from the FASTA
+        fasta_file = self.fasta_file(self.gbk_file)
+        with open(self.gbk_file if fasta_file is None else fasta_file, 'rb') as input_handle:
+            for fasta_seqid, sequence in _iter_fasta(_after_fasta_directive(input_handle)):
+                if fasta_seqid == seqid:
+                    return Seq(sequence)
+        return Seq(None, length=length)
+
+    def get_scaffold_and_geneposition(self, locus_tag: str, span: int = None) -> (SeqRecord, int):
+        """
+        :param span: only the features within gene_location ± span are parsed, the sequence is complete
+        """
+        return self.get_scaffolds_and_genepositions([locus_tag], span=span)[locus_tag]
+
+    def get_scaffolds_and_genepositions(self, locus_tags: [str], span: int = None) -> {str: (SeqRecord, int)}:
+        """Each sequence is read once, loci on the same sequence share the SeqRecord."""
+        for locus_tag in locus_tags:
+            if locus_tag not in self.loci:
+                raise KeyError(F'Gene {locus_tag} was not found in file {self.gbk_file}')
+
+        windows: {str: (int, int)} = {}
+        for locus_tag in locus_tags:
+            seqid, record_id, gene_location = self.loci[locus_tag]
+            if span is None:
+                windows[seqid] = None
+            elif seqid not in windows:
+                windows[seqid] = (gene_location - span, gene_location + span)
+            elif windows[seqid] is not None:
+                windows[seqid] = (min(windows[seqid][0], gene_location - span),
+                                  max(windows[seqid][1], gene_location + span))
+
+        scaffolds = {seqid: self.get_record(seqid, window) for seqid, window in windows.items()}
+        return {
+            locus_tag: (scaffolds[self.loci[locus_tag][0]], self.loci[locus_tag][2])
+            for locus_tag in locus_tags
+        }
+
+
+def is_gff(path) -> bool:
+    return str(path).lower().endswith(('.gff', '.gff3'))
+
+
+def _parse_row(line: bytes) -> (str, int, int, int, bytes):
+    """:returns: type, start (0-based), end, strand and attributes of a feature line"""
+    seqid, source, type, start, end, score, strand, phase, attributes = line.rstrip(b'\r\n').split(b'\t', 8)
+    return type.decode('utf-8'), int(start) - 1, int(end), _STRANDS.get(strand), attributes
+
+
+_STRANDS = {b'+': 1, b'-': -1}
+_ID = re.compile(rb'(?:^|;)\s*ID=([^;]*)')
+
+
+def _joined_window(window: (int, int), joined: [(int, int)]) -> (int, int):
+    """:returns: window extended to the extents of the joined features that overlap it"""
+    start, end = window
+    extended = True
+    while extended:
+        extended = False
+        for joined_start, joined_end in joined:
+            if joined_end >= start and joined_start <= end and (joined_start < start or joined_end > end):
+                start, end = min(start, joined_start), max(end, joined_end)
+                extended = True
+    return start, end
+
+
+def _window_rows(input_handle, size: int, window: (int, int) = None) -> [(str, int, int, int, bytes)]:
+    """streams size bytes of feature lines, :returns: rows (see _parse_row) that overlap window"""
+    rows = []
+    position = 0
+    for line in input_handle:
+        position += len(line)
+        if line.strip() and not line.startswith(b'#'):
+            if window is None:
+                rows.append(_parse_row(line))
+            else:
+                # only the coordinates are parsed for features outside of window
+                columns = line.split(b'\t', 5)
+                if int(columns[4]) >= window[0] and int(columns[3]) - 1 <= window[1]:
+                    rows.append(_parse_row(line))
+        if position >= size:
+            break
+    return rows
+
+
+def _to_features(rows: [(str, int, int, int, bytes)], qualifier_names: {str: str}) -> [SeqFeature]:
+    """:returns: SeqFeatures of the rows, in order. Rows with the same type and ID are joined."""
+    features = []
+    joined: {(str, str): int} = {}
+    for type, start, end, strand, attributes in rows:
+        qualifiers = _qualifiers(attributes, qualifier_names)
+        key = (type, qualifiers['ID'][0]) if 'ID' in qualifiers else None
+        if key is not None and key in joined:
+            features[joined[key]][1].append(FeatureLocation(start, end, strand))
+            continue
+        if key is not None:
+            joined[key] = len(features)
+        features.append((type, [FeatureLocation(start, end, strand)], qualifiers))
+
+    seq_features = []
+    for type, parts, qualifiers in features:
+        if len(parts) == 1:
+            location = parts[0]
+        else:
+            # in the order of transcription, like complement(join(...)) in GenBank files
+            parts.sort(key=lambda part: part.start, reverse=parts[0].strand == -1)
+            location = CompoundLocation(parts, 'join')
+        seq_features.append(SeqFeature(location, type=type, qualifiers=qualifiers))
+    return seq_features
+
+
+def _qualifiers(attributes: bytes, qualifier_names: {str: str}) -> {str: [str]}:
+    qualifiers = {}
+    for attribute in attributes.decode('utf-8').strip().split(';'):
+        if '=' not in attribute:
+            continue
+        key, values = attribute.split('=', 1)
+        key = unquote(key.strip())
+        qualifiers[qualifier_names.get(key, key)] = [unquote(value) for value in values.split(',')]
+    return qualifiers
+
+
+def _iter_fasta(lines) -> (str, bytes):
+    """Yields (seqid, sequence) of binary FASTA lines. The seqid is the first word of the header."""
+    seqid = None
+    sequence = []
+    for line in lines:
+        if line.startswith(b'>'):
+            if seqid is not None:
+                yield seqid, b''.join(sequence)
+            seqid = line[1:].split(maxsplit=1)[0].decode('utf-8') if line[1:].strip() else ''
+            sequence = []
+        elif seqid is not None:
+            sequence.append(line.strip())
+    if seqid is not None:
+        yield seqid, b''.join(sequence)
+
+
+def _after_fasta_directive(input_handle):
+    """lines of a FASTA file, or of the ##FASTA section of a GFF3 file"""
+    for line in input_handle:
+        if line.startswith(b'>'):
+            yield line
+            break
+        if line.startswith(b'##FASTA'):
+            break
+    yield from input_handle
+
+
+def _chain(first_line: bytes, lines):
+    yield first_line
+    yield from lines
@@ -1,9 +1,25 @@
 import os
+from concurrent.futures import Executor, ProcessPoolExecutor
 import matplotlib.pyplot as plt
-from bokeh.models import CustomJS
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import numpy as np
+from bokeh.models import CustomJS, CustomJSExpr, ColumnDataSource, Range1d, TapTool, FixedTicker
+from bokeh.plotting import figure
+from bokeh.layouts import column
+from bokeh.embed import json_item, components
+from bokeh.resources import CDN
+from bokeh.core.properties import value, expr
+from bokeh.transform import linear_cmap
 
-from .utils import JAVASCRIPT_SYNC_SCROLL
+from .utils import JAVASCRIPT_SYNC_SCROLL, JAVASCRIPT_SYNC_SCROLL_BROADCAST, JAVASCRIPT_TAP_CALLBACK, \
+    JAVASCRIPT_PATCH_XS, JAVASCRIPT_PATCH_YS, JAVASCRIPT_FEATURE_TEXT
 from .Locus import Locus
+from .LocusCache import LocusCache
+from .FeatureStore import FeatureStore
+from .GenbankIndex import load_index, resolve_loci
+from .Profiler import stage, profiled
+from .export import write_stitched
 
 DEFAULT_DESCRIPTIOIN_ORDER = [
     "locus_tag",
@@ -16,6 +32,15 @@ DEFAULT_DESCRIPTIOIN_ORDER = [
 ]
 
 
+class LocusError(Exception):
+    def __init__(self, locus_of_interest: dict, message: str):
+        self.locus_of_interest = locus_of_interest
+        super().__init__(locus_of_interest, message)
+
+    def __str__(self) -> str:
+        return F'Failed to generate locus {self.locus_of_interest}: {self.args[1]}'
+
+
 class Loci:
     def __init__(self, loci: [Locus]):
         self.loci = loci
@@ -27,6 +52,7 @@ class Loci:
         return [locus.locus_tags() for locus in self.loci]
 
     @staticmethod
+    @profiled('generate')
     def generate(
             loci_of_interest: [dict],
             span=3000,
@@ -35,36 +61,68 @@ class Loci:
             locus_to_color_dict=None,
             default_color='#ffffff',
             strict=False,
+            workers=None,
+            executor: Executor = None,
+            cache: LocusCache = None,
     ):
+        """
+        :param workers: build loci in a process pool with this many workers
+        :param executor: build loci with this concurrent.futures.Executor (overrides workers)
+        :param cache: load loci from this LocusCache if possible, store newly built loci in it
+        :returns: Loci, in the order of loci_of_interest
+        """
         if description_order is None:
             description_order = DEFAULT_DESCRIPTIOIN_ORDER
 
         for l in loci_of_interest:
             for key in ('gbk', 'gene', 'title'):
                 assert key in l, F'Locus of interest ({l}) lacks key: {key}.'
-            assert os.path.isfile(l['gbk']), F'File not found: {l}'
+            assert isinstance(l['gbk'], FeatureStore) or os.path.isfile(l['gbk']), F'File not found: {l}'
             assert type(l['gene']) is str, F'Gene must be string: {l}'
             assert type(l['title']) is str, F'Title must be string: {l}'
 
-        loci: [Locus] = []
-        for l in loci_of_interest:
-            locus = Locus(
-                gbk_file=l['gbk'],
-                locus_tag=l['gene'],
-                title=l['title'],
-                span=span,
-                description_order=description_order,
-                add_start_end_feature=add_start_end_feature
-            )
-            locus.colorize(
-                locus_to_color_dict=locus_to_color_dict,
-                default_color=default_color,
-                strict=strict
-            )
-            loci.append(locus)
+        locus_kwargs = dict(
+            span=span,
+            description_order=description_order,
+            add_start_end_feature=add_start_end_feature
+        )
+
+        loci: [Locus] = [None] * len(loci_of_interest)
+
+        if cache is not None:
+            keys = [cache.key(l['gbk'], l['gene'], **locus_kwargs) for l in loci_of_interest]
+            loci = [cache.get(key) for key in keys]
+
+        to_build = [i for i, locus in enumerate(loci) if locus is None]
+
+        if to_build and executor is None and workers is not None and workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as own_executor:
+                built = _build_loci_with_executor(own_executor, [loci_of_interest[i] for i in to_build], **locus_kwargs)
+        elif to_build and executor is not None:
+            built = _build_loci_with_executor(executor, [loci_of_interest[i] for i in to_build], **locus_kwargs)
+        else:
+            built = _build_loci([loci_of_interest[i] for i in to_build], **locus_kwargs)
+
+        for i, locus in zip(to_build, built):
+            loci[i] = locus
+            if cache is not None:
+                cache.put(keys[i], locus)
+
+        for l, locus in zip(loci_of_interest, loci):
+            locus.title = l['title']
+            locus.gbk_file = l['gbk']
+            try:
+                locus.colorize(
+                    locus_to_color_dict=locus_to_color_dict,
+                    default_color=default_color,
+                    strict=strict
+                )
+            except KeyError as e:
+                raise LocusError(l, F'{type(e).__name__}: {e}') from e
 
         return Loci(loci)
 
+    @profiled('plot')
     def plot(
             self,
             fig_single_height=2,
@@ -92,21 +150,25 @@ class Loci:
 
         return plt
 
+    @profiled('plot_gc')
     def plot_gc(
             self,
             fig_single_height=3,
             fig_width=10,
             auto_reverse=True,
+            gc_skew=False,
             *args, **kwargs
     ):
         """:returns matplotlib.pyplot module"""
 
         n_loci = len(self.loci)
+        height_ratios = [4, 1, 1] if gc_skew else [4, 1]
+        n_rows = len(height_ratios)
 
         fig, axes = plt.subplots(
-            ncols=1, nrows=n_loci * 2,
+            ncols=1, nrows=n_loci * n_rows,
             constrained_layout=True,
-            gridspec_kw=dict(height_ratios=[4, 1] * n_loci),
+            gridspec_kw=dict(height_ratios=height_ratios * n_loci),
             figsize=(fig_width, n_loci * fig_single_height)
         )
 
@@ -118,25 +180,80 @@ class Loci:
         for i, locus in enumerate(self.loci):
             locus: Locus
 
-            ax1 = axes[i * 2]
-            ax2 = axes[i * 2 + 1]
-            ax1, ax2 = locus.plot_gc(auto_reverse=auto_reverse, ax1=ax1, ax2=ax2, *args, **kwargs)
+            locus_axes = dict(zip(['ax1', 'ax2', 'ax3'], axes[i * n_rows: (i + 1) * n_rows]))
+            locus.plot_gc(auto_reverse=auto_reverse, gc_skew=gc_skew, *args, **locus_axes, **kwargs)
 
         return plt
 
+    def figures(
+            self,
+            gc=False,
+            fig_single_height=None,
+            fig_width=10,
+            auto_reverse=True,
+            gc_skew=False,
+            *args, **kwargs
+    ):
+        """
+        Yields one matplotlib Figure per locus, laid out like plot (or plot_gc if gc).
+        The figures are created without pyplot: they are released as soon as they are no longer referenced.
+        """
+        if fig_single_height is None:
+            fig_single_height = 3 if gc else 2
+
+        for locus in self.loci:
+            locus: Locus
+
+            fig = Figure(figsize=(fig_width, fig_single_height), constrained_layout=gc)
+            FigureCanvasAgg(fig)  # the layout of GraphicRecord.plot needs a renderer
+
+            if gc:
+                height_ratios = [4, 1, 1] if gc_skew else [4, 1]
+                axes = fig.subplots(nrows=len(height_ratios), ncols=1, gridspec_kw=dict(height_ratios=height_ratios))
+                locus_axes = dict(zip(['ax1', 'ax2', 'ax3'], axes))
+                locus.plot_gc(auto_reverse=auto_reverse, gc_skew=gc_skew, *args, **locus_axes, **kwargs)
+            else:
+                # like one row of plot: the default hspace of 0.2 leaves room for the ruler below the axes
+                fig.subplots_adjust(left=0.07, bottom=0.2 / 1.2, right=1 - 0.07, top=1)
+                locus.plot(auto_reverse=auto_reverse, ax=fig.add_subplot(1, 1, 1), *args, **kwargs)
+
+            yield fig
+
+    @profiled('export')
+    def export(self, output: str, gc=False, dpi=100, *args, **kwargs):
+        """
+        Render the loci one by one and stitch them into output (svg, png or pdf with one page per locus).
+        Unlike plot and plot_gc, the peak memory is bounded by one locus, regardless of the number of loci.
+
+        Other arguments: see figures
+        """
+        write_stitched(self.figures(gc=gc, *args, **kwargs), n_figures=len(self.loci), output=output, dpi=dpi)
+
+    @profiled('plot_bokeh')
     def plot_bokeh(self, figure_width=12, single_figure_height='auto', viewspan=None,
-                   auto_reverse=True):
+                   auto_reverse=True, sync='broadcast', detail_span: int = None, feature_server=None):
+        """
+        :param sync: 'broadcast': one callback updates all plots in a single pass,
+                     'pairs': every plot is synchronized with the first plot through its own callbacks
+        :param detail_span: level of detail, see Locus.plot_bokeh
+        :param feature_server: load the features on demand, see Locus.plot_bokeh
+        """
+        assert sync in ('broadcast', 'pairs'), F'sync must be "broadcast" or "pairs", not {sync}'
 
         plots = []
         for current_record in self.loci:
             current_record: Locus
             p_curr = current_record.plot_bokeh(figure_width=figure_width, figure_height=single_figure_height,
-                                               viewspan=viewspan, auto_reverse=auto_reverse)
+                                               viewspan=viewspan, auto_reverse=auto_reverse,
+                                               detail_span=detail_span, feature_server=feature_server)
             # tags: [gene_location, is_backward]
             p_curr.tags = [current_record.gene_location, current_record.is_backward]
 
             plots.append(p_curr)
 
+            if sync == 'broadcast':
+                continue
+
             # Connect plot to first plot
             if len(plots) == 1:
                 # assign variable first_plot, do nothing else
@@ -158,4 +275,207 @@ class Loci:
                         other_center=p_first.tags[0]
                     ), code=JAVASCRIPT_SYNC_SCROLL))
 
+        # one tap callback for all plots instead of a copy per plot
+        tap_callback = CustomJS(code=JAVASCRIPT_TAP_CALLBACK)
+        for p in plots:
+            p.select_one(TapTool).callback = tap_callback
+
+        if sync == 'broadcast' and len(plots) > 1:
+            callback = CustomJS(args=dict(
+                ranges=[p.x_range for p in plots],
+                centers=[int(p.tags[0]) for p in plots],
+                reversed=[bool(auto_reverse and p.tags[1]) for p in plots]
+            ), code=JAVASCRIPT_SYNC_SCROLL_BROADCAST)
+            for p in plots:
+                for attr in ['start', 'end']:
+                    p.x_range.js_on_change(attr, callback)
+
         return plots
+
+    @profiled('plot_bokeh_panel')
+    def plot_bokeh_panel(self, figure_width=12, viewspan=None, auto_reverse=True, typed_arrays=False):
+        """
+        All loci in one Bokeh figure: one row per locus, all features in one set of ColumnDataSources.
+
+        The x-axis is the position relative to the gene of interest (mirrored for reversed loci), so all rows share
+        one x_range and panning needs no callbacks. Much smaller HTML than plot_bokeh for many loci.
+
+        :param typed_arrays: send numbers as typed arrays (binary, float32): the patch outlines are computed in the
+                             browser from four numbers per feature and colors are sent as indices into a palette.
+                             Locus tag, label and hover text of a feature are sent once, also if several rows show
+                             it (ColumnDataSource feature_texts, rows refer to it by index)
+        """
+        columns = dict(patches={}, labels={}, segments={})
+        y_top, height_px, ticks, tick_labels = 0., 0, [], {}
+        crop_bounds = []  # crop windows in x-axis coordinates
+        for locus in self.loci:
+            locus: Locus
+            data, row_height, row_height_px = locus.bokeh_glyph_data(
+                figure_width=figure_width, auto_reverse=auto_reverse, y_top=y_top
+            )
+            for glyph, glyph_columns in data.items():
+                for name, values in glyph_columns.items():
+                    columns[glyph].setdefault(name, []).extend(values)
+            # label the row at feature level 0
+            ticks.append(y_top - row_height + 1)
+            tick_labels[ticks[-1]] = locus.title if locus.title is not None else locus.locus_tag
+            y_top -= row_height
+            height_px += row_height_px
+            sign = -1 if auto_reverse and locus.is_backward else 1
+            crop_bounds.extend(sign * (x - locus.gene_location) for x in locus.crop_window)
+
+        if viewspan:
+            x_range = Range1d(-viewspan, viewspan)
+        elif columns['patches'].get('xs'):
+            x_range = Range1d(min(min(xs) for xs in columns['patches']['xs']),
+                              max(max(xs) for xs in columns['patches']['xs']))
+        else:
+            # no drawable features: show the crop windows
+            x_range = Range1d(min(crop_bounds), max(crop_bounds))
+
+        has_labels = len(columns['labels'].get('text', [])) > 0
+        tap_callback = CustomJS(code=JAVASCRIPT_TAP_CALLBACK)
+        if typed_arrays:
+            # the texts of a feature are sent once, also if several rows show it: rows refer to them by index
+            patches, labels = columns['patches'], columns['labels']
+            texts: {(str, str, str): int} = {}
+            feature = [
+                texts.setdefault(feature_texts, len(texts))
+                for feature_texts in zip(patches['locus_tag'], patches['label'], patches['hover_html'])
+            ]
+            label_ids: {str: int} = {}
+            for i, (locus_tag, label, hover_html) in enumerate(texts):
+                label_ids.setdefault(label, i)
+            feature_texts = ColumnDataSource(dict(zip(['locus_tag', 'label', 'hover_html'],
+                                                      [list(column) for column in zip(*texts)] or [[], [], []])))
+            tap_callback.args = dict(feature_texts=feature_texts)
+
+        plot = figure(
+            width=int(100 * figure_width),
+            height=max(height_px, 185),
+            tools=[TapTool(callback=tap_callback), 'xpan,xwheel_zoom,reset'],
+            x_range=x_range,
+            y_range=Range1d(y_top, 0),
+        )
+        if typed_arrays:
+            palette = sorted(set(patches['color']))
+            source = ColumnDataSource(dict(
+                x1=np.array([xs[0] for xs in patches['xs']], dtype=np.float32),
+                head=np.array([xs[2] for xs in patches['xs']], dtype=np.float32),
+                x2=np.array([xs[3] for xs in patches['xs']], dtype=np.float32),
+                y=np.array([ys[3] for ys in patches['ys']], dtype=np.float32),
+                color=np.array([palette.index(color) for color in patches['color']], dtype=np.int32),
+                feature=np.array(feature, dtype=np.int32),
+            ))
+            half_width = patches['ys'][0][3] - patches['ys'][0][0] if patches['ys'] else 0.2
+            plot.patches(
+                xs=expr(CustomJSExpr(code=JAVASCRIPT_PATCH_XS)),
+                ys=expr(CustomJSExpr(args=dict(half_width=half_width), code=JAVASCRIPT_PATCH_YS)),
+                color=linear_cmap('color', palette, low=-0.5, high=len(palette) - 0.5), line_color='#000000',
+                source=source
+            )
+            labels['feature'] = np.array([label_ids[text] for text in labels.pop('text', [])], dtype=np.int32)
+            for glyph in ['labels', 'segments']:
+                for name, values in columns[glyph].items():
+                    if name != 'feature':
+                        columns[glyph][name] = np.array(values, dtype=np.float32)
+            text = expr(CustomJSExpr(args=dict(feature_texts=feature_texts, column='label'),
+                                     code=JAVASCRIPT_FEATURE_TEXT))
+        else:
+            plot.patches(xs='xs', ys='ys', color='color', line_color='#000000',
+                         source=ColumnDataSource(columns['patches']))
+            text = 'text'
+        if has_labels:
+            plot.text(x='x', y='y', text=text, text_align='center', text_font_size='12px', text_font=value('arial'),
+                      text_font_style='normal', source=ColumnDataSource(columns['labels']))
+            plot.segment(x0='x0', x1='x1', y0='y0', y1='y1', line_width=0.5, color='#000000',
+                         source=ColumnDataSource(columns['segments']))
+
+        plot.yaxis.ticker = FixedTicker(ticks=ticks)
+        plot.yaxis.major_label_overrides = tick_labels
+        plot.outline_line_color = None
+        plot.grid.grid_line_color = None
+        plot.toolbar.logo = None
+        plot.sizing_mode = 'scale_width'
+
+        return plot
+
+    def bokeh_json_item(self, target: str = None, panel=True, typed_arrays=False, *args, **kwargs) -> dict:
+        """
+        One json_item for all loci, to embed with Bokeh.embed_item(item, target) in a page that loads the Bokeh
+        resources once (see bokeh_resources).
+
+        :param panel: True: plot_bokeh_panel (one figure), False: plot_bokeh (one figure per locus)
+        :param typed_arrays: see plot_bokeh_panel
+        """
+        return json_item(self._bokeh_root(panel, typed_arrays, *args, **kwargs), target=target)
+
+    def bokeh_components(self, panel=True, typed_arrays=False, *args, **kwargs) -> (str, str):
+        """:returns: script and div for all loci (bokeh.embed.components), see bokeh_json_item"""
+        return components(self._bokeh_root(panel, typed_arrays, *args, **kwargs))
+
+    @staticmethod
+    def bokeh_resources() -> str:
+        """:returns: html that loads BokehJS: include once per page, for any number of json_items or components"""
+        return CDN.render()
+
+    def _bokeh_root(self, panel, typed_arrays, *args, **kwargs):
+        if panel:
+            return self.plot_bokeh_panel(typed_arrays=typed_arrays, *args, **kwargs)
+        assert not typed_arrays, 'typed_arrays requires panel=True'
+        root = column(self.plot_bokeh(*args, **kwargs))
+        root.sizing_mode = 'scale_width'
+        return root
+
+
+def _build_loci(
+        loci_of_interest: [dict],
+        span,
+        description_order,
+        add_start_end_feature
+) -> [Locus]:
+    """Build (uncolored) loci. Each GenBank file is parsed only once."""
+    for l in loci_of_interest:
+        if l['gene'] not in load_index(l['gbk']):
+            raise LocusError(l, F'Gene {l["gene"]} was not found in {l["gbk"]}')
+
+    with stage('resolve_loci'):
+        resolved = resolve_loci([(l['gbk'], l['gene']) for l in loci_of_interest], span=span)
+
+    loci: [Locus] = []
+    for l, (scaffold, gene_location) in zip(loci_of_interest, resolved):
+        try:
+            locus = Locus(
+                gbk_file=l['gbk'],
+                locus_tag=l['gene'],
+                title=l['title'],
+                span=span,
+                description_order=description_order,
+                add_start_end_feature=add_start_end_feature,
+                scaffold=scaffold,
+                gene_location=gene_location
+            )
+        except Exception as e:
+            raise LocusError(l, F'{type(e).__name__}: {e}') from e
+        loci.append(locus)
+
+    return loci
+
+
+def _build_loci_with_executor(executor: Executor, loci_of_interest: [dict], **locus_kwargs) -> [Locus]:
+    # one task per GenBank file: each file is parsed only once, by one worker
+    indices_per_file: {str: [int]} = {}
+    for i, l in enumerate(loci_of_interest):
+        indices_per_file.setdefault(l['gbk'], []).append(i)
+
+    futures = [
+        (executor.submit(_build_loci, [loci_of_interest[i] for i in indices], **locus_kwargs), indices)
+        for indices in indices_per_file.values()
+    ]
+
+    loci: [Locus] = [None] * len(loci_of_interest)
+    for future, indices in futures:
+        for i, locus in zip(indices, future.result()):
+            loci[i] = locus
+
+    return loci
@@ -1,12 +1,28 @@
+import os
+import copy
+import asyncio
 from io import BytesIO
+from concurrent.futures import Executor, ThreadPoolExecutor
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from Bio.Seq import Seq
 from Bio.SeqFeature import SeqFeature
+from Bio.SeqRecord import SeqRecord
 from dna_features_viewer import GraphicFeature, GraphicRecord
-from bokeh.models import Range1d, TapTool, CustomJS
-from bokeh.plotting._tools import process_tools_arg
-
-from .utils import get_locus_tag, get_scaffold_and_geneposition, JAVASCRIPT_TAP_CALLBACK
+from dna_features_viewer.compute_features_levels import compute_features_levels
+from bokeh.core.properties import value
+from bokeh.models import Range1d, TapTool, CustomJS, ColumnDataSource, AjaxDataSource
+from bokeh.plotting import figure
+from bokeh.embed import json_item
+
+from .utils import get_locus_tag, get_feature_index, FeatureTable, gc_counts, gc_content_from_counts, \
+    gc_skew_from_counts, strand_coverage, JAVASCRIPT_TAP_CALLBACK, JAVASCRIPT_LEVEL_OF_DETAIL, \
+    JAVASCRIPT_FETCH_CHUNKS, JAVASCRIPT_CHUNK_ADAPTER
+from .GenbankIndex import load_index
+from .FeatureStore import FeatureStore
+from .Profiler import stage, profiled
 from .CustomBiopythonTranslator import CustomBiopythonTranslator
 
 
@@ -22,58 +38,256 @@ class Locus:
     ]
 
     def __init__(self, gbk_file, locus_tag, title=None, span=3000, add_start_end_feature=True,
-                 description_order: [str] = default_description_order):
+                 description_order: [str] = default_description_order, scaffold: SeqRecord = None,
+                 gene_location: int = None, lazy=False, max_span: int = None):
+        """
+        :param lazy: only record the request. The gene is looked up on first access of gene_location, scaffold, ...
+                     and the GraphicRecord is built when a plotting or colorizing method needs it.
+                     locus_tags() and is_backward do not need the GraphicRecord.
+        :param max_span: translate the features within gene_location ± max_span into feature_table, so that
+                         with_span and recenter can crop from memory
+        """
         self.title = title
         self.gbk_file = gbk_file
         self.locus_tag = locus_tag
         self.span = span
-
-        self.scaffold, self.gene_location = get_scaffold_and_geneposition(gbk_file, locus_tag)
+        self.max_span = span if max_span is None else max(span, max_span)
+        self.add_start_end_feature = add_start_end_feature
+        self._pending = dict(description_order=description_order)
+
+        if scaffold is not None and gene_location is not None:
+            # scaffold and gene_location may be passed if already resolved, e.g. by resolve_loci
+            self._resolve(scaffold, gene_location)
+
+        if not lazy:
+            self._build()
+
+    def __getattr__(self, name):
+        # lazy Locus: called only for attributes that are not set yet
+        if '_pending' in self.__dict__:
+            if name in ('scaffold', 'gene_location', 'scaffold_id', 'scaffold_start', 'scaffold_end', 'crop_window'):
+                self._resolve()
+                return self.__dict__[name]
+            if name in ('graphic_record', 'feature_table'):
+                self._build()
+                return self.__dict__[name]
+        raise AttributeError(F"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def _resolve(self, scaffold: SeqRecord = None, gene_location: int = None):
+        if scaffold is None or gene_location is None:
+            with stage('get_scaffold_and_geneposition', self.locus_tag):
+                scaffold, gene_location = load_index(self.gbk_file).get_scaffold_and_geneposition(
+                    self.locus_tag, span=self.max_span
+                )
+        self.scaffold, self.gene_location = scaffold, gene_location
 
         self.scaffold_id = self.scaffold.id
 
-        unique_features: {(int, int, str)} = set()
+        self.scaffold_start = 0
+        self.scaffold_end = len(self.scaffold)
 
-        def add_unique(f: SeqFeature) -> bool:
-            if 'locus_tag' not in f.qualifiers:
-                return False
-            feature = (f.location.nofuzzy_start, f.location.nofuzzy_end, f.qualifiers['locus_tag'][0])
-            if feature in unique_features:
-                return False
-            else:
-                unique_features.add(feature)
-                return True
+        self.crop_window = self._crop_coordinates()
 
-        self.graphic_record: GraphicRecord = CustomBiopythonTranslator(
-            label_fields=description_order,
-            features_filters=[add_unique, lambda f: f.type != 'source'],
-            features_properties=lambda f: dict(qualifiers=f.qualifiers)
-        ).translate_record(self.scaffold)
+    def _window_features(self, window: (int, int)) -> [SeqFeature]:
+        return _window_features(self.scaffold, window)
+
+    def _table_window(self) -> (int, int):
+        return max(self.scaffold_start, self.gene_location - self.max_span), \
+               min(self.scaffold_end, self.gene_location + self.max_span)
+
+    def _build(self):
+        with stage('translate_record', self.locus_tag):
+            # only translate the features that overlap with the window of the feature table
+            self.feature_table = FeatureTable(_translate(
+                self.scaffold, self._window_features(self._table_window()), self._pending['description_order']
+            ))
+
+        del self._pending
+        self._crop()
+
+    def _crop(self):
+        """derive graphic_record from feature_table"""
+        with stage('crop', self.locus_tag):
+            self.graphic_record: GraphicRecord = GraphicRecord(
+                sequence=str(self.scaffold.seq[self.crop_window[0]:self.crop_window[1]]),
+                sequence_length=self.crop_window[1] - self.crop_window[0],
+                features=self.feature_table.crop(self.crop_window),
+                first_index=self.crop_window[0],
+            )
 
-        self.scaffold_start = 0
-        self.scaffold_end = self.graphic_record.sequence_length
+        if self.add_start_end_feature:
+            with stage('_add_start_and_end_feature', self.locus_tag):
+                self._add_start_and_end_feature()
 
-        self.crop_window = self._crop_coordinates()
+        self.clear_layout_cache()
+
+    @profiled('with_span')
+    def with_span(self, span: int) -> 'Locus':
+        """:returns: copy with another span, cropped from feature_table (span <= max_span): no file access"""
+        return self._recrop(self.locus_tag, self.gene_location, span)
 
-        self.graphic_record = self.graphic_record.crop(self.crop_window)
+    @profiled('recenter')
+    def recenter(self, locus_tag: str, span: int = None) -> 'Locus':
+        """:returns: copy centered on another gene in feature_table, cropped from memory: no file access"""
+        return self._recrop(locus_tag, self.feature_table.gene_location(locus_tag), self.span if span is None else span)
 
-        if add_start_end_feature:
-            self._add_start_and_end_feature()
+    def _recrop(self, locus_tag: str, gene_location: int, span: int) -> 'Locus':
+        feature_table = self.feature_table  # builds a lazy Locus: the copy must not inherit _pending
+        # shallow copy that shares scaffold and the feature columns (copy.copy would go through the compact state)
+        locus = Locus.__new__(Locus)
+        locus.__dict__.update(self.__dict__)
+        locus.locus_tag, locus.gene_location, locus.span = locus_tag, gene_location, span
+        # own colors and labels: colorize and rename_labels of the copy do not change self
+        locus.feature_table = feature_table.copy()
+        locus.crop_window = locus._crop_coordinates()
+
+        table_start, table_end = self._table_window()
+        if locus.crop_window[0] < table_start or locus.crop_window[1] > table_end:
+            raise ValueError(F'{locus_tag} ± {span} is outside of the feature table of {self.locus_tag} '
+                             F'(max_span={self.max_span})')
+
+        locus._crop()
+        return locus
 
     def __str__(self) -> str:
         return f'Locus: {self.title} ({self.locus_tag})'
 
+    @classmethod
+    async def abuild(cls, gbk_file, locus_tag, title=None, span=3000, add_start_end_feature=True,
+                     description_order: [str] = default_description_order, executor: Executor = None) -> 'Locus':
+        """
+        Build a Locus in executor (default: a shared thread pool) without blocking the event loop.
+
+        Identical requests (gbk_file, locus_tag, span, ...) that are in flight at the same time are built only once.
+        In that case, every caller gets its own copy, equivalent to the built Locus (see with_span).
+        """
+        loop = asyncio.get_running_loop()
+        key = (id(loop), gbk_file, locus_tag, span, add_start_end_feature, tuple(description_order))
+
+        in_flight = _in_flight.get(key)
+        if in_flight is None:
+            future = loop.run_in_executor(
+                executor or _default_executor(), _build_locus,
+                gbk_file, locus_tag, span, add_start_end_feature, description_order
+            )
+            in_flight = _in_flight[key] = [future, 0]
+            future.add_done_callback(lambda _: _in_flight.pop(key, None))
+        in_flight[1] += 1
+
+        # shield: a cancelled caller does not cancel the build for the others
+        locus = await asyncio.shield(in_flight[0])
+        if in_flight[1] > 1:
+            # full state (scaffold, max_span, feature_table), own features and graphic_record
+            locus = locus._recrop(locus.locus_tag, locus.gene_location, locus.span)
+        locus.title = title
+        return locus
+
+    async def arender(self, format='svg', executor: Executor = None, *args, **kwargs):
+        """
+        Render in executor (default: a shared thread pool) without blocking the event loop.
+
+        :param format: 'svg' (str) or 'png' (bytes): see Renderer, 'json': Bokeh json_item (dict) of plot_bokeh
+        """
+        assert format in ('svg', 'png', 'json'), F'format must be "svg", "png" or "json", not {format}'
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor or _default_executor(), _render_locus, self, format, args, kwargs)
+
+    def to_dict(self) -> dict:
+        """
+        Compact representation: only the cropped sequence and features are kept, not the whole scaffold.
+
+        Contains only dicts, lists, strings, numbers, booleans and None, i.e. it can be serialized with pickle,
+        msgpack or json. Locus.from_dict restores a plottable Locus.
+        """
+        return dict(
+            title=self.title,
+            gbk_file=self.gbk_file.db_file if isinstance(self.gbk_file, FeatureStore) else self.gbk_file,
+            locus_tag=self.locus_tag,
+            span=self.span,
+            gene_location=int(self.gene_location),
+            scaffold_id=self.scaffold_id,
+            scaffold_start=self.scaffold_start,
+            scaffold_end=self.scaffold_end,
+            crop_window=[int(self.crop_window[0]), int(self.crop_window[1])],
+            strand=-1 if self.is_backward else 1,
+            sequence=self.graphic_record.sequence,
+            feature_level_height=self.graphic_record.feature_level_height,
+            features=[_feature_to_dict(f) for f in self.graphic_record.features],
+            add_start_end_feature=self.add_start_end_feature,
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Locus':
+        locus = cls.__new__(cls)
+        locus.__setstate__(data)
+        return locus
+
+    def __getstate__(self) -> dict:
+        return self.to_dict()
+
+    def __setstate__(self, data: dict):
+        self.title = data['title']
+        self.gbk_file = data['gbk_file']
+        self.locus_tag = data['locus_tag']
+        self.span = data['span']
+        self.gene_location = data['gene_location']
+        self.scaffold_id = data['scaffold_id']
+        self.scaffold_start = data['scaffold_start']
+        self.scaffold_end = data['scaffold_end']
+        self.crop_window = tuple(data['crop_window'])
+        self.max_span = self.span
+        self.add_start_end_feature = data.get('add_start_end_feature', True)
+
+        # partially defined sequence: only the crop window is known, but coordinates stay the same
+        self.scaffold = SeqRecord(
+            Seq({self.crop_window[0]: data['sequence']}, length=self.scaffold_end),
+            id=self.scaffold_id
+        )
+
+        self.graphic_record = GraphicRecord(
+            sequence=data['sequence'],
+            sequence_length=self.crop_window[1] - self.crop_window[0],
+            features=[_feature_from_dict(f) for f in data['features']],
+            feature_level_height=data['feature_level_height'],
+            first_index=self.crop_window[0],
+        )
+        # own features: colorize and rename_labels change the features of graphic_record
+        self.feature_table = FeatureTable([
+            copy.copy(f) for f in self.graphic_record.features
+            if get_locus_tag(f) not in ('Start of contig', 'End of contig')
+        ])
+        self.clear_layout_cache()
+
     @property
     def is_backward(self) -> bool:
-        for feature in self.graphic_record.features:
-            if get_locus_tag(feature) == self.locus_tag:
-                assert feature.strand in [1, -1]
-                return feature.strand == -1
-        raise KeyError("Error: Could not find locus_tag in graphic features")
+        if 'graphic_record' not in self.__dict__:
+            # lazy Locus: same result without building the GraphicRecord
+            for f in self._window_features(self.crop_window):
+                if f.qualifiers['locus_tag'][0] == self.locus_tag and _overlaps(_drawn_location(f), self.crop_window):
+                    strand = _drawn_location(f).strand
+                    assert strand in [1, -1]
+                    return strand == -1
+            raise KeyError("Error: Could not find locus_tag in graphic features")
+
+        try:
+            strand = self.feature_table.strand_of(self.locus_tag)
+        except KeyError:
+            raise KeyError("Error: Could not find locus_tag in graphic features")
+        assert strand in [1, -1]
+        return strand == -1
 
     def locus_tags(self) -> [str]:
+        if 'graphic_record' not in self.__dict__:
+            # lazy Locus: same result without building the GraphicRecord
+            add_start, add_end = self._contig_edges() if self.add_start_end_feature else (False, False)
+            return ['Start of contig'] * add_start + [
+                f.qualifiers['locus_tag'][0] for f in self._window_features(self.crop_window)
+                if _overlaps(_drawn_location(f), self.crop_window)
+            ] + ['End of contig'] * add_end
+
         return [get_locus_tag(f) for f in self.graphic_record.features]
 
+    @profiled('rename_labels')
     def rename_labels(self, locus_to_new_name_dict, strict=False, remove_unspecified=False) -> GraphicRecord:
         for f in self.graphic_record.features:
             locus_tag = get_locus_tag(f)
@@ -84,8 +298,12 @@ class Locus:
                     raise KeyError(F'Label {f.label} not found in locus_to_color_dict!')
                 if remove_unspecified:
                     f.label = None
+
+        # with_span and recenter keep the labels
+        self.feature_table.set_labels(locus_to_new_name_dict, remove_unspecified=remove_unspecified)
         return self.graphic_record
 
+    @profiled('colorize')
     def colorize(self, locus_to_color_dict, strict=False,
                  default_color='#ffffff'):
         for f in self.graphic_record.features:
@@ -97,8 +315,18 @@ class Locus:
                     raise KeyError(F'Locus tag {locus_tag} not found in locus_to_color_dict!')
                 f.color = default_color
 
+        # with_span and recenter keep the colors
+        self.feature_table.set_colors(locus_to_color_dict, default_color)
+
+    @profiled('plot')
     def plot(self, auto_reverse=True, add_title=True, title_kwargs=dict(x=0.5, y=0.7, horizontalalignment='center', fontsize=20), *args, **kwargs):
-        ax, _ = self.graphic_record.plot(*args, **kwargs)
+        with stage('GraphicRecord.plot', self.locus_tag):
+            ax, (features_levels, labels_data) = self.graphic_record.plot(*args, **kwargs)
+
+        if not args and kwargs.get('ax') is None:
+            # layout of a new figure: plot_bokeh and bokeh_glyph_data can reuse it
+            self._layout_cache()[_layout_settings(kwargs)] = \
+                features_levels, labels_data, tuple(ax.figure.get_size_inches())
 
         # set plot span
         if auto_reverse and self.is_backward:
@@ -109,41 +337,111 @@ class Locus:
         # add title
         if add_title and self.title is not None:
             # ax.set_title(graphic_record.title)
-            plt.text(s=self.title, transform=ax.transAxes, **title_kwargs)
-
-        return ax, _
-
+            ax.text(s=self.title, transform=ax.transAxes, **title_kwargs)
+
+        return ax, (features_levels, labels_data)
+
+    def layout(self, figure_width=8, **kwargs) -> ({GraphicFeature: float}, {GraphicFeature: dict}, (float, float)):
+        """
+        Layout of GraphicRecord.plot(figure_width=figure_width, **kwargs) on a new figure, memoized.
+        The figure is created without pyplot (not thread-safe): arender lays out in the shared executor.
+
+        The layout is computed at most once per labels, feature coordinates and plot settings: plot (without ax)
+        stores it, plot_bokeh and bokeh_glyph_data reuse it. colorize keeps it, rename_labels invalidates it.
+
+        :returns: features_levels, labels_data (see GraphicRecord.plot), figure size in inches
+        """
+        cache = self._layout_cache()
+        key = _layout_settings(dict(figure_width=figure_width, **kwargs))
+        if key not in cache:
+            # same figure height as GraphicRecord.plot without ax: one inch per level, then 0.4 inch per y-unit
+            figure_height = kwargs.get('figure_height')
+            fig = Figure(figsize=(figure_width, figure_height or max([1, *self.features_levels().values()])))
+            FigureCanvasAgg(fig)
+            with stage('GraphicRecord.plot', self.locus_tag):
+                ax, (features_levels, labels_data) = self.graphic_record.plot(
+                    ax=fig.add_subplot(1, 1, 1), figure_width=figure_width, **kwargs
+                )
+            cache[key] = features_levels, labels_data, (figure_width, figure_height or 1 + 0.4 * ax.get_ylim()[1])
+        return cache[key]
+
+    def features_levels(self) -> {GraphicFeature: float}:
+        """:returns: memoized compute_features_levels of the features"""
+        cache = self._layout_cache()
+        if 'features_levels' not in cache:
+            cache['features_levels'] = compute_features_levels(self.graphic_record.features)
+        return cache['features_levels']
+
+    def clear_layout_cache(self):
+        """forget the memoized layouts (see layout), e.g. to measure rendering from scratch"""
+        self._layouts = (None, {})
+
+    def _layout_cache(self) -> dict:
+        """:returns: the cached layouts of the current features and labels (the cache is reset if they changed)"""
+        features = tuple((f.start, f.end, f.strand, f.label) for f in self.graphic_record.features)
+        if self._layouts[0] != features:
+            self._layouts = (features, {})
+        return self._layouts[1]
+
+    @profiled('plot_to_string')
     def plot_to_string(self, tight_layout=True, *args, **kwargs):
         ax, _ = self.plot(*args, **kwargs)
         if tight_layout: ax.figure.tight_layout()
         f = BytesIO()
-        plt.savefig(f, format="svg")
+        with stage('savefig', self.locus_tag):
+            ax.figure.savefig(f, format="svg")
+        plt.close(ax.figure)
         return f.getvalue().decode('utf-8')
 
-    def plot_gc(self, ax1=None, ax2=None, window_bp=100, *args, **kwargs):
-        if ax1 is None or ax2 is None:
-            fig, (ax1, ax2) = plt.subplots(
-                2, 1, figsize=(12, 3), sharex=True, gridspec_kw={"height_ratios": [4, 1]}
-            )
+    @profiled('plot_gc')
+    def plot_gc(self, ax1=None, ax2=None, window_bp=100, step=1, gc_skew=False, ax3=None, *args, **kwargs):
+        """:returns: ax1, ax2 or ax1, ax2, ax3 if gc_skew"""
+        if ax1 is None or ax2 is None or (gc_skew and ax3 is None):
+            if gc_skew:
+                fig, (ax1, ax2, ax3) = plt.subplots(
+                    3, 1, figsize=(12, 4), sharex=True, gridspec_kw={"height_ratios": [4, 1, 1]}
+                )
+            else:
+                fig, (ax1, ax2) = plt.subplots(
+                    2, 1, figsize=(12, 3), sharex=True, gridspec_kw={"height_ratios": [4, 1]}
+                )
 
         # PLOT THE RECORD MAP
         self.plot(ax=ax1, with_ruler=False, strand_in_label_threshold=4, *args, **kwargs)
 
-        # PLOT THE LOCAL GC CONTENT (we use 50bp windows)
-        calc_gc = lambda s: 100.0 * len([c for c in s if c in "GC"]) / window_bp
-        xx = np.arange(self.crop_window[0] - window_bp, self.crop_window[1] + window_bp)
-        yy = [calc_gc(self.scaffold.seq[x: x + window_bp]) for x in xx]
-        ax2.fill_between(xx + window_bp / 2, yy, alpha=0.3)
+        # PLOT THE LOCAL GC CONTENT
+        with stage('calc_gc_content', self.locus_tag):
+            xx, yy = self.gc_content(window_bp=window_bp, step=step)
+        ax2.fill_between(xx + window_bp / 2, 100.0 * yy, alpha=0.3)
         ax2.set_ylim(bottom=0, top=100)
         ax2.set_ylabel("GC(%)")
 
         # ensure ax2 has same xlim as ax1
         ax2.set_xlim(ax1.get_xlim())
 
-        return ax1, ax2
+        if not gc_skew:
+            return ax1, ax2
+
+        # PLOT THE LOCAL GC SKEW
+        with stage('calc_gc_skew', self.locus_tag):
+            xx, yy = self.gc_skew(window_bp=window_bp, step=step)
+        ax3.fill_between(xx + window_bp / 2, yy, alpha=0.3)
+        ax3.set_ylim(bottom=-1, top=1)
+        ax3.set_ylabel("GC skew")
+        ax3.set_xlim(ax1.get_xlim())
+
+        return ax1, ax2, ax3
 
+    @profiled('plot_bokeh')
     def plot_bokeh(self, figure_width=12, figure_height='auto', viewspan=None, auto_reverse=True,
-                   x_range=None):
+                   x_range=None, detail_span: int = None, feature_server: 'FeatureServer' = None):
+        """
+        :param detail_span: level of detail for wide spans: if more than detail_span bp are visible, features and
+                            labels are hidden and bars show the fraction of each bin covered by + and - features.
+                            The bars are precomputed for several bin sizes, the browser picks one by zoom level.
+        :param feature_server: a running FeatureServer: the figure contains no features, the browser loads the
+                               features of the visible range from the server, the whole scaffold can be browsed
+        """
         if not viewspan:
             viewspan = self.crop_window
         else:
@@ -152,26 +450,235 @@ class Locus:
             else:
                 viewspan = (self.gene_location - viewspan, self.gene_location + viewspan)
 
-        bokeh = self.graphic_record.plot_with_bokeh(figure_width=figure_width, figure_height=figure_height)
+        with stage('plot_with_bokeh', self.locus_tag):
+            bokeh = self._plot_with_bokeh(figure_width=figure_width, figure_height=figure_height,
+                                          on_demand=feature_server is not None)
 
         # autoscale plot
         bokeh.sizing_mode = 'scale_width'
 
-        # overwrite plot tools. reason: remove hover tool
-        tap = TapTool()
+        if x_range:
+            bokeh.x_range = x_range
+        else:
+            bokeh.x_range = Range1d(*viewspan)
+
+        if feature_server is not None:
+            self._load_on_demand(bokeh, feature_server, figure_width)
+
+        if detail_span is not None:
+            self._add_level_of_detail(bokeh, detail_span)
+
+        return bokeh
+
+    @profiled('plot_bokeh_gc')
+    def plot_bokeh_gc(self, x_range=None, figure_width=12, height=100, window_bp=100, step=1, gc_skew=False):
+        """
+        GC content (or GC skew) track to show below plot_bokeh, e.g. column(bokeh, locus.plot_bokeh_gc(bokeh.x_range))
+
+        :param x_range: x_range of the plot_bokeh figure, to pan and zoom both
+        """
+        with stage('calc_gc_skew' if gc_skew else 'calc_gc_content', self.locus_tag):
+            xx, yy = self.gc_skew(window_bp, step) if gc_skew else self.gc_content(window_bp, step)
+
+        bokeh = figure(
+            width=int(100 * figure_width),
+            height=height,
+            tools='xpan,xwheel_zoom,reset',
+            x_range=x_range if x_range else Range1d(*self.crop_window),
+            y_range=Range1d(-1, 1) if gc_skew else Range1d(0, 100),
+        )
+        bokeh.varea(x=xx + window_bp / 2, y1=0, y2=yy if gc_skew else 100.0 * yy, fill_alpha=0.3)
+        bokeh.yaxis.axis_label = 'GC skew' if gc_skew else 'GC(%)'
+        bokeh.sizing_mode = 'scale_width'
+        bokeh.outline_line_color = None
+        bokeh.grid.grid_line_color = None
+        bokeh.toolbar.logo = None
+        return bokeh
 
+    def _add_level_of_detail(self, bokeh: figure, detail_span: int, bins_per_view=200):
+        # finest bins: bins_per_view bins at detail_span, then twice as wide until the crop window fits in max_bins
+        max_bins = 2 * bins_per_view
+        bin_sizes = [max(1, detail_span // bins_per_view)]
+        while (self.crop_window[1] - self.crop_window[0]) / bin_sizes[-1] > max_bins:
+            bin_sizes.append(bin_sizes[-1] * 2)
+
+        with stage('strand_coverage', self.locus_tag):
+            coverage = strand_coverage(self.graphic_record.features, self.crop_window, bin_sizes)
+
+        detail = list(bokeh.renderers)
+        summaries = []
+        for bin_size in bin_sizes:
+            starts, plus, minus = coverage[bin_size]
+            left = np.concatenate([starts[plus > 0], starts[minus > 0]])
+            summaries.append(bokeh.quad(
+                left='left', right='right', top='top', bottom='bottom', color='color', line_color=None,
+                source=ColumnDataSource(dict(
+                    left=left,
+                    right=left + bin_size,
+                    top=np.concatenate([0.5 * plus[plus > 0], np.zeros((minus > 0).sum())]),
+                    bottom=np.concatenate([np.zeros((plus > 0).sum()), -0.5 * minus[minus > 0]]),
+                    color=['#4d4d4d'] * int((plus > 0).sum()) + ['#a6a6a6'] * int((minus > 0).sum()),
+                ))
+            ))
+
+        # initial state, same as JAVASCRIPT_LEVEL_OF_DETAIL
+        width = abs(bokeh.x_range.end - bokeh.x_range.start)
+        level = -1
+        if width > detail_span:
+            fitting = [i for i, bin_size in enumerate(bin_sizes) if width / bin_size <= max_bins]
+            level = fitting[0] if fitting else len(bin_sizes) - 1
+        for r in detail:
+            r.visible = level == -1
+        for i, r in enumerate(summaries):
+            r.visible = level == i
+
+        callback = CustomJS(args=dict(
+            x_range=bokeh.x_range, detail=detail, summaries=summaries, bin_sizes=bin_sizes, detail_span=detail_span,
+            max_bins=max_bins
+        ), code=JAVASCRIPT_LEVEL_OF_DETAIL)
+        for attr in ['start', 'end']:
+            bokeh.x_range.js_on_change(attr, callback)
+
+    def _load_on_demand(self, bokeh: figure, feature_server, figure_width):
+        patches, labels, segments = bokeh.renderers
+        url = feature_server.source_url(self.gbk_file, self.locus_tag)
+        n_chunks = -(-self.scaffold_end // feature_server.chunk_size)
+        # same scale as the crop window: figure_width inches per crop window
+        width = round(figure_width * feature_server.chunk_size / (self.crop_window[1] - self.crop_window[0]), 2)
+        first, last = feature_server.chunk_range(bokeh.x_range.start, bokeh.x_range.end, self.scaffold_end)
+
+        patches.data_source = AjaxDataSource(
+            data=patches.data_source.data,
+            data_url=F'{url}?first={first}&last={last}&width={width}',
+            method='GET',
+            mode='replace',
+            adapter=CustomJS(args=dict(labels=labels.data_source, segments=segments.data_source,
+                                       y_range=bokeh.y_range), code=JAVASCRIPT_CHUNK_ADAPTER),
+        )
+
+        callback = CustomJS(args=dict(
+            x_range=bokeh.x_range, source=patches.data_source, url=url, chunk_size=feature_server.chunk_size,
+            max_chunks=feature_server.max_chunks, n_chunks=n_chunks, width=width
+        ), code=JAVASCRIPT_FETCH_CHUNKS)
+        for attr in ['start', 'end']:
+            bokeh.x_range.js_on_change(attr, callback)
+
+    def _plot_with_bokeh(self, figure_width, figure_height, on_demand=False) -> figure:
+        """
+        same as GraphicRecord.plot_with_bokeh, but from the memoized layout and without hover tool
+
+        :param on_demand: empty glyphs, always with labels and label links
+        """
+        features_levels, labels_data, size_inches = self.layout(figure_width=figure_width)
+        width, height = [int(100 * e) for e in size_inches]
+        height = int(0.5 * height) if figure_height == 'auto' else 100 * figure_height
+        height = max(height, 185)  # minimal height to see all icons
+
+        max_y = max([data['annotation_y'] for data in labels_data.values()] + list(features_levels.values()))
+
+        tap = TapTool()
         tap.callback = CustomJS(code=JAVASCRIPT_TAP_CALLBACK)
 
-        tool_objs, tool_map = process_tools_arg(bokeh, [tap, "xpan,xwheel_zoom,reset"])
-        bokeh.tools = tool_objs
+        bokeh = figure(
+            width=width,
+            height=height,
+            tools=[tap, 'xpan,xwheel_zoom,reset'],
+            x_range=Range1d(0, self.graphic_record.sequence_length),
+            y_range=Range1d(-1, max_y + 1),
+        )
 
-        if x_range:
-            bokeh.x_range = x_range
+        if on_demand:
+            columns = _glyph_columns(self.graphic_record, {}, {}, figure_width)
         else:
-            bokeh.x_range = Range1d(*viewspan)
+            columns = _glyph_columns(self.graphic_record, features_levels, labels_data, figure_width)
+        bokeh.patches(xs='xs', ys='ys', color='color', line_color='#000000',
+                      source=ColumnDataSource(columns['patches']))
+        if labels_data or on_demand:
+            bokeh.text(x='x', y='y', text='text', text_align='center', text_font_size='12px',
+                       text_font=value('arial'), text_font_style='normal', source=ColumnDataSource(columns['labels']))
+            bokeh.segment(x0='x0', x1='x1', y0='y0', y1='y1', line_width=0.5, color='#000000',
+                          source=ColumnDataSource(columns['segments']))
+
+        bokeh.yaxis.visible = False
+        bokeh.outline_line_color = None
+        bokeh.grid.grid_line_color = None
+        bokeh.toolbar.logo = None
 
         return bokeh
 
+    @profiled('bokeh_glyph_data')
+    def bokeh_glyph_data(self, figure_width=12, auto_reverse=True, y_top=0.) -> (dict, float, int):
+        """
+        Glyph data for a row of a shared Bokeh panel (Loci.plot_bokeh_panel).
+
+        x: position relative to gene_location, mirrored if auto_reverse and self.is_backward.
+        y: the row is placed below y_top.
+
+        :returns: dict(patches=..., labels=..., segments=...) (columns of ColumnDataSources), row height in y units,
+                  row height in pixels
+        """
+        features_levels, plot_data, size_inches = self.layout(figure_width=figure_width)
+        height_px = int(0.5 * 100 * size_inches[1])
+
+        max_y = max([data['annotation_y'] for data in plot_data.values()] + list(features_levels.values()),
+                    default=0)  # a locus without drawable features takes one row
+        y_shift = y_top - (max_y + 1)
+        sign = -1 if auto_reverse and self.is_backward else 1
+
+        columns = _glyph_columns(self.graphic_record, features_levels, plot_data, figure_width,
+                                 origin=self.gene_location, sign=sign, y_shift=y_shift)
+        return columns, max_y + 2, height_px
+
+    def gc_content(self, window_bp=100, step=1) -> (np.ndarray, np.ndarray):
+        """:returns: start of each window (scaffold coordinates), GC fraction of each window"""
+        start, counts = self._gc_counts(window_bp)
+        starts, gc = gc_content_from_counts(counts, window_bp=window_bp, step=step)
+        return start + starts, gc
+
+    def gc_skew(self, window_bp=100, step=1) -> (np.ndarray, np.ndarray):
+        """:returns: start of each window (scaffold coordinates), GC skew (G - C) / (G + C) of each window"""
+        start, counts = self._gc_counts(window_bp)
+        starts, skew = gc_skew_from_counts(counts, window_bp=window_bp, step=step)
+        return start + starts, skew
+
+    def _gc_counts(self, window_bp) -> (int, np.ndarray):
+        """
+        :returns: start, cumulative G and C counts of the crop window extended by window_bp on both sides (if known).
+                  Read from the GC track of the GenBank file if there is one and window_bp is at most
+                  GcTrackStore.max_window_bp, else counted in the sequence.
+        """
+        if self.scaffold.seq.defined:
+            start = max(self.scaffold_start, self.crop_window[0] - window_bp)
+            end = min(self.scaffold_end, self.crop_window[1] + window_bp)
+        else:
+            # partially defined sequence (Locus.from_dict or FeatureStore): only the crop window is known
+            start, end = self.crop_window
+
+        gc_track = self._gc_track()
+        if gc_track is None or window_bp > gc_track[0].max_window_bp:
+            return start, gc_counts(bytes(self.scaffold.seq[start:end]))
+        gc_tracks, key = gc_track
+        return start, gc_tracks.counts(key, start, end)
+
+    def _gc_track(self):
+        """:returns: GcTrackStore and key of the scaffold, None if the GenBank file has none. Looked up once."""
+        if '_gc_track_lookup' not in self.__dict__:
+            # copies (with_span, recenter) share the scaffold and therefore the lookup
+            self._gc_track_lookup = self._find_gc_track()
+        return self._gc_track_lookup
+
+    def _find_gc_track(self):
+        if not isinstance(self.gbk_file, (str, os.PathLike)) or not self.scaffold.seq.defined \
+                or not os.path.isfile(self.gbk_file):
+            return None
+        index = load_index(self.gbk_file)
+        if self.locus_tag not in index:
+            return None
+        gc_track = index.get_gc_track(self.locus_tag)
+        if gc_track is None or gc_track[0].sequence_length(gc_track[1]) != len(self.scaffold):
+            return None
+        return gc_track
+
     def _crop_coordinates(self):
         assert self.scaffold_start <= self.gene_location <= self.scaffold_end
 
@@ -180,13 +687,13 @@ class Locus:
 
         return (crop_start, crop_end)
 
+    def _contig_edges(self) -> (bool, bool):
+        """:returns: whether the crop window contains the start and the end of the contig"""
+        return self.gene_location - self.span <= self.scaffold_start, self.gene_location + self.span >= self.scaffold_end
+
     def _add_start_and_end_feature(self, feature_span=30, color='#000000'):
         assert 0 <= self.scaffold_start and 0 < feature_span < self.scaffold_end
-        add_start = add_end = False
-        if self.gene_location - self.span <= self.scaffold_start:
-            add_start = True
-        if self.gene_location + self.span >= self.scaffold_end:
-            add_end = True
+        add_start, add_end = self._contig_edges()
 
         if not add_start and not add_end:
             return
@@ -216,3 +723,146 @@ class Locus:
             feature_level_height=self.graphic_record.feature_level_height,
             first_index=self.graphic_record.first_index,
         )
+
+
+def _glyph_columns(graphic_record: GraphicRecord, features_levels: {GraphicFeature: float},
+                   labels_data: {GraphicFeature: dict}, figure_width, origin=0, sign=1, y_shift=0.) -> {str: dict}:
+    """
+    Columns of the Bokeh glyphs of a layout (see Locus.layout).
+
+    x: sign * (position - origin), i.e. mirrored if sign is -1. y: shifted by y_shift.
+    :returns: dict(patches=..., labels=..., segments=...)
+    """
+
+    def x(position):
+        return sign * (position - origin)
+
+    patches = dict(xs=[], ys=[], color=[], label=[], hover_html=[], locus_tag=[])
+    for feature, level in features_levels.items():
+        start, end = sorted([x(feature.start), x(feature.end)])
+        patch = graphic_record.bokeh_feature_patch(
+            start, end, sign * (feature.strand or 0), figure_width=figure_width, level=level + y_shift
+        )
+        patches['xs'].append(patch['xs'])
+        patches['ys'].append(patch['ys'])
+        patches['color'].append(feature.color)
+        patches['label'].append(feature.label)
+        patches['hover_html'].append(feature.html if feature.html is not None else feature.label)
+        patches['locus_tag'].append(get_locus_tag(feature))
+
+    labels = dict(x=[], y=[], text=[])
+    segments = dict(x0=[], x1=[], y0=[], y1=[])
+    for feature, data in labels_data.items():
+        labels['x'].append(x(feature.x_center))
+        labels['y'].append(data['annotation_y'] + y_shift)
+        labels['text'].append(feature.label)
+        segments['x0'].append(x(feature.x_center))
+        segments['x1'].append(x(feature.x_center))
+        segments['y0'].append(data['annotation_y'] + y_shift)
+        segments['y1'].append(data['feature_y'] + y_shift)
+
+    return dict(patches=patches, labels=labels, segments=segments)
+
+
+def _layout_settings(plot_kwargs: dict) -> str:
+    """cache key of the keyword arguments of GraphicRecord.plot"""
+    return repr(sorted({'figure_width': 8, **plot_kwargs}.items()))
+
+
+def _window_features(scaffold: SeqRecord, window: (int, int)) -> [SeqFeature]:
+    """:returns: the features that are translated: unique, not 'source', overlapping with window"""
+    unique_features: {(int, int, str)} = set()
+
+    def add_unique(f: SeqFeature) -> bool:
+        if 'locus_tag' not in f.qualifiers:
+            return False
+        feature = (f.location.nofuzzy_start, f.location.nofuzzy_end, f.qualifiers['locus_tag'][0])
+        if feature in unique_features:
+            return False
+        else:
+            unique_features.add(feature)
+            return True
+
+    return [
+        f for f in get_feature_index(scaffold).overlapping(*window)
+        if add_unique(f) and f.type != 'source'
+    ]
+
+
+def _translate(scaffold: SeqRecord, features: [SeqFeature], description_order: [str]) -> [GraphicFeature]:
+    """translate features of scaffold without copying its sequence"""
+    record = SeqRecord(Seq(None, length=len(scaffold)), id=scaffold.id, features=features)
+    return CustomBiopythonTranslator(
+        label_fields=description_order,
+        features_properties=lambda f: dict(qualifiers=f.qualifiers, type=f.type)
+    ).translate_record(record).features
+
+
+def _drawn_location(f: SeqFeature):
+    """location of the GraphicFeature (see CustomBiopythonTranslator.translate_feature)"""
+    return f.location if f.location_operator != 'join' else f.location.parts[0]
+
+
+def _overlaps(location, window: (int, int)) -> bool:
+    """same as GraphicFeature.crop: None if there is no overlap"""
+    return not (window[0] > location.end or window[1] < location.start)
+
+
+_in_flight: {tuple: list} = {}  # Locus.abuild: key -> [future, number of callers]
+_executor: Executor = None
+_renderer = None
+
+
+def _default_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix='gene_loci_comparison')
+    return _executor
+
+
+def _build_locus(gbk_file, locus_tag, span, add_start_end_feature, description_order) -> Locus:
+    return Locus(gbk_file=gbk_file, locus_tag=locus_tag, span=span, add_start_end_feature=add_start_end_feature,
+                 description_order=description_order)
+
+
+def _render_locus(locus: Locus, format: str, args: tuple, kwargs: dict):
+    global _renderer
+    if format == 'json':
+        return json_item(locus.plot_bokeh(*args, **kwargs))
+    if _renderer is None:
+        from .Renderer import Renderer  # Renderer imports Locus
+        _renderer = Renderer()
+    if format == 'svg':
+        return _renderer.to_svg(locus, *args, **kwargs)
+    return _renderer.to_png(locus, *args, **kwargs)
+
+
+def _feature_to_dict(f: GraphicFeature) -> dict:
+    data = dict(f.data)
+    if 'qualifiers' in data:
+        data['qualifiers'] = {key: list(value) for key, value in data['qualifiers'].items()}
+    return dict(
+        start=int(f.start),
+        end=int(f.end),
+        strand=None if f.strand is None else int(f.strand),
+        label=f.label,
+        color=f.color,
+        linecolor=f.linecolor,
+        thickness=f.thickness,
+        linewidth=f.linewidth,
+        box_linewidth=f.box_linewidth,
+        box_color=f.box_color,
+        label_link_color=f.label_link_color,
+        fontdict=f.fontdict,
+        html=f.html,
+        open_left=f.open_left,
+        open_right=f.open_right,
+        legend_text=f.legend_text,
+        data=data,
+    )
+
+
+def _feature_from_dict(d: dict) -> GraphicFeature:
+    d = dict(d)
+    data = d.pop('data')
+    return GraphicFeature(**d, **data)
@@ -0,0 +1,160 @@
+import os
+import json
+import pickle
+import hashlib
+
+from .Locus import Locus
+from .FeatureStore import FeatureStore
+
+
+class LocusCache:
+    """
+    On-disk cache of built (uncolored) Locus objects, stored in their compact form (Locus.to_dict).
+
+    Entries are keyed by a hash of the GenBank file (mtime and size, or its content if hash_content is True),
+    locus_tag, span, description_order and add_start_end_feature. If the cache grows beyond max_bytes,
+    the least recently used entries are removed. The size of the cache is tracked in memory after the first put:
+    the directory is scanned again only when this estimate exceeds max_bytes.
+
+    Entries that cannot be loaded (e.g. written by another version of Locus) are removed and count as misses.
+    """
+    suffix = '.locus.pickle'
+    format_version = 2  # part of the key: increase when the state of Locus (to_dict) changes
+
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 ** 2, hash_content: bool = False):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hash_content = hash_content
+        self.hits = 0
+        self.misses = 0
+        self._content_hashes: {(str, int, int): str} = {}
+        self._bytes: int = None  # estimated size of the entries, None until the first put
+
+    def __str__(self) -> str:
+        return f'LocusCache: {self.cache_dir} (hits: {self.hits}, misses: {self.misses})'
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            entries=len(entries),
+            bytes=sum(size for path, size, mtime in entries)
+        )
+
+    def key(self, gbk_file: str, locus_tag: str, span: int, description_order: [str],
+            add_start_end_feature: bool) -> str:
+        return hashlib.sha256(json.dumps([
+            self.format_version, self._file_id(gbk_file), locus_tag, span, list(description_order), add_start_end_feature
+        ]).encode()).hexdigest()
+
+    def get(self, key: str):
+        """:returns: Locus or None"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                locus = pickle.load(f)
+            os.utime(path)  # mark as recently used
+        except OSError:
+            self.misses += 1
+            return None
+        except Exception:
+            # truncated, or an older state layout: Locus.__setstate__ may raise anything
+            self.misses += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        self.hits += 1
+        return locus
+
+    def put(self, key: str, locus: Locus):
+        path = self._path(key)
+        tmp_path = F'{path}.{os.getpid()}.tmp'
+        if self._bytes is None:
+            self._bytes = sum(size for path, size, mtime in self._entries())
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(locus, f, protocol=pickle.HIGHEST_PROTOCOL)
+                size = f.tell()
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        self._bytes += size - replaced
+        if self._bytes > self.max_bytes:
+            self.evict()
+
+    def get_locus(self, gbk_file: str, locus_tag: str, title=None, span=3000, add_start_end_feature=True,
+                  description_order: [str] = Locus.default_description_order) -> Locus:
+        """Like Locus(...), but loaded from the cache if possible."""
+        key = self.key(gbk_file, locus_tag, span, description_order, add_start_end_feature)
+        locus = self.get(key)
+        if locus is None:
+            locus = Locus(gbk_file=gbk_file, locus_tag=locus_tag, span=span,
+                          add_start_end_feature=add_start_end_feature, description_order=description_order)
+            self.put(key, locus)
+        locus.title = title
+        locus.gbk_file = gbk_file
+        return locus
+
+    def evict(self):
+        entries = self._entries()
+        total = sum(size for path, size, mtime in entries)
+        for path, size, mtime in sorted(entries, key=lambda e: e[2]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._bytes = total
+
+    def clear(self):
+        for path, size, mtime in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._bytes = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def _entries(self) -> [(str, int, float)]:
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(self.suffix):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # removed by another process
+                    continue
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _file_id(self, gbk_file: str):
+        if isinstance(gbk_file, FeatureStore):
+            gbk_file = gbk_file.db_file
+        stat = os.stat(gbk_file)
+        file_id = (os.path.abspath(gbk_file), stat.st_mtime_ns, stat.st_size)
+        if not self.hash_content:
+            return file_id
+        if file_id not in self._content_hashes:
+            sha256 = hashlib.sha256()
+            with open(gbk_file, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 ** 2), b''):
+                    sha256.update(chunk)
+            self._content_hashes[file_id] = sha256.hexdigest()
+        return self._content_hashes[file_id]
@@ -0,0 +1,123 @@
+import time
+import functools
+import tracemalloc
+from contextlib import nullcontext
+
+_profilers: ['Profiler'] = []
+_NULL_STAGE = nullcontext()
+
+
+class Profiler:
+    """
+    Records wall time, number of calls and optionally the peak memory (tracemalloc) of the stages of Locus and Loci.
+
+    with Profiler(trace_memory=True) as profiler:
+        loci = Loci.generate(...)
+        loci.plot()
+    print(profiler.report())
+
+    Stages of a Locus are reported per locus_tag, stages of Loci per panel: use one Profiler per panel.
+    Stages that run in other processes (Loci.generate(workers=...)) are not recorded.
+    callbacks are called with (locus_tag or None, stage, seconds, peak_kib or None) after every stage.
+    """
+
+    def __init__(self, trace_memory=False, callbacks=()):
+        self.trace_memory = trace_memory
+        self.callbacks = list(callbacks)
+        self.loci: {str: {str: dict}} = {}
+        self.panel: {str: dict} = {}
+        self._memory_stack = []
+        self._started_tracemalloc = False
+
+    def __enter__(self) -> 'Profiler':
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        _profilers.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _profilers.remove(self)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def __str__(self) -> str:
+        lines = []
+        for title, stages in [('panel', self.panel)] + list(self.loci.items()):
+            for name, s in stages.items():
+                peak = '' if s['peak_kib'] is None else F'{s["peak_kib"]:10.0f} KiB'
+                lines.append(F'{title:<30} {name:<30} {s["calls"]:5d} calls {s["seconds"] * 1000:10.2f} ms {peak}')
+        return '\n'.join(lines)
+
+    def report(self) -> dict:
+        """:returns: dict(panel={stage: stats}, loci={locus_tag: {stage: stats}}), stats: calls, seconds, peak_kib"""
+        return dict(
+            panel={name: dict(s) for name, s in self.panel.items()},
+            loci={locus_tag: {name: dict(s) for name, s in stages.items()} for locus_tag, stages in self.loci.items()}
+        )
+
+    def record(self, locus_tag, name: str, seconds: float, peak_kib: float = None):
+        stages = self.panel if locus_tag is None else self.loci.setdefault(locus_tag, {})
+        s = stages.setdefault(name, dict(calls=0, seconds=0., peak_kib=None))
+        s['calls'] += 1
+        s['seconds'] += seconds
+        if peak_kib is not None:
+            s['peak_kib'] = peak_kib if s['peak_kib'] is None else max(s['peak_kib'], peak_kib)
+        for callback in self.callbacks:
+            callback(locus_tag, name, seconds, peak_kib)
+
+
+class _Stage:
+    __slots__ = ('profiler', 'locus_tag', 'name', 'start', 'trace_memory')
+
+    def __init__(self, profiler: Profiler, locus_tag, name: str):
+        self.profiler = profiler
+        self.locus_tag = locus_tag
+        self.name = name
+
+    def __enter__(self):
+        self.trace_memory = self.profiler.trace_memory and tracemalloc.is_tracing()
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # [memory at start, peak of the enclosing stage so far, peak of nested stages]
+            self.profiler._memory_stack.append([current, peak, 0])
+            tracemalloc.reset_peak()
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        seconds = time.perf_counter() - self.start
+        peak_kib = None
+        if self.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            start_memory, enclosing_peak, nested_peak = self.profiler._memory_stack.pop()
+            peak = max(peak, nested_peak)
+            peak_kib = (peak - start_memory) / 1024
+            if self.profiler._memory_stack:
+                enclosing = self.profiler._memory_stack[-1]
+                enclosing[2] = max(enclosing[2], enclosing_peak, peak)
+        self.profiler.record(self.locus_tag, self.name, seconds, peak_kib)
+
+
+def stage(name: str, locus_tag: str = None):
+    """Context manager that records a stage of a Locus (if locus_tag is given) or of a panel in the active Profiler."""
+    if not _profilers:
+        return _NULL_STAGE
+    return _Stage(_profilers[-1], locus_tag, name)
+
+
+def profiled(name: str):
+    """Decorator: records the method as a stage of the Locus (self.locus_tag) or of the panel."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # no bound self: also wraps staticmethods, called with positional or keyword arguments
+            if not _profilers:
+                return func(*args, **kwargs)
+            with _Stage(_profilers[-1], getattr(args[0], 'locus_tag', None) if args else None, name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,73 @@
+import queue
+import threading
+from io import BytesIO
+from contextlib import contextmanager
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from .Locus import Locus
+from .Profiler import stage
+
+_SUBPLOT_PARAMS = ('left', 'right', 'bottom', 'top', 'wspace', 'hspace')
+
+
+class Renderer:
+    """
+    Renders single loci to SVG strings or PNG bytes, e.g. in a web service.
+
+    Figures are kept in a pool and cleared and reused instead of created for every call. They use the Agg canvas
+    directly, not pyplot: nothing is registered globally, so nothing has to be closed.
+    Thread-safe: every concurrent call gets its own figure, the pool grows to the number of concurrent callers.
+    """
+
+    def __init__(self, figure_width=8, dpi=100, tight_layout=True):
+        self.figure_width = figure_width
+        self.dpi = dpi
+        self.tight_layout = tight_layout
+        self.n_figures = 0
+        self._pool = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def __str__(self) -> str:
+        return f'Renderer: {self.n_figures} figures'
+
+    @contextmanager
+    def _figure(self) -> Figure:
+        try:
+            fig = self._pool.get_nowait()
+        except queue.Empty:
+            fig = Figure()
+            FigureCanvasAgg(fig)
+            with self._lock:
+                self.n_figures += 1
+        try:
+            yield fig
+        finally:
+            fig.clear()
+            fig.subplots_adjust(**{p: matplotlib.rcParams[F'figure.subplot.{p}'] for p in _SUBPLOT_PARAMS})
+            self._pool.put(fig)
+
+    def render(self, locus: Locus, format='svg', *args, **kwargs) -> bytes:
+        """:returns: locus.plot(*args, **kwargs) saved in format"""
+        with self._figure() as fig:
+            # same figure height as GraphicRecord.plot without ax: one inch per level, then 0.4 inch per y-unit
+            levels = locus.features_levels().values()
+            fig.set_size_inches(self.figure_width, max([1, *levels]))
+
+            ax = fig.add_subplot(1, 1, 1)
+            locus.plot(ax=ax, *args, **kwargs)
+            fig.set_size_inches(self.figure_width, 1 + 0.4 * ax.get_ylim()[1])
+            if self.tight_layout:
+                fig.tight_layout()
+
+            f = BytesIO()
+            with stage('savefig', locus.locus_tag):
+                fig.savefig(f, format=format, dpi=self.dpi)
+        return f.getvalue()
+
+    def to_svg(self, locus: Locus, *args, **kwargs) -> str:
+        return self.render(locus, 'svg', *args, **kwargs).decode('utf-8')
+
+    def to_png(self, locus: Locus, *args, **kwargs) -> bytes:
+        return self.render(locus, 'png', *args, **kwargs)
@@ -0,0 +1,143 @@
+import os
+import mmap
+import threading
+from Bio.Seq import Seq, SequenceDataAbstractBaseClass
+
+
+class SequenceStore:
+    """
+    Sequences of many records in one flat file without line breaks, read through mmap (like a faidx-indexed FASTA).
+
+    Seqs returned by get are lazy: only the sliced regions are read, e.g. crop_window ± window_bp for plot_gc.
+    The file is written with SequenceStore.writer, the index (key -> (offset, length)) is kept by the caller.
+    """
+
+    def __init__(self, seq_file: str, sequences: {object: (int, int)}):
+        self.seq_file = seq_file
+        self.sequences = sequences  # key -> (offset, length)
+        self._mmap = None
+        self._lock = threading.Lock()
+
+    def __str__(self) -> str:
+        return f'SequenceStore: {self.seq_file} ({len(self.sequences)} sequences)'
+
+    def __contains__(self, key) -> bool:
+        return key in self.sequences
+
+    def is_complete(self) -> bool:
+        """:returns: whether the file exists and has the size of the indexed sequences"""
+        try:
+            size = os.path.getsize(self.seq_file)
+        except OSError:
+            return False
+        return size == sum(length for offset, length in self.sequences.values())
+
+    def get(self, key) -> Seq:
+        offset, length = self.sequences[key]
+        if length == 0:
+            return Seq(b'')
+        return Seq(_MappedSequenceData(self._map(), offset, length))
+
+    def _map(self) -> mmap.mmap:
+        with self._lock:
+            if self._mmap is None:
+                with open(self.seq_file, 'rb') as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    @staticmethod
+    def writer(seq_file: str) -> '_SequenceWriter':
+        """
+        with SequenceStore.writer(seq_file) as writer:
+            writer.add(key, sequence)
+        store = writer.store  # None if the file could not be written
+
+        The file is replaced atomically when the block ends without error.
+        """
+        return _SequenceWriter(seq_file)
+
+
+class _SequenceWriter:
+    def __init__(self, seq_file: str):
+        self.seq_file = seq_file
+        self.tmp_file = F'{seq_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+        self.sequences = {}
+        self.store = None
+        self._handle = None
+        self._position = 0
+
+    def __enter__(self) -> '_SequenceWriter':
+        try:
+            self._handle = open(self.tmp_file, 'wb')
+        except OSError:
+            self._handle = None
+        return self
+
+    def add(self, key, sequence: bytes):
+        if self._handle is None:
+            return
+        try:
+            self._handle.write(sequence)
+        except OSError:
+            self._abort()
+            return
+        self.sequences[key] = (self._position, len(sequence))
+        self._position += len(sequence)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._handle is None:
+            return
+        try:
+            self._handle.close()
+            if exc_type is None:
+                os.replace(self.tmp_file, self.seq_file)
+                self.store = SequenceStore(self.seq_file, self.sequences)
+                return
+        except OSError:
+            pass
+        self._abort()
+
+    def _abort(self):
+        if self._handle is not None and not self._handle.closed:
+            self._handle.close()
+        self._handle = None
+        if os.path.isfile(self.tmp_file):
+            os.remove(self.tmp_file)
+
+
+class _MappedSequenceData(SequenceDataAbstractBaseClass):
+    """sequence data of a region of a mmap, only sliced regions are read"""
+    __slots__ = ('_mmap', '_offset', '_length')
+
+    def __init__(self, mapped: mmap.mmap, offset: int, length: int):
+        self._mmap = mapped
+        self._offset = offset
+        self._length = length
+        super().__init__()
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._length)
+            if step == 1:
+                return self._mmap[self._offset + start:self._offset + max(start, stop)]
+            return self._mmap[self._offset:self._offset + self._length][key]
+        if key < 0:
+            key += self._length
+        if not 0 <= key < self._length:
+            raise IndexError('sequence index out of range')
+        return self._mmap[self._offset + key]
+
+    def __reduce__(self):
+        # pickled as bytes: the mmap cannot be pickled
+        return bytes, (self[:],)
+
+    @property
+    def defined(self) -> bool:
+        return True
+
+    @property
+    def defined_ranges(self) -> ((int, int),):
+        return ((0, self._length),)
@@ -0,0 +1,129 @@
+import os
+import csv
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+from bokeh.layouts import column
+from bokeh.resources import CDN
+from bokeh.io import save
+
+from .Loci import Loci
+from .LocusCache import LocusCache
+
+MATPLOTLIB_FORMATS = ('svg', 'png', 'pdf')
+BOKEH_FORMATS = ('html',)
+
+
+def read_manifest(manifest: str) -> [dict]:
+    """
+    Read comparisons from a JSON or TSV manifest. Relative paths are relative to the manifest.
+
+    JSON: list of dict(output=..., loci=[dict(gbk=..., gene=..., title=...), ...], colors={locus_tag: color},
+          span=3000, auto_reverse=True, gc=False, viewspan=None, bokeh_panel=False)
+    TSV: columns output, gbk, gene, title and optionally color (of the gene) and span. Rows with the same output
+         form one comparison.
+    """
+    manifest_dir = os.path.dirname(os.path.abspath(manifest))
+
+    if manifest.endswith('.json'):
+        with open(manifest) as f:
+            comparisons = json.load(f)
+    else:
+        comparisons = {}
+        with open(manifest, newline='') as f:
+            for row in csv.DictReader(f, delimiter='\t'):
+                comparison = comparisons.setdefault(row['output'], dict(output=row['output'], loci=[], colors={}))
+                comparison['loci'].append(dict(gbk=row['gbk'], gene=row['gene'], title=row['title']))
+                if row.get('color'):
+                    comparison['colors'][row['gene']] = row['color']
+                if row.get('span'):
+                    comparison.setdefault('span', int(row['span']))
+        comparisons = list(comparisons.values())
+
+    for comparison in comparisons:
+        comparison['output'] = os.path.join(manifest_dir, comparison['output'])
+        for l in comparison['loci']:
+            l['gbk'] = os.path.join(manifest_dir, l['gbk'])
+
+    return comparisons
+
+
+def is_up_to_date(comparison: dict, dependencies: [str] = ()) -> bool:
+    output = comparison['output']
+    if not os.path.isfile(output):
+        return False
+    inputs = [l['gbk'] for l in comparison['loci']] + list(dependencies)
+    return os.path.getmtime(output) >= max(os.path.getmtime(path) for path in inputs)
+
+
+def render(comparison: dict, cache_dir: str = None) -> float:
+    """Render one comparison to comparison['output']. :returns: time in seconds"""
+    start = time.perf_counter()
+
+    output = comparison['output']
+    extension = os.path.splitext(output)[1].lstrip('.').lower()
+    assert extension in MATPLOTLIB_FORMATS + BOKEH_FORMATS, F'Unsupported output format: {output}'
+
+    loci = Loci.generate(
+        comparison['loci'],
+        span=comparison.get('span', 3000),
+        locus_to_color_dict=comparison.get('colors', {}),
+        cache=None if cache_dir is None else LocusCache(cache_dir)
+    )
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    auto_reverse = comparison.get('auto_reverse', True)
+    if extension in BOKEH_FORMATS:
+        if comparison.get('bokeh_panel'):
+            bokeh = loci.plot_bokeh_panel(viewspan=comparison.get('viewspan'), auto_reverse=auto_reverse)
+        else:
+            plots = loci.plot_bokeh(viewspan=comparison.get('viewspan'), auto_reverse=auto_reverse)
+            bokeh = column(plots)
+            bokeh.sizing_mode = 'scale_width'
+        save(bokeh, filename=output, resources=CDN, title=os.path.basename(output))
+    else:
+        # one locus at a time: memory does not grow with the number of loci
+        loci.export(output, gc=comparison.get('gc', False), auto_reverse=auto_reverse)
+
+    return time.perf_counter() - start
+
+
+def main(argv: [str] = None):
+    parser = argparse.ArgumentParser(
+        prog='gene-loci-comparison',
+        description='Render gene locus comparisons listed in a manifest (JSON or TSV) to SVG, PNG, PDF or HTML.'
+    )
+    parser.add_argument('manifest', help='JSON or TSV file that lists the comparisons')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--force', action='store_true', help='also render outputs that are up to date')
+    parser.add_argument('--cache', default=None, help='directory of a LocusCache to reuse loci between runs')
+    args = parser.parse_args(argv)
+
+    matplotlib.use('Agg')
+
+    comparisons = read_manifest(args.manifest)
+
+    to_render = []
+    for comparison in comparisons:
+        if not args.force and is_up_to_date(comparison, dependencies=[args.manifest]):
+            print(F'skipped {comparison["output"]} (up to date)')
+        else:
+            to_render.append(comparison)
+
+    start = time.perf_counter()
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = [(comparison, executor.submit(render, comparison, args.cache)) for comparison in to_render]
+        for comparison, future in futures:
+            try:
+                print(F'rendered {comparison["output"]} in {future.result():.2f}s')
+            except Exception as e:
+                failed += 1
+                print(F'failed {comparison["output"]}: {type(e).__name__}: {e}')
+
+    print(F'{len(to_render) - failed} rendered, {len(comparisons) - len(to_render)} skipped, {failed} failed '
+          F'in {time.perf_counter() - start:.2f}s')
+
+    return 1 if failed else 0
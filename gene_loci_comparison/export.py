@@ -0,0 +1,102 @@
+import gc
+import os
+import re
+import zlib
+import struct
+from io import BytesIO
+from itertools import chain
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+
+EXPORT_FORMATS = ('svg', 'png', 'pdf')
+
+_SVG_SIZE = re.compile(r'<svg[^>]*?\bwidth="([\d.]+)pt" height="([\d.]+)pt"')
+
+
+def write_stitched(figures: [Figure], n_figures: int, output: str, dpi=100):
+    """
+    Write figures of equal size below each other into one file. Every figure is rendered, written and released
+    before the next one is created, so the peak memory does not depend on n_figures.
+
+    svg: nested <svg> elements, png: rows of pixels, pdf: one page per figure
+    """
+    extension = os.path.splitext(output)[1].lstrip('.').lower()
+    assert extension in EXPORT_FORMATS, F'Unsupported output format: {output}'
+    assert n_figures > 0, 'Nothing to export!'
+
+    if extension == 'pdf':
+        with PdfPages(output) as pdf:
+            for figure in _one_at_a_time(figures):
+                pdf.savefig(figure)
+        return
+
+    with open(output, 'wb') as f:
+        if extension == 'svg':
+            _write_svg(f, (_to_svg(figure) for figure in _one_at_a_time(figures)), n_figures)
+        else:
+            _write_png(f, (_to_rgba(figure, dpi) for figure in _one_at_a_time(figures)), n_figures)
+
+
+def _one_at_a_time(figures: [Figure]) -> [Figure]:
+    for figure in figures:
+        # figures contain reference cycles: collect the previous figure before the next one is drawn
+        gc.collect()
+        yield figure
+
+
+def _to_svg(figure: Figure) -> str:
+    buffer = BytesIO()
+    figure.savefig(buffer, format='svg')
+    svg = buffer.getvalue().decode('utf-8')
+    return svg[svg.index('<svg'):]  # drop xml declaration and doctype
+
+
+def _to_rgba(figure: Figure, dpi) -> np.ndarray:
+    figure.set_dpi(dpi)
+    canvas = FigureCanvasAgg(figure)
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba()).copy()
+
+
+def _write_svg(f, svgs: [str], n_svgs: int):
+    svgs = iter(svgs)
+    first = next(svgs)
+    width, height = (float(size) for size in _SVG_SIZE.match(first).groups())
+
+    f.write((
+        F'<?xml version="1.0" encoding="utf-8" standalone="no"?>\n'
+        F'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" version="1.1" '
+        F'width="{width}pt" height="{height * n_svgs}pt" viewBox="0 0 {width} {height * n_svgs}">\n'
+    ).encode('utf-8'))
+    for i, svg in enumerate(chain([first], svgs)):
+        assert _SVG_SIZE.match(svg).groups() == _SVG_SIZE.match(first).groups(), 'All figures must have the same size!'
+        f.write(svg.replace('<svg', F'<svg x="0" y="{height * i}"', 1).encode('utf-8'))
+    f.write(b'</svg>\n')
+
+
+def _write_png(f, images: [np.ndarray], n_images: int):
+    images = iter(images)
+    first = next(images)
+    height, width = first.shape[:2]
+
+    def write_chunk(chunk_type: bytes, data: bytes):
+        f.write(struct.pack('>I', len(data)) + chunk_type + data)
+        f.write(struct.pack('>I', zlib.crc32(chunk_type + data)))
+
+    f.write(b'\x89PNG\r\n\x1a\n')
+    # 8 bit RGBA, no interlacing
+    write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height * n_images, 8, 6, 0, 0, 0))
+
+    compressor = zlib.compressobj()
+    for image in chain([first], images):
+        assert image.shape == first.shape, 'All figures must have the same size!'
+        # every row starts with filter type 0 (none)
+        rows = np.zeros((height, 1 + width * 4), dtype=np.uint8)
+        rows[:, 1:] = image.reshape(height, width * 4)
+        data = compressor.compress(rows.tobytes())
+        if data:
+            write_chunk(b'IDAT', data)
+    write_chunk(b'IDAT', compressor.flush())
+    write_chunk(b'IEND', b'')
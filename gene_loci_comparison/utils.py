@@ -1,5 +1,9 @@
 import os
+import copy
+import weakref
+import numpy as np
 from Bio.SeqRecord import SeqRecord
+from Bio.SeqFeature import SeqFeature
 from Bio import SeqIO
 from dna_features_viewer import GraphicFeature
 
@@ -8,19 +12,214 @@ def get_locus_tag(feature: GraphicFeature) -> str:
     return feature.data['qualifiers']['locus_tag'][0]
 
 
+def get_gene_location(f: SeqFeature) -> int:
+    location = f.location if f.location_operator != 'join' else f.location.parts[0]
+    f_start, f_end = location.start, location.end
+    return int(f_start + (f_end - f_start) // 2)
+
+
 def get_scaffold_and_geneposition(gbk_file, locus) -> (SeqRecord, int):
     assert os.path.isfile(gbk_file)
     with open(gbk_file, "r") as input_handle:
         for scf in SeqIO.parse(input_handle, "genbank"):
             for f in scf.features:
                 if f.type in ["gene", "CDS"] and "locus_tag" in f.qualifiers and f.qualifiers['locus_tag'][0] == locus:
-                    location = f.location if f.location_operator != 'join' else f.location.parts[0]
-                    f_start, f_end = location.start, location.end
-                    gene_location = f_start + (f_end - f_start) // 2
-                    return (scf, gene_location)
+                    return (scf, get_gene_location(f))
     raise KeyError(F'Gene {locus} was not found in file {gbk_file}')
 
 
+class FeatureIndex:
+    """Sorted-start index over SeqFeatures for fast interval queries. Features of type 'source' are not indexed."""
+
+    def __init__(self, features: [SeqFeature]):
+        self.features = [f for f in features if f.location is not None and f.type != 'source']
+        starts = np.array([int(f.location.start) for f in self.features], dtype=np.int64)
+        ends = np.array([int(f.location.end) for f in self.features], dtype=np.int64)
+        self.order = np.argsort(starts, kind='stable')
+        self.sorted_starts = starts[self.order]
+        self.ends = ends
+        # running maximum of the end positions in start order: monotonic, therefore searchable
+        self.max_ends = np.maximum.accumulate(ends[self.order]) if len(self.features) else ends
+
+    def overlapping(self, start: int, end: int) -> [SeqFeature]:
+        """Features that overlap with [start, end], boundaries included, in their original order."""
+        lo = np.searchsorted(self.max_ends, start, side='left')
+        hi = np.searchsorted(self.sorted_starts, end, side='right')
+        idx = self.order[lo:hi]
+        idx = np.sort(idx[self.ends[idx] >= start])
+        return [self.features[i] for i in idx]
+
+
+class FeatureTable:
+    """
+    Translated features (GraphicFeature) of a Locus as columns: start, end and strand arrays, tag_id (index into
+    tags) and the rows of each locus tag. Locus.graphic_record is cropped from it.
+
+    The features are not changed: colors and labels (set_colors, set_labels) are maps by locus tag that crop applies
+    to its copies.
+    """
+
+    def __init__(self, features: [GraphicFeature]):
+        self.features = features
+        self.start = np.array([int(f.start) for f in features], dtype=np.int64)
+        self.end = np.array([int(f.end) for f in features], dtype=np.int64)
+        self.strand = np.array([f.strand or 0 for f in features], dtype=np.int8)
+        self.tags: [str] = []
+        self.rows: {str: [int]} = {}
+        tag_ids: {str: int} = {}
+        for row, f in enumerate(features):
+            locus_tag = get_locus_tag(f)
+            if locus_tag not in tag_ids:
+                tag_ids[locus_tag] = len(self.tags)
+                self.tags.append(locus_tag)
+                self.rows[locus_tag] = []
+            self.rows[locus_tag].append(row)
+        self.tag_id = np.array([tag_ids[get_locus_tag(f)] for f in features], dtype=np.int32)
+        # replaced, never changed in place: copies share them
+        self.colors: {str: str} = None  # locus tag -> color, default_color for the others
+        self.default_color: str = None
+        self.labels: {str: str} = {}  # locus tag -> label, None for the others if remove_unspecified_labels
+        self.remove_unspecified_labels = False
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+    def row(self, locus_tag: str) -> int:
+        """:returns: row of the first gene or CDS of locus_tag (like GenbankIndex), else its first row"""
+        if locus_tag not in self.rows:
+            raise KeyError(F'Locus tag {locus_tag} is not in the feature table')
+        rows = self.rows[locus_tag]
+        for row in rows:
+            if self.features[row].data.get('type') in ('gene', 'CDS'):
+                return row
+        return rows[0]
+
+    def strand_of(self, locus_tag: str) -> int:
+        return int(self.strand[self.row(locus_tag)])
+
+    def gene_location(self, locus_tag: str) -> int:
+        """:returns: center of the feature, like get_gene_location"""
+        row = self.row(locus_tag)
+        return int(self.start[row] + (self.end[row] - self.start[row]) // 2)
+
+    def copy(self) -> 'FeatureTable':
+        """:returns: copy with its own colors and labels, features and columns are shared"""
+        return copy.copy(self)
+
+    def set_colors(self, locus_to_color: {str: str}, default_color: str):
+        self.colors, self.default_color = dict(locus_to_color), default_color
+
+    def set_labels(self, locus_to_label: {str: str}, remove_unspecified=False):
+        if remove_unspecified:
+            self.labels, self.remove_unspecified_labels = dict(locus_to_label), True
+        else:
+            self.labels = {**self.labels, **locus_to_label}
+
+    def crop(self, window: (int, int)) -> [GraphicFeature]:
+        """
+        :returns: copies of the features that overlap with window (boundaries included), cropped to window,
+                  with the colors and labels of the table
+        """
+        start, end = window
+        rows = np.flatnonzero((self.start <= end) & (self.end >= start))
+        features = [self.features[row].crop(window) for row in rows]
+        if self.colors is not None or self.labels or self.remove_unspecified_labels:
+            for f in features:
+                locus_tag = get_locus_tag(f)
+                if self.colors is not None:
+                    f.color = self.colors.get(locus_tag, self.default_color)
+                if locus_tag in self.labels:
+                    f.label = self.labels[locus_tag]
+                elif self.remove_unspecified_labels:
+                    f.label = None
+        return features
+
+
+_feature_indices: {int: FeatureIndex} = {}
+
+
+def get_feature_index(scaffold: SeqRecord) -> FeatureIndex:
+    """FeatureIndex of scaffold, cached for as long as the SeqRecord is alive."""
+    key = id(scaffold)
+    if key not in _feature_indices:
+        _feature_indices[key] = FeatureIndex(scaffold.features)
+        weakref.finalize(scaffold, _feature_indices.pop, key, None)
+    return _feature_indices[key]
+
+
+_IS_G = np.zeros(256, dtype=np.int64)
+_IS_G[list(b'Gg')] = 1
+_IS_C = np.zeros(256, dtype=np.int64)
+_IS_C[list(b'Cc')] = 1
+
+
+def gc_counts(sequence: bytes) -> np.ndarray:
+    """:returns: cumulative G and C counts, shape (2, len(sequence) + 1): counts[:, j] - counts[:, i] counts seq[i:j]"""
+    seq = np.frombuffer(sequence, dtype=np.uint8)
+    counts = np.zeros((2, len(seq) + 1), dtype=np.uint32)
+    counts[0, 1:] = np.cumsum(_IS_G[seq])
+    counts[1, 1:] = np.cumsum(_IS_C[seq])
+    return counts
+
+
+def _window_counts(counts: np.ndarray, window_bp: int, step: int) -> (np.ndarray, np.ndarray, np.ndarray):
+    # unsigned differences wrap around: counts may be stored modulo 2 ** bits (GcTrackStore)
+    if not 0 < window_bp < 2 ** (8 * counts.itemsize):
+        raise ValueError(F'window_bp must be between 1 and {2 ** (8 * counts.itemsize) - 1}, not {window_bp}')
+    n_starts = max(counts.shape[1] - window_bp, 0)
+    g, c = (counts[:, window_bp:window_bp + n_starts:step] - counts[:, :n_starts:step]).astype(np.int64)
+    return np.arange(0, n_starts, step), g, c
+
+
+def gc_content_from_counts(counts: np.ndarray, window_bp: int = 100, step: int = 1) -> (np.ndarray, np.ndarray):
+    """:returns: start of each window (relative to counts, see gc_counts), GC fraction of each window"""
+    starts, g, c = _window_counts(counts, window_bp, step)
+    return starts, (g + c) / window_bp
+
+
+def gc_skew_from_counts(counts: np.ndarray, window_bp: int = 100, step: int = 1) -> (np.ndarray, np.ndarray):
+    """:returns: start of each window (relative to counts, see gc_counts), GC skew (G - C) / (G + C) of each window"""
+    starts, g, c = _window_counts(counts, window_bp, step)
+    gc = g + c
+    return starts, np.divide(g - c, gc, out=np.zeros(len(gc)), where=gc > 0)
+
+
+def calc_gc_content(sequence: bytes, window_bp: int = 100, step: int = 1) -> (np.ndarray, np.ndarray):
+    """:returns: start of each window (relative to sequence), GC fraction of each window"""
+    return gc_content_from_counts(gc_counts(sequence), window_bp, step)
+
+
+def calc_gc_skew(sequence: bytes, window_bp: int = 100, step: int = 1) -> (np.ndarray, np.ndarray):
+    """:returns: start of each window (relative to sequence), GC skew (G - C) / (G + C) of each window"""
+    return gc_skew_from_counts(gc_counts(sequence), window_bp, step)
+
+
+def strand_coverage(features: [GraphicFeature], window: (int, int), bin_sizes: [int]) -> {int: tuple}:
+    """
+    Fraction of each bin that is covered by features, per strand (features without strand count as +).
+
+    :returns: {bin_size: (start of each bin, fraction covered by + features, fraction covered by - features)}
+    """
+    start, end = window
+    covered = []
+    for minus in [False, True]:
+        bounds = np.array([(f.start, f.end) for f in features if (f.strand == -1) == minus], dtype=np.int64)
+        bounds = np.clip(np.sort(bounds.reshape(-1, 2), axis=1), start, end) - start
+        diff = np.zeros(end - start + 1, dtype=np.int32)
+        np.add.at(diff, bounds[:, 0], 1)
+        np.add.at(diff, bounds[:, 1], -1)
+        covered.append(np.cumsum(diff[:-1]) > 0)
+
+    coverage = {}
+    for bin_size in bin_sizes:
+        n_bins = -(-(end - start) // bin_size)
+        fractions = [
+            np.pad(c, (0, n_bins * bin_size - len(c))).reshape(n_bins, bin_size).mean(axis=1) for c in covered
+        ]
+        coverage[bin_size] = (start + np.arange(n_bins) * bin_size, *fractions)
+    return coverage
+
+
 JAVASCRIPT_TAP_CALLBACK = """\
 // Get label of selected datapoint:
 let label
@@ -30,6 +229,10 @@ if (typeof cb_data.source.data.hover_html != "undefined") {
 } else if (typeof cb_data.source.data.text != "undefined") {
     // clicked on gene text
     label = cb_data.source.data.text[cb_data.source.selected.indices];
+} else if (typeof cb_data.source.data.feature != "undefined") {
+    // typed arrays (Loci.plot_bokeh_panel): index into the texts that all rows share
+    const texts = feature_texts.data[cb_data.source.data.x1 ? 'hover_html' : 'label'];
+    label = texts[cb_data.source.data.feature[cb_data.source.selected.indices]];
 }
 if (typeof label == "undefined" ) {
     console.log('Something was clicked on, but no label could be extracted!');
@@ -53,3 +256,121 @@ end   = cb_obj.end   - my_center + other_center;
 }
 x_range.setv({start, end});\
 """
+
+
+JAVASCRIPT_SYNC_SCROLL_BROADCAST = """\
+// one callback for all plots: ranges, centers (gene locations) and reversed flags are lists
+// CustomJS.execute is async in BokehJS 3: the callbacks triggered by the setv calls below run after this body has
+// returned. The sync group (keyed on its first range) therefore remembers its source range until a setTimeout, after
+// these callbacks ran, and ignores the other ranges until then. Ranges that already show the computed start and end
+// are not set, so a late callback does not start a cascade either.
+const groups = window._gene_loci_syncing || (window._gene_loci_syncing = new WeakMap());
+const group = groups.get(ranges[0]);
+if (group !== undefined && group.source !== cb_obj) {
+    return;  // triggered by the setv calls of group.source
+}
+if (group !== undefined) {
+    clearTimeout(group.timeout);
+}
+groups.set(ranges[0], {source: cb_obj, timeout: setTimeout(() => groups.delete(ranges[0]), 0)});
+
+const i = ranges.indexOf(cb_obj);
+const epsilon = 1e-9 * Math.max(1, Math.abs(cb_obj.end - cb_obj.start));
+for (let j = 0; j < ranges.length; j++) {
+    if (j === i) {
+        continue;
+    }
+    let start, end;
+    if (reversed[i] !== reversed[j]) {
+        start = centers[i] - cb_obj.start + centers[j];
+        end   = centers[i] - cb_obj.end   + centers[j];
+    } else {
+        start = cb_obj.start - centers[i] + centers[j];
+        end   = cb_obj.end   - centers[i] + centers[j];
+    }
+    if (Math.abs(ranges[j].start - start) > epsilon || Math.abs(ranges[j].end - end) > epsilon) {
+        ranges[j].setv({start, end});
+    }
+}\
+"""
+
+
+# CustomJSExpr (this: ColumnDataSource): patch outlines of features from typed arrays, see bokeh_feature_patch
+JAVASCRIPT_PATCH_XS = """\
+const {x1, x2, head} = this.data;
+const xs = new Array(x1.length);
+for (let i = 0; i < x1.length; i++) {
+    xs[i] = [x1[i], x1[i], head[i], x2[i], head[i], x1[i]];
+}
+return xs;\
+"""
+
+# CustomJSExpr (this: ColumnDataSource): column of feature_texts (shared by all rows) of each feature index
+JAVASCRIPT_FEATURE_TEXT = """\
+return Array.from(this.data.feature, i => feature_texts.data[column][i]);\
+"""
+
+JAVASCRIPT_PATCH_YS = """\
+const {y} = this.data;
+const ys = new Array(y.length);
+for (let i = 0; i < y.length; i++) {
+    ys[i] = [y[i] - half_width, y[i] + half_width, y[i] + half_width, y[i], y[i] - half_width, y[i] - half_width];
+}
+return ys;\
+"""
+
+# level of detail (Locus.plot_bokeh(detail_span=...)): features and labels if at most detail_span bp are visible,
+# else the strand coverage bars with the finest bin size that needs at most max_bins bins
+JAVASCRIPT_LEVEL_OF_DETAIL = """\
+const width = Math.abs(x_range.end - x_range.start);
+let level = -1;
+if (width > detail_span) {
+    level = bin_sizes.length - 1;
+    for (let i = 0; i < bin_sizes.length; i++) {
+        if (width / bin_sizes[i] <= max_bins) {
+            level = i;
+            break;
+        }
+    }
+}
+for (const r of detail) {
+    if (r.visible != (level == -1)) r.visible = (level == -1);
+}
+for (let i = 0; i < summaries.length; i++) {
+    if (summaries[i].visible != (level == i)) summaries[i].visible = (level == i);
+}\
+"""
+
+# on-demand loading (Locus.plot_bokeh(feature_server=...)): the chunks of the visible range ± half its width,
+# at most max_chunks around the center. Requests are sent when panning or zooming pauses.
+JAVASCRIPT_FETCH_CHUNKS = """\
+const left = Math.min(x_range.start, x_range.end);
+const right = Math.max(x_range.start, x_range.end);
+const margin = (right - left) / 2;
+let first = Math.max(0, Math.floor((left - margin) / chunk_size));
+let last = Math.min(n_chunks - 1, Math.floor((right + margin) / chunk_size));
+if (last - first >= max_chunks) {
+    first = Math.max(0, Math.floor((left + right) / 2 / chunk_size) - Math.floor((max_chunks - 1) / 2));
+    last = Math.min(n_chunks - 1, first + max_chunks - 1);
+}
+const data_url = `${url}?first=${first}&last=${last}&width=${width}`;
+if (data_url != source.data_url) {
+    source.data_url = data_url;
+    clearTimeout(source._gene_loci_fetch);
+    source._gene_loci_fetch = setTimeout(() => source.get_data(source.mode), 150);
+}\
+"""
+
+# adapter of the AjaxDataSource of the features: the response also contains the labels and the label links
+JAVASCRIPT_CHUNK_ADAPTER = """\
+const {patches, labels: labels_data, segments: segments_data} = cb_data.response;
+labels.data = labels_data;
+segments.data = segments_data;
+let max_y = y_range.end - 1;
+for (const ys of patches.ys) {
+    for (const y of ys) max_y = Math.max(max_y, y);
+}
+for (const y of labels_data.y) max_y = Math.max(max_y, y);
+y_range.end = max_y + 1;
+return patches;\
+"""
@@ -27,4 +27,7 @@ setup(
     ],
     packages=['gene_loci_comparison'],
     install_requires=['pandas', 'biopython', 'dna-features-viewer', 'bokeh'],
+    entry_points={
+        'console_scripts': ['gene-loci-comparison=gene_loci_comparison.cli:main'],
+    },
 )
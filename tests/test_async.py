@@ -0,0 +1,58 @@
+import os
+import sys
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+from gene_loci_comparison import Locus
+
+assert os.path.isfile('tests/test_loci.py'), f'Please set working directory to git root!'
+
+new_prokka_file = 'tests/data/Prokka/Lbombicola_ESL0228.gbk'
+locus_module = sys.modules['gene_loci_comparison.Locus']
+
+
+class TestAsync(IsolatedAsyncioTestCase):
+    async def test_abuild_coalesces(self):
+        with patch.object(locus_module, '_build_locus', wraps=locus_module._build_locus) as build:
+            loci = await asyncio.gather(
+                Locus.abuild(new_prokka_file, 'Lbombicola_ESL0228_00004', title='first'),
+                Locus.abuild(new_prokka_file, 'Lbombicola_ESL0228_00004', title='second'),
+                Locus.abuild(new_prokka_file, 'Lbombicola_ESL0228_00004', span=5000),
+                Locus.abuild(new_prokka_file, 'Lbombicola_ESL0228_00500'),
+            )
+        self.assertEqual(3, build.call_count)
+        self.assertEqual({}, locus_module._in_flight)
+
+        first, second, wide, other = loci
+        self.assertEqual(['first', 'second'], [first.title, second.title])
+        self.assertIsNot(first, second)
+        self.assertEqual(first.locus_tags(), second.locus_tags())
+        self.assertEqual(Locus(new_prokka_file, 'Lbombicola_ESL0228_00004').locus_tags(), first.locus_tags())
+        self.assertGreater(len(wide.locus_tags()), len(first.locus_tags()))
+        self.assertEqual('Lbombicola_ESL0228_00500', other.locus_tag)
+
+        # copies are equivalent to a built Locus, whichever caller came first
+        for locus in (first, second):
+            self.assertEqual(first.max_span, locus.max_span)
+            self.assertTrue(locus.scaffold.seq.defined)
+            self.assertIsNotNone(locus._gc_track())
+
+        # colorizing one copy does not affect the other
+        first.colorize({'Lbombicola_ESL0228_00004': '#1984ff'})
+        self.assertNotIn('#1984ff', [f.color for f in second.graphic_record.features])
+
+    async def test_abuild_error(self):
+        with self.assertRaises(KeyError):
+            await Locus.abuild(new_prokka_file, 'nonexistent')
+        self.assertEqual({}, locus_module._in_flight)
+
+    async def test_arender(self):
+        locus = await Locus.abuild(new_prokka_file, 'Lbombicola_ESL0228_00004', title='title')
+        svg, png, item = await asyncio.gather(
+            locus.arender('svg'),
+            locus.arender('png'),
+            locus.arender('json'),
+        )
+        self.assertIn('Lbombicola_ESL0228_00004', svg)
+        self.assertTrue(png.startswith(b'\x89PNG'))
+        self.assertIn('doc', item)
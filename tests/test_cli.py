@@ -0,0 +1,76 @@
+import os
+import json
+import shutil
+import tempfile
+from unittest import TestCase
+from contextlib import redirect_stdout
+from io import StringIO
+from gene_loci_comparison.cli import main, read_manifest
+
+assert os.path.isfile('tests/test_loci.py'), f'Please set working directory to git root!'
+
+new_prokka_file = 'tests/data/Prokka/Lbombicola_ESL0228.gbk'
+
+
+class TestCli(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        shutil.copy(new_prokka_file, self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_main(self, *argv) -> str:
+        stdout = StringIO()
+        with redirect_stdout(stdout):
+            self.assertEqual(0, main(list(argv)))
+        return stdout.getvalue()
+
+    def test_json(self):
+        manifest = os.path.join(self.tmp_dir, 'manifest.json')
+        with open(manifest, 'w') as f:
+            json.dump([
+                dict(
+                    output='out/comparison.svg',
+                    loci=[
+                        dict(gbk='Lbombicola_ESL0228.gbk', gene='Lbombicola_ESL0228_00004', title='title1'),
+                        dict(gbk='Lbombicola_ESL0228.gbk', gene='Lbombicola_ESL0228_00500', title='title2'),
+                    ],
+                    colors=dict(Lbombicola_ESL0228_00004='#1984ff', Lbombicola_ESL0228_00500='#1984ff')
+                ),
+                dict(
+                    output='out/comparison.html',
+                    loci=[dict(gbk='Lbombicola_ESL0228.gbk', gene='Lbombicola_ESL0228_00004', title='title1')],
+                    span=10000,
+                    viewspan=3000
+                ),
+            ], f)
+
+        stdout = self.run_main(manifest, '--workers', '2', '--cache', os.path.join(self.tmp_dir, 'cache'))
+        self.assertIn('2 rendered, 0 skipped, 0 failed', stdout)
+        self.assertTrue(os.path.isfile(os.path.join(self.tmp_dir, 'out', 'comparison.svg')))
+        self.assertTrue(os.path.isfile(os.path.join(self.tmp_dir, 'out', 'comparison.html')))
+
+        stdout = self.run_main(manifest, '--workers', '2')
+        self.assertIn('0 rendered, 2 skipped, 0 failed', stdout)
+
+        stdout = self.run_main(manifest, '--workers', '1', '--force')
+        self.assertIn('2 rendered, 0 skipped, 0 failed', stdout)
+
+    def test_tsv(self):
+        manifest = os.path.join(self.tmp_dir, 'manifest.tsv')
+        with open(manifest, 'w') as f:
+            f.write('output\tgbk\tgene\ttitle\tcolor\tspan\n')
+            f.write('a.png\tLbombicola_ESL0228.gbk\tLbombicola_ESL0228_00004\ttitle1\t#1984ff\t4000\n')
+            f.write('a.png\tLbombicola_ESL0228.gbk\tLbombicola_ESL0228_00500\ttitle2\t\t\n')
+            f.write('b.svg\tLbombicola_ESL0228.gbk\tLbombicola_ESL0228_00001\ttitle3\t\t\n')
+
+        comparisons = read_manifest(manifest)
+        self.assertEqual(2, len(comparisons))
+        self.assertEqual(2, len(comparisons[0]['loci']))
+        self.assertEqual(dict(Lbombicola_ESL0228_00004='#1984ff'), comparisons[0]['colors'])
+        self.assertEqual(4000, comparisons[0]['span'])
+        self.assertNotIn('span', comparisons[1])
+
+        stdout = self.run_main(manifest, '--workers', '2')
+        self.assertIn('2 rendered, 0 skipped, 0 failed', stdout)
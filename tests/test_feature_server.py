@@ -0,0 +1,85 @@
+import os
+import json
+import urllib.request
+import urllib.error
+from unittest import TestCase
+from bokeh.models import AjaxDataSource
+from gene_loci_comparison import Locus
+from gene_loci_comparison.FeatureServer import FeatureServer
+
+assert os.path.isfile('tests/test_loci.py'), f'Please set working directory to git root!'
+
+new_prokka_file = 'tests/data/Prokka/Lbombicola_ESL0228.gbk'
+
+
+class TestFeatureServer(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FeatureServer([new_prokka_file], chunk_size=20000)
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_plot_bokeh(self):
+        locus = Locus(gbk_file=new_prokka_file, locus_tag='Lbombicola_ESL0228_00500')
+        bokeh = locus.plot_bokeh(feature_server=self.server)
+
+        source = bokeh.renderers[0].data_source
+        self.assertIsInstance(source, AjaxDataSource)
+        self.assertEqual([], source.data['xs'])  # nothing is sent with the figure
+        self.assertTrue(source.data_url.startswith(self.server.source_url(new_prokka_file, locus.locus_tag)))
+
+        with urllib.request.urlopen(source.data_url) as response:
+            self.assertEqual('*', response.headers['Access-Control-Allow-Origin'])
+            columns = json.load(response)
+        self.assertEqual({'patches', 'labels', 'segments'}, set(columns))
+        # the loaded chunks cover the crop window
+        self.assertLessEqual(set(locus.locus_tags()), set(columns['patches']['locus_tag']))
+
+    def test_chunks(self):
+        locus = Locus(gbk_file=new_prokka_file, locus_tag='Lbombicola_ESL0228_00500')
+        n_chunks = -(-len(locus.scaffold) // self.server.chunk_size)
+
+        # every feature of the scaffold is in exactly one chunk
+        locus_tags = []
+        for chunk in range(n_chunks):
+            columns = self.server.chunk('Lbombicola_ESL0228', locus.locus_tag, chunk, 4.)
+            locus_tags.extend(columns['patches']['locus_tag'])
+        expected = set(f.qualifiers['locus_tag'][0] for f in locus.scaffold.features if 'locus_tag' in f.qualifiers)
+        self.assertEqual(len(expected), len(locus_tags))
+        self.assertEqual(expected, set(locus_tags))
+
+        # features that reach into the next chunk do not collide with its features
+        server = FeatureServer([new_prokka_file], chunk_size=2000)
+        boxes = []
+        for chunk in range(40):
+            patches = server.chunk('Lbombicola_ESL0228', locus.locus_tag, chunk, 4.)['patches']
+            boxes.extend((min(xs), max(xs), min(ys), max(ys), chunk) for xs, ys in zip(patches['xs'], patches['ys']))
+        crossing = 0
+        for i, (x0, x1, y0, y1, chunk) in enumerate(boxes):
+            for other_x0, other_x1, other_y0, other_y1, other_chunk in boxes[i + 1:]:
+                if other_chunk != chunk and x0 < other_x1 and other_x0 < x1:
+                    crossing += 1
+                    self.assertTrue(y1 <= other_y0 or other_y1 <= y0)
+        self.assertGreater(crossing, 0)
+
+        self.assertEqual((5, 6), self.server.chunk_range(117000, 123000, len(locus.scaffold)))
+        self.assertEqual((5, 6), self.server.chunk_range(123000, 117000, len(locus.scaffold)))
+        first, last = self.server.chunk_range(0, len(locus.scaffold), len(locus.scaffold))
+        self.assertEqual(self.server.max_chunks, last - first + 1)
+
+        url = self.server.source_url(new_prokka_file, locus.locus_tag)
+        for request, status in [
+            (F'{self.server.url}/features/nonexistent/x?first=0&last=0&width=1', 404),
+            (F'{self.server.url}/other', 404),
+            (F'{url}?first=0&last={self.server.max_chunks}&width=1', 400),  # too many chunks
+            (F'{url}?first=-1&last=0&width=1', 400),
+            (F'{url}?first=0&last=0&width=nan', 400),
+            (F'{url}?first=0&width=1', 400),
+            (F'{self.server.source_url(new_prokka_file, "nonexistent")}?first=0&last=0&width=1', 404),
+        ]:
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                urllib.request.urlopen(request)
+            self.assertEqual(status, context.exception.code, request)
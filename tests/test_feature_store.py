@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from gene_loci_comparison import Locus, Loci
+from gene_loci_comparison.FeatureStore import FeatureStore, SEQUENCE_CHUNK_SIZE
+from gene_loci_comparison.GenbankIndex import GenbankIndex
+
+assert os.path.isfile('tests/test_loci.py'), f'Please set working directory to git root!'
+
+new_prokka_file = 'tests/data/Prokka/Lbombicola_ESL0228.gbk'
+
+
+class TestFeatureStore(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.store = FeatureStore(os.path.join(cls.tmp_dir, 'store.sqlite'))
+        cls.store.import_genbank(new_prokka_file)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.store.close()
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_same_as_genbank(self):
+        self.assertEqual(['Lbombicola_ESL0228'], self.store.genomes())
+        for locus_tag in ['Lbombicola_ESL0228_00001', 'Lbombicola_ESL0228_00500', 'Lbombicola_ESL0228_01649']:
+            for span in [1000, 30000]:
+                expected = Locus(gbk_file=new_prokka_file, locus_tag=locus_tag, span=span)
+                locus = Locus(gbk_file=self.store, locus_tag=locus_tag, span=span)
+                self.assertEqual(expected.gene_location, locus.gene_location)
+                self.assertEqual(expected.crop_window, locus.crop_window)
+                self.assertEqual(expected.scaffold_id, locus.scaffold_id)
+                self.assertEqual(expected.graphic_record.sequence, locus.graphic_record.sequence)
+                self.assertEqual(
+                    [(f.start, f.end, f.strand, f.label) for f in expected.graphic_record.features],
+                    [(f.start, f.end, f.strand, f.label) for f in locus.graphic_record.features]
+                )
+
+    def test_sequence_chunks(self):
+        scaffold, gene_location = GenbankIndex.load(new_prokka_file).get_scaffold_and_geneposition(
+            'Lbombicola_ESL0228_00500')
+        sequence = str(scaffold.seq)
+        stored, _ = self.store.get_scaffold_and_geneposition('Lbombicola_ESL0228_00500')
+        self.assertEqual(sequence, str(stored.seq))
+        for span in [1, SEQUENCE_CHUNK_SIZE // 2, SEQUENCE_CHUNK_SIZE, 3 * SEQUENCE_CHUNK_SIZE]:
+            stored, _ = self.store.get_scaffold_and_geneposition('Lbombicola_ESL0228_00500', span=span)
+            start, end = max(0, gene_location - span), min(len(sequence), gene_location + span)
+            self.assertEqual(sequence[start:end], str(stored.seq[start:end]))
+
+    def test_migrate(self):
+        # store with the sequences in records.sequence, written before sequence_chunks
+        db_file = os.path.join(self.tmp_dir, 'old.sqlite')
+        store = FeatureStore(db_file)
+        store.import_genbank(new_prokka_file)
+        connection = store.connection
+        connection.execute('ALTER TABLE records ADD COLUMN sequence TEXT')
+        for record, in connection.execute('SELECT id FROM records').fetchall():
+            chunks = connection.execute(
+                'SELECT sequence FROM sequence_chunks WHERE record = ? ORDER BY chunk', (record,)).fetchall()
+            connection.execute('UPDATE records SET sequence = ? WHERE id = ?',
+                               (b''.join(chunk for chunk, in chunks).decode('ascii'), record))
+        connection.execute('DROP TABLE sequence_chunks')
+        connection.commit()
+        store.close()
+
+        store = FeatureStore(db_file)
+        expected = Locus(gbk_file=self.store, locus_tag='Lbombicola_ESL0228_00500')
+        locus = Locus(gbk_file=store, locus_tag='Lbombicola_ESL0228_00500')
+        self.assertEqual(expected.graphic_record.sequence, locus.graphic_record.sequence)
+        self.assertNotIn('sequence', [name for _, name, *_ in store.connection.execute('PRAGMA table_info(records)')])
+        store.close()
+
+    def test_reimport(self):
+        self.store.import_genbank(new_prokka_file)
+        self.assertEqual(1, len(self.store.genomes()))
+
+        with self.assertRaises(ValueError):
+            self.store.import_genbank(new_prokka_file, genome='duplicate')
+
+    def test_nonexistent_gene(self):
+        with self.assertRaises(KeyError):
+            Locus(gbk_file=self.store, locus_tag='Lbombicola_ESL0228_00000')
+
+    def test_generate(self):
+        loci_of_interest = [
+            dict(gbk=self.store, gene='Lbombicola_ESL0228_00004', title='store'),
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00004', title='gbk'),
+        ]
+        locus_to_color_dict = {locus['gene']: '#1984ff' for locus in loci_of_interest}
+
+        loci = Loci.generate(loci_of_interest, locus_to_color_dict=locus_to_color_dict, workers=2)
+
+        self.assertEqual(loci.locus_tags()[0], loci.locus_tags()[1])
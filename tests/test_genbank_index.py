@@ -0,0 +1,141 @@
+import os
+import shutil
+import pickle
+import tempfile
+from unittest import TestCase
+from gene_loci_comparison.GenbankIndex import GenbankIndex, resolve_loci
+from gene_loci_comparison.utils import get_scaffold_and_geneposition, calc_gc_content, calc_gc_skew
+from gene_loci_comparison import Locus
+
+assert os.path.isfile('tests/test_loci.py'), f'Please set working directory to git root!'
+
+new_prokka_file = 'tests/data/Prokka/Lbombicola_ESL0228.gbk'
+
+
+class TestGenbankIndex(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.gbk_file = os.path.join(self.tmp_dir, 'Lbombicola_ESL0228.gbk')
+        shutil.copy(new_prokka_file, self.gbk_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_same_as_linear_scan(self):
+        index = GenbankIndex.load(self.gbk_file)
+        for locus_tag in ['Lbombicola_ESL0228_00001', 'Lbombicola_ESL0228_00004', 'Lbombicola_ESL0228_01500']:
+            scaffold, gene_location = index.get_scaffold_and_geneposition(locus_tag)
+            expected_scaffold, expected_gene_location = get_scaffold_and_geneposition(self.gbk_file, locus_tag)
+            self.assertEqual(expected_scaffold.id, scaffold.id)
+            self.assertEqual(str(expected_scaffold.seq), str(scaffold.seq))
+            self.assertEqual(len(expected_scaffold.features), len(scaffold.features))
+            self.assertEqual(expected_gene_location, gene_location)
+
+    def test_persistence(self):
+        index = GenbankIndex.load(self.gbk_file)
+        self.assertTrue(os.path.isfile(index.index_file))
+
+        GenbankIndex._loaded.clear()
+        reloaded = GenbankIndex.load(self.gbk_file)
+        self.assertIsNot(index, reloaded)
+        self.assertEqual(index.records, reloaded.records)
+        self.assertEqual(index.loci, reloaded.loci)
+
+    def test_memory_mapped_sequences(self):
+        index = GenbankIndex.load(self.gbk_file)
+        self.assertTrue(os.path.isfile(self.gbk_file + GenbankIndex.sequence_suffix))
+
+        scaffold, gene_location = index.get_scaffold_and_geneposition('Lbombicola_ESL0228_00500')
+        expected_scaffold, _ = get_scaffold_and_geneposition(self.gbk_file, 'Lbombicola_ESL0228_00500')
+        self.assertNotIsInstance(scaffold.seq._data, bytes)  # lazy: not read into memory
+        self.assertEqual(str(expected_scaffold.seq[1000:1100]), str(scaffold.seq[1000:1100]))
+        self.assertEqual(str(expected_scaffold.seq[-7:]), str(scaffold.seq[-7:]))
+        self.assertEqual(expected_scaffold.seq[42], scaffold.seq[42])
+        self.assertEqual(str(expected_scaffold.seq), str(pickle.loads(pickle.dumps(scaffold)).seq))
+
+        # a missing sequence file is rebuilt
+        os.remove(self.gbk_file + GenbankIndex.sequence_suffix)
+        GenbankIndex._loaded.clear()
+        index = GenbankIndex.load(self.gbk_file)
+        scaffold, gene_location = index.get_scaffold_and_geneposition('Lbombicola_ESL0228_00500')
+        self.assertEqual(str(expected_scaffold.seq), str(scaffold.seq))
+
+    def test_gc_tracks(self):
+        index = GenbankIndex.load(self.gbk_file)
+        # written on first use only
+        self.assertFalse(os.path.isfile(self.gbk_file + GenbankIndex.gc_suffix))
+        gc_tracks, key = index.get_gc_track('Lbombicola_ESL0228_00500')
+        self.assertTrue(os.path.isfile(self.gbk_file + GenbankIndex.gc_suffix))
+        GenbankIndex._loaded.clear()
+        self.assertIsNotNone(GenbankIndex.load(self.gbk_file).gc_tracks)  # saved in the index
+
+        scaffold, gene_location = index.get_scaffold_and_geneposition('Lbombicola_ESL0228_00500')
+        self.assertEqual(len(scaffold), gc_tracks.sequence_length(key))
+        sequence = bytes(scaffold.seq)
+        for start, end, window_bp, step in [(0, len(sequence), 1000, 1), (5000, 90000, 100, 7), (123, 140, 20, 1)]:
+            for track, calc in [(gc_tracks.gc_content, calc_gc_content), (gc_tracks.gc_skew, calc_gc_skew)]:
+                starts, values = track(key, start, end, window_bp=window_bp, step=step)
+                expected_starts, expected_values = calc(sequence[start:end], window_bp=window_bp, step=step)
+                self.assertEqual(list(expected_starts), list(starts))
+                self.assertEqual(list(expected_values), list(values))
+
+        # plot_gc and plot_bokeh_gc read the track
+        locus = Locus(gbk_file=self.gbk_file, locus_tag='Lbombicola_ESL0228_00500')
+        self.assertIsNotNone(locus._gc_track())
+        starts, gc = locus.gc_content(window_bp=100)
+        start = locus.crop_window[0] - 100
+        self.assertEqual(start, starts[0])
+        self.assertEqual(list(calc_gc_content(sequence[start:locus.crop_window[1] + 100])[1]), list(gc))
+        bokeh = locus.plot_bokeh_gc(locus.plot_bokeh().x_range, window_bp=100, step=10)
+        self.assertEqual(len(starts[::10]), len(bokeh.renderers[0].data_source.data['x']))
+
+        self.assertIs(locus._gc_track(), locus.with_span(1000)._gc_track())  # looked up once
+
+        # windows beyond the range of the track are counted in the sequence
+        window_bp = gc_tracks.max_window_bp + 1
+        starts, gc = locus.gc_content(window_bp=window_bp, step=1000)
+        start = max(0, locus.crop_window[0] - window_bp)
+        expected = calc_gc_content(sequence[start:locus.crop_window[1] + window_bp], window_bp=window_bp, step=1000)[1]
+        self.assertEqual(list(expected), list(gc))
+        with self.assertRaises(ValueError):
+            gc_tracks.gc_content(key, 0, len(sequence), window_bp=window_bp)
+
+        # a missing track file is rebuilt
+        os.remove(self.gbk_file + GenbankIndex.gc_suffix)
+        GenbankIndex._loaded.clear()
+        index = GenbankIndex.load(self.gbk_file)
+        self.assertIsNotNone(index.get_gc_track('Lbombicola_ESL0228_00500'))
+        self.assertTrue(index.gc_tracks.is_complete())
+
+    def test_rebuild_on_change(self):
+        index = GenbankIndex.load(self.gbk_file)
+        self.assertIn('Lbombicola_ESL0228_00001', index)
+
+        with open(self.gbk_file, 'w') as f:
+            f.write(open(new_prokka_file).read().replace('Lbombicola_ESL0228_00001', 'Renamed_00001'))
+
+        index = GenbankIndex.load(self.gbk_file)
+        self.assertNotIn('Lbombicola_ESL0228_00001', index)
+        self.assertIn('Renamed_00001', index)
+
+    def test_nonexistent_gene(self):
+        with self.assertRaises(KeyError):
+            GenbankIndex.load(self.gbk_file).get_scaffold_and_geneposition('Lbombicola_ESL0228_00000')
+
+    def test_resolve_loci(self):
+        requests = [
+            (self.gbk_file, 'Lbombicola_ESL0228_00004'),
+            (new_prokka_file, 'Lbombicola_ESL0228_00004'),
+            (self.gbk_file, 'Lbombicola_ESL0228_00001'),
+            (self.gbk_file, 'Lbombicola_ESL0228_01500'),
+        ]
+        resolved = resolve_loci(requests)
+        self.assertEqual(len(requests), len(resolved))
+        for (gbk_file, locus_tag), (scaffold, gene_location) in zip(requests, resolved):
+            self.assertEqual(GenbankIndex.load(gbk_file).loci[locus_tag][1], scaffold.id)
+            self.assertEqual(GenbankIndex.load(gbk_file).loci[locus_tag][2], gene_location)
+
+        # same scaffold in the same file: shared SeqRecord
+        self.assertIs(resolved[0][0], resolved[2][0])
+        # same scaffold in a different file: not shared
+        self.assertIsNot(resolved[0][0], resolved[1][0])
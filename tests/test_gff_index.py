@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+from urllib.parse import quote
+from unittest import TestCase
+from Bio import SeqIO
+from gene_loci_comparison import Locus, Loci
+from gene_loci_comparison.GenbankIndex import GenbankIndex, load_index
+from gene_loci_comparison.GffIndex import GffIndex
+
+assert os.path.isfile('tests/test_loci.py'), f'Please set working directory to git root!'
+
+new_prokka_file = 'tests/data/Prokka/Lbombicola_ESL0228.gbk'
+
+
+def write_gff(gbk_file: str, gff_file: str, fasta_file: str = None):
+    """convert a GenBank file to GFF3, with the sequences in fasta_file or in a ##FASTA section"""
+    records = list(SeqIO.parse(gbk_file, 'genbank'))
+    with open(gff_file, 'w') as f:
+        f.write('##gff-version 3\n')
+        for record in records:
+            f.write(F'##sequence-region {record.id} 1 {len(record)}\n')
+        for record in records:
+            for i, feature in enumerate(record.features):
+                if feature.type == 'source':
+                    continue
+                attributes = [F'ID={record.id}_{i}'] + [
+                    F'{quote(key)}={",".join(quote(value, safe=" ") for value in values)}'
+                    for key, values in feature.qualifiers.items() if key != 'translation'
+                ]
+                for part in feature.location.parts:
+                    strand = {1: '+', -1: '-'}.get(part.strand, '.')
+                    f.write(F'{record.id}\tProkka\t{feature.type}\t{part.start + 1}\t{part.end}\t.\t{strand}\t.\t'
+                            F'{";".join(attributes)}\n')
+            f.write('###\n')
+        if fasta_file is None:
+            f.write('##FASTA\n')
+    with open(gff_file if fasta_file is None else fasta_file, 'a') as f:
+        SeqIO.write(records, f, 'fasta')
+
+
+class TestGffIndex(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.gff_file = os.path.join(cls.tmp_dir, 'Lbombicola_ESL0228.gff')
+        write_gff(new_prokka_file, cls.gff_file)
+        cls.pgap_style_file = os.path.join(cls.tmp_dir, 'annot.gff3')
+        write_gff(new_prokka_file, cls.pgap_style_file, fasta_file=os.path.join(cls.tmp_dir, 'annot.fna'))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_same_as_genbank(self):
+        genbank_index = GenbankIndex.load(new_prokka_file)
+        for gff_file in [self.gff_file, self.pgap_style_file]:
+            index = load_index(gff_file)
+            self.assertIsInstance(index, GffIndex)
+            self.assertEqual({locus_tag: (record_id, gene_location)
+                              for locus_tag, (offset, record_id, gene_location) in genbank_index.loci.items()},
+                             {locus_tag: (record_id, gene_location)
+                              for locus_tag, (seqid, record_id, gene_location) in index.loci.items()})
+
+            for locus_tag in ['Lbombicola_ESL0228_00001', 'Lbombicola_ESL0228_00500', 'Lbombicola_ESL0228_01500']:
+                expected = Locus(gbk_file=new_prokka_file, locus_tag=locus_tag)
+                locus = Locus(gbk_file=gff_file, locus_tag=locus_tag)
+                self.assertEqual(expected.crop_window, locus.crop_window)
+                self.assertEqual(expected.graphic_record.sequence, locus.graphic_record.sequence)
+                self.assertEqual(
+                    [(f.start, f.end, f.strand, f.label, f.color) for f in expected.graphic_record.features],
+                    [(f.start, f.end, f.strand, f.label, f.color) for f in locus.graphic_record.features]
+                )
+                self.assertEqual(list(expected.gc_content()[1]), list(locus.gc_content()[1]))
+
+    def test_streaming(self):
+        index = GffIndex.load(self.gff_file)
+        scaffold, gene_location = index.get_scaffold_and_geneposition('Lbombicola_ESL0228_00500', span=3000)
+        complete, _ = index.get_scaffold_and_geneposition('Lbombicola_ESL0228_00500')
+        # only the features in the window are parsed, the sequence is complete
+        self.assertLess(len(scaffold.features), len(complete.features) / 10)
+        for f in scaffold.features:
+            self.assertTrue(f.location.end >= gene_location - 3000 and f.location.start <= gene_location + 3000)
+        self.assertEqual(len(complete), len(scaffold.seq))
+
+        # loci on the same sequence share the SeqRecord
+        resolved = index.get_scaffolds_and_genepositions(
+            ['Lbombicola_ESL0228_00500', 'Lbombicola_ESL0228_00510'], span=3000)
+        self.assertIs(resolved['Lbombicola_ESL0228_00500'][0], resolved['Lbombicola_ESL0228_00510'][0])
+
+        loci = Loci.generate([dict(gbk=self.gff_file, gene='Lbombicola_ESL0228_00500', title='gff'),
+                              dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00500', title='gbk')],
+                             locus_to_color_dict={'Lbombicola_ESL0228_00500': '#1984ff'})
+        self.assertEqual(loci.loci[1].locus_tags(), loci.loci[0].locus_tags())
+
+    def test_joined_features(self):
+        gff_file = os.path.join(self.tmp_dir, 'joined.gff')
+        with open(gff_file, 'w') as f:
+            f.write('##gff-version 3\n'
+                    'scf1\tPGAP\tgene\t101\t400\t.\t-\t.\tID=gene-A_1;locus_tag=A_1\n'
+                    'scf1\tPGAP\tCDS\t301\t400\t.\t-\t0\tID=cds-A_1;Parent=gene-A_1;locus_tag=A_1;product=x%2C y\n'
+                    'scf1\tPGAP\tCDS\t101\t299\t.\t-\t0\tID=cds-A_1;Parent=gene-A_1;locus_tag=A_1;product=x%2C y\n'
+                    '##FASTA\n>scf1 description\n' + 'ACGT' * 100 + '\n' + 'GC' * 50 + '\n')
+        index = GffIndex.load(gff_file)
+        scaffold, gene_location = index.get_scaffold_and_geneposition('A_1')
+        self.assertEqual(500, len(scaffold))
+        self.assertEqual(250, gene_location)
+        gene, cds = scaffold.features
+        self.assertEqual(['x, y'], cds.qualifiers['product'])
+        self.assertEqual([(300, 400), (100, 299)], [(p.start, p.end) for p in cds.location.parts])
+        self.assertEqual(-1, cds.location.strand)
+
+    def test_joined_feature_at_window_edge(self):
+        gff_file = os.path.join(self.tmp_dir, 'edge.gff')
+        with open(gff_file, 'w') as f:
+            f.write('##gff-version 3\n'
+                    'scf1\tPGAP\tgene\t1001\t1300\t.\t+\t.\tID=gene-B_1;locus_tag=B_1\n'
+                    'scf1\tPGAP\tCDS\t5001\t9000\t.\t+\t0\tID=cds-B_2;locus_tag=B_2\n'
+                    'scf1\tPGAP\tCDS\t9101\t9400\t.\t+\t0\tID=cds-B_2;locus_tag=B_2\n'
+                    '##FASTA\n>scf1\n' + 'ACGT' * 2500 + '\n')
+        index = GffIndex.load(gff_file)
+        scaffold, gene_location = index.get_scaffold_and_geneposition('B_1', span=4000)  # window 0 to 5150
+        gene, cds = scaffold.features
+        self.assertEqual([(5000, 9000), (9100, 9400)], [(p.start, p.end) for p in cds.location.parts])
@@ -1,9 +1,14 @@
 import os
+import json
+import tempfile
+import xml.etree.ElementTree as ET
 from unittest import TestCase
-from gene_loci_comparison import Loci
+from gene_loci_comparison import Locus, Loci
+from gene_loci_comparison.Loci import LocusError
 import matplotlib
 from bokeh.layouts import column
 from bokeh.plotting import output_file, show, save
+from bokeh.models import TapTool
 
 matplotlib.rcParams['font.family'] = "PT Sans Narrow"
 
@@ -98,6 +103,44 @@ class TestLocus(TestCase):
         else:
             plot.show()
 
+    def test_same_file(self):
+        loci_of_interest = [
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00004', title='title1'),
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00001', title='title2'),
+        ]
+
+        locus_to_color_dict = {locus['gene']: '#1984ff' for locus in loci_of_interest}
+
+        loci = Loci.generate(loci_of_interest, locus_to_color_dict=locus_to_color_dict)
+
+        self.assertIs(loci.loci[0].scaffold, loci.loci[1].scaffold)
+        self.assertEqual(['title1', 'title2'], [locus.title for locus in loci.loci])
+        self.assertIn('Lbombicola_ESL0228_00004', loci.locus_tags()[0])
+        self.assertIn('Lbombicola_ESL0228_00001', loci.locus_tags()[1])
+
+    def test_workers(self):
+        loci_of_interest = [
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00004', title='title1'),
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00500', title='title2'),
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00001', title='title3'),
+        ]
+
+        locus_to_color_dict = {locus['gene']: '#1984ff' for locus in loci_of_interest}
+
+        sequential = Loci.generate(loci_of_interest, locus_to_color_dict=locus_to_color_dict)
+        parallel = Loci.generate(loci_of_interest, locus_to_color_dict=locus_to_color_dict, workers=2)
+
+        self.assertEqual(sequential.locus_tags(), parallel.locus_tags())
+        self.assertEqual(['title1', 'title2', 'title3'], [locus.title for locus in parallel.loci])
+
+        with self.assertRaises(LocusError) as cm:
+            Loci.generate(
+                loci_of_interest + [dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00000', title='bad')],
+                locus_to_color_dict=locus_to_color_dict,
+                workers=2
+            )
+        self.assertEqual('bad', cm.exception.locus_of_interest['title'])
+
     def test_multiple_bokeh(self):
         loci_of_interest = [
             dict(gbk=prokka_file, gene='FAM3257_00934', title='title1'),
@@ -123,3 +166,130 @@ class TestLocus(TestCase):
             save(bokeh)
         else:
             show(bokeh)
+
+    def test_export(self):
+        loci_of_interest = [
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00004', title='title1'),
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00500', title='title2'),
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_01500', title='title3'),
+        ]
+        loci = Loci.generate(loci_of_interest, locus_to_color_dict={'Lbombicola_ESL0228_00004': '#1984ff'})
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            loci.export(os.path.join(tmp_dir, 'loci.svg'))
+            svg = ET.parse(os.path.join(tmp_dir, 'loci.svg')).getroot()
+            nested = svg.findall('{http://www.w3.org/2000/svg}svg')
+            self.assertEqual(3, len(nested))
+            self.assertEqual(['0.0', '144.0', '288.0'], [s.get('y') for s in nested])
+            self.assertEqual('432.0pt', svg.get('height'))
+
+            loci.export(os.path.join(tmp_dir, 'loci.png'), gc=True, gc_skew=True, dpi=50)
+            image = matplotlib.image.imread(os.path.join(tmp_dir, 'loci.png'))
+            self.assertEqual((3 * 3 * 50, 10 * 50, 4), image.shape)
+
+            loci.export(os.path.join(tmp_dir, 'loci.pdf'))
+            with open(os.path.join(tmp_dir, 'loci.pdf'), 'rb') as f:
+                self.assertEqual(3, f.read().count(b'/Type /Page '))
+
+    def test_bokeh_sync_broadcast(self):
+        loci_of_interest = [
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00004', title='title1'),
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00500', title='title2'),
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_01500', title='title3'),
+        ]
+        loci = Loci.generate(loci_of_interest, locus_to_color_dict={})
+
+        plots = loci.plot_bokeh(sync='broadcast')
+
+        # one shared callback on start and end of every x_range
+        callbacks = {
+            id(cb)
+            for p in plots for attr in ['start', 'end'] for cb in p.x_range.js_property_callbacks[F'change:{attr}']
+        }
+        self.assertEqual(1, len(callbacks))
+        callback = plots[0].x_range.js_property_callbacks['change:start'][0]
+        self.assertEqual([p.x_range for p in plots], callback.args['ranges'])
+        self.assertEqual([False, False, True], callback.args['reversed'])
+
+        plots = loci.plot_bokeh(sync='pairs')
+        # first plot: one callback per other plot
+        self.assertEqual(2, len(plots[0].x_range.js_property_callbacks['change:start']))
+
+    def test_bokeh_json_item(self):
+        loci_of_interest = [
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00004', title='title1'),
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_01500', title='title2'),
+        ]
+        loci = Loci.generate(loci_of_interest, locus_to_color_dict={'Lbombicola_ESL0228_00004': '#1984ff'})
+
+        item = loci.bokeh_json_item(target='loci')
+        typed_item = loci.bokeh_json_item(target='loci', typed_arrays=True)
+        self.assertEqual('loci', item['target_id'])
+        self.assertEqual(typed_item['root_id'], json.loads(json.dumps(typed_item))['root_id'])
+
+        # typed arrays: four numbers per feature and the color as index into the palette
+        plot = loci.plot_bokeh_panel(typed_arrays=True)
+        data = plot.renderers[0].data_source.data
+        n_features = sum(len(locus.graphic_record.features) for locus in loci.loci)
+        for name in ['x1', 'head', 'x2', 'y', 'color', 'feature']:
+            self.assertEqual((n_features,), data[name].shape)
+        feature_texts = plot.select_one(TapTool).callback.args['feature_texts'].data
+        locus_tags = [feature_texts['locus_tag'][i] for i in data['feature']]
+        self.assertEqual([tag for locus in loci.loci for tag in locus.locus_tags()], locus_tags)
+        palette = plot.renderers[0].glyph.fill_color.transform.palette
+        self.assertEqual('#1984ff', palette[data['color'][locus_tags.index('Lbombicola_ESL0228_00004')]])
+        labels = plot.renderers[1].data_source.data
+        self.assertEqual(loci.plot_bokeh_panel().renderers[1].data_source.data['text'],
+                         [feature_texts['label'][i] for i in labels['feature']])
+
+        # features shown in several rows: their texts are sent once
+        neighbours = Loci.generate([dict(gbk=new_prokka_file, gene=F'Lbombicola_ESL0228_0000{i}', title=str(i))
+                                    for i in (4, 5)], locus_to_color_dict={})
+        plot = neighbours.plot_bokeh_panel(typed_arrays=True)
+        n_features = sum(len(locus.graphic_record.features) for locus in neighbours.loci)
+        n_texts = len(plot.select_one(TapTool).callback.args['feature_texts'].data['locus_tag'])
+        self.assertLess(n_texts, n_features)
+
+        script, div = loci.bokeh_components(panel=False)
+        self.assertIn('<script', script)
+        self.assertIn('<div', div)
+
+        # plots of plot_bokeh share one tap callback
+        callbacks = {id(p.select_one(TapTool).callback) for p in loci.plot_bokeh()}
+        self.assertEqual(1, len(callbacks))
+
+    def test_bokeh_panel(self):
+        loci_of_interest = [
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00004', title='title1'),
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_01500', title='title2'),
+        ]
+
+        loci = Loci.generate(loci_of_interest, locus_to_color_dict={'Lbombicola_ESL0228_00004': '#1984ff'})
+
+        plot = loci.plot_bokeh_panel(viewspan=1000)
+
+        # one figure, one source per glyph type: all features of all loci
+        patches = plot.renderers[0].data_source.data
+        self.assertEqual(sum(len(locus.graphic_record.features) for locus in loci.loci), len(patches['xs']))
+        self.assertEqual((-1000, 1000), (plot.x_range.start, plot.x_range.end))
+        self.assertEqual(['title1', 'title2'], list(plot.yaxis[0].major_label_overrides.values()))
+
+        # the genes of interest are centered, the backward gene is mirrored to point to the right
+        for locus in loci.loci:
+            i = patches['locus_tag'].index(locus.locus_tag)
+            xs = patches['xs'][i]
+            self.assertLess(min(xs), 0)
+            self.assertGreater(max(xs), 0)
+            self.assertEqual(max(xs), xs[3])  # arrow head
+
+        if save_plots:
+            output_file(filename='tests/output/loci/test_bokeh_panel.html', )
+            save(plot)
+
+        # no drawable features and no viewspan: the x_range covers the crop windows
+        data = loci.loci[0].to_dict()
+        data.update(features=[], add_start_end_feature=False)
+        locus = Locus.from_dict(data)
+        plot = Loci([locus]).plot_bokeh_panel(auto_reverse=False)
+        self.assertEqual([x - locus.gene_location for x in locus.crop_window],
+                         [plot.x_range.start, plot.x_range.end])
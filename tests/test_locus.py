@@ -1,4 +1,6 @@
 import os
+import json
+import pickle
 from unittest import TestCase
 from gene_loci_comparison import Locus
 import matplotlib
@@ -85,6 +87,18 @@ class TestLocus(TestCase):
         else:
             plt.show()
 
+    def test_gc_skew(self):
+        locus_tag = 'Lbombicola_ESL0228_00004'
+
+        locus = Locus(gbk_file=new_prokka_file, locus_tag=locus_tag, span=10000)
+
+        ax1, ax2, ax3 = locus.plot_gc(figure_width=12, window_bp=100, step=10, gc_skew=True)
+
+        if save_plots:
+            plt.savefig('tests/output/locus/test_gc_skew.svg', format='svg')
+        else:
+            plt.show()
+
     def test_to_string(self):
         locus_tag = 'FAM3257_000993'
 
@@ -95,6 +109,142 @@ class TestLocus(TestCase):
         with open('tests/output/locus/test_to_string.svg', 'w') as f:
             f.write(svg_string)
 
+    def test_lazy(self):
+        for locus_tag in ['Lbombicola_ESL0228_00001', 'Lbombicola_ESL0228_00500', 'Lbombicola_ESL0228_01500']:
+            eager = Locus(gbk_file=new_prokka_file, locus_tag=locus_tag)
+            lazy = Locus(gbk_file=new_prokka_file, locus_tag=locus_tag, lazy=True)
+            self.assertNotIn('scaffold', lazy.__dict__)
+
+            # no GraphicRecord needed
+            self.assertEqual(eager.gene_location, lazy.gene_location)
+            self.assertEqual(eager.locus_tags(), lazy.locus_tags())
+            self.assertEqual(eager.is_backward, lazy.is_backward)
+            self.assertNotIn('graphic_record', lazy.__dict__)
+
+            lazy.colorize({locus_tag: '#1984ff'})
+            self.assertEqual(
+                [(f.start, f.end, f.label) for f in eager.graphic_record.features],
+                [(f.start, f.end, f.label) for f in lazy.graphic_record.features]
+            )
+
+        with self.assertRaises(AttributeError):
+            lazy.nonexistent_attribute
+
+    def test_with_span_and_recenter(self):
+        locus = Locus(gbk_file=new_prokka_file, locus_tag='Lbombicola_ESL0228_00500', span=2000, max_span=10000)
+        locus.colorize({'Lbombicola_ESL0228_00500': '#1984ff'})
+
+        for span in [500, 10000]:
+            narrow = locus.with_span(span)
+            expected = Locus(gbk_file=new_prokka_file, locus_tag='Lbombicola_ESL0228_00500', span=span)
+            self.assertEqual(expected.crop_window, narrow.crop_window)
+            self.assertEqual(expected.locus_tags(), narrow.locus_tags())
+            self.assertEqual(expected.graphic_record.sequence, narrow.graphic_record.sequence)
+            # colors are kept
+            self.assertEqual(['#1984ff'], [f.color for f in narrow.graphic_record.features
+                                           if f.color != '#ffffff'])
+
+        self.assertEqual(2000, locus.span)  # unchanged
+
+        recentered = locus.recenter('Lbombicola_ESL0228_00502')
+        expected = Locus(gbk_file=new_prokka_file, locus_tag='Lbombicola_ESL0228_00502', span=2000)
+        self.assertEqual(expected.gene_location, recentered.gene_location)
+        self.assertEqual(expected.locus_tags(), recentered.locus_tags())
+        self.assertEqual(expected.is_backward, recentered.is_backward)
+
+        with self.assertRaises(ValueError):
+            locus.with_span(20000)
+
+        # copies do not share colors and labels with the original
+        narrow = locus.with_span(500)
+        narrow.colorize({'Lbombicola_ESL0228_00500': '#00ff00'})
+        narrow.rename_labels({'Lbombicola_ESL0228_00500': 'NEW'})
+        self.assertEqual({'#1984ff', '#ffffff'}, set(f.color for f in locus.with_span(3000).graphic_record.features))
+        self.assertNotIn('NEW', [f.label for f in locus.with_span(3000).graphic_record.features])
+
+    def test_lazy_with_span(self):
+        locus = Locus(gbk_file=new_prokka_file, locus_tag='Lbombicola_ESL0228_00500', lazy=True, max_span=10000)
+        narrow = locus.with_span(500)
+        expected = Locus(gbk_file=new_prokka_file, locus_tag='Lbombicola_ESL0228_00500', span=500)
+        self.assertEqual(expected.locus_tags(), narrow.locus_tags())
+        self.assertNotIn('_pending', narrow.__dict__)
+
+        lazy = Locus(gbk_file=new_prokka_file, locus_tag='Lbombicola_ESL0228_00500', lazy=True, max_span=10000)
+        recentered = lazy.recenter('Lbombicola_ESL0228_00502')
+        self.assertEqual('Lbombicola_ESL0228_00502', recentered.locus_tag)
+
+    def test_level_of_detail(self):
+        locus = Locus(gbk_file=new_prokka_file, locus_tag='Lbombicola_ESL0228_00500', span=30000)
+        n_features = len(locus.graphic_record.features)
+
+        for viewspan, detail_visible in [(None, False), (2000, True)]:
+            bokeh = locus.plot_bokeh(viewspan=viewspan, detail_span=5000)
+            detail = [r for r in bokeh.renderers if type(r.glyph).__name__ != 'Quad']
+            summaries = [r for r in bokeh.renderers if type(r.glyph).__name__ == 'Quad']
+            self.assertEqual(3, len(detail))
+            self.assertEqual(n_features, len(detail[0].data_source.data['xs']))
+            self.assertEqual([detail_visible] * 3, [r.visible for r in detail])
+            self.assertEqual(0 if detail_visible else 1, sum(r.visible for r in summaries))
+        self.assertGreater(len(summaries), 1)
+
+    def test_layout_cache(self):
+        locus = Locus(gbk_file=new_prokka_file, locus_tag='Lbombicola_ESL0228_00500')
+        ax, (features_levels, labels_data) = locus.plot(figure_width=12)
+        plt.close(ax.figure)
+
+        # plot_bokeh and bokeh_glyph_data reuse the layout of plot
+        graphic_record_plot = locus.graphic_record.plot
+        locus.graphic_record.plot = None
+        self.assertIs(features_levels, locus.layout(figure_width=12)[0])
+        locus.plot_bokeh(figure_width=12)
+        locus.bokeh_glyph_data(figure_width=12)
+        locus.graphic_record.plot = graphic_record_plot
+
+        # colors do not change the layout, labels do
+        locus.colorize({'Lbombicola_ESL0228_00500': '#1984ff'})
+        self.assertIs(features_levels, locus.layout(figure_width=12)[0])
+        locus.rename_labels({'Lbombicola_ESL0228_00500': 'a much longer label than before'})
+        self.assertIsNot(features_levels, locus.layout(figure_width=12)[0])
+        self.assertIsNot(locus.layout(figure_width=12), locus.layout(figure_width=8))
+        layout = locus.layout(figure_width=12)
+        locus.clear_layout_cache()
+        self.assertIsNot(layout, locus.layout(figure_width=12))
+
+        # laid out without pyplot (arender lays out in threads), at the height of GraphicRecord.plot without ax
+        figures = plt.get_fignums()
+        _, _, size_inches = locus.layout(figure_width=10)
+        self.assertEqual(figures, plt.get_fignums())
+        ax, _ = locus.graphic_record.plot(figure_width=10)
+        self.assertEqual(tuple(ax.figure.get_size_inches()), size_inches)
+        plt.close(ax.figure)
+
+    def test_compact_state(self):
+        locus_tag = 'Lbombicola_ESL0228_00500'
+
+        locus = Locus(gbk_file=new_prokka_file, locus_tag=locus_tag, title='compact')
+        locus.colorize({locus_tag: '#1984ff'})
+
+        pickled = pickle.dumps(locus)
+        self.assertLess(len(pickled), len(pickle.dumps(locus.scaffold)) / 10)
+
+        for restored in [pickle.loads(pickled), Locus.from_dict(json.loads(json.dumps(locus.to_dict())))]:
+            self.assertEqual(locus.locus_tags(), restored.locus_tags())
+            self.assertEqual(locus.is_backward, restored.is_backward)
+            self.assertEqual(locus.crop_window, restored.crop_window)
+            self.assertEqual(locus.gene_location, restored.gene_location)
+            self.assertEqual(locus.scaffold_id, restored.scaffold_id)
+            self.assertEqual(
+                [(f.start, f.end, f.strand, f.label, f.color) for f in locus.graphic_record.features],
+                [(f.start, f.end, f.strand, f.label, f.color) for f in restored.graphic_record.features]
+            )
+
+            restored.plot_gc(figure_width=12, window_bp=100)
+
+            if save_plots:
+                plt.savefig('tests/output/locus/test_compact_state.svg', format='svg')
+            else:
+                plt.show()
+
     def test_scf_end(self):
         locus_tag = 'FAM3257_00098'
 
@@ -0,0 +1,129 @@
+import os
+import pickle
+import shutil
+import tempfile
+from unittest import TestCase
+from gene_loci_comparison import Loci, Locus
+from gene_loci_comparison.LocusCache import LocusCache
+
+assert os.path.isfile('tests/test_loci.py'), f'Please set working directory to git root!'
+
+new_prokka_file = 'tests/data/Prokka/Lbombicola_ESL0228.gbk'
+
+
+class _OldLocus:
+    """unpickles as a Locus with a state layout that Locus.__setstate__ does not know"""
+
+    def __reduce__(self):
+        return Locus.__new__, (Locus,), dict(old_layout=True)
+
+
+class TestLocusCache(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_hit_and_miss(self):
+        cache = LocusCache(self.cache_dir)
+
+        locus = cache.get_locus(new_prokka_file, 'Lbombicola_ESL0228_00004', title='first')
+        self.assertEqual(dict(hits=0, misses=1, entries=1), {k: v for k, v in cache.stats().items() if k != 'bytes'})
+
+        cached = cache.get_locus(new_prokka_file, 'Lbombicola_ESL0228_00004', title='second')
+        self.assertEqual(1, cache.hits)
+        self.assertEqual('second', cached.title)
+        self.assertEqual(locus.locus_tags(), cached.locus_tags())
+
+        # colorizing the cached copy does not change the cache
+        cached.colorize({'Lbombicola_ESL0228_00004': '#1984ff'})
+        cached = cache.get_locus(new_prokka_file, 'Lbombicola_ESL0228_00004')
+        self.assertNotIn('#1984ff', [f.color for f in cached.graphic_record.features])
+
+        # different span: different entry
+        cache.get_locus(new_prokka_file, 'Lbombicola_ESL0228_00004', span=5000)
+        self.assertEqual(2, cache.misses)
+        self.assertEqual(2, cache.stats()['entries'])
+
+    def test_unreadable_entry(self):
+        cache = LocusCache(self.cache_dir)
+        key = cache.key(new_prokka_file, 'Lbombicola_ESL0228_00004', 3000, Locus.default_description_order, True)
+
+        for content in [pickle.dumps(_OldLocus()), b'truncated']:
+            with open(cache._path(key), 'wb') as f:
+                f.write(content)
+            self.assertIsNone(cache.get(key))
+            self.assertFalse(os.path.isfile(cache._path(key)))
+
+        locus = cache.get_locus(new_prokka_file, 'Lbombicola_ESL0228_00004')  # rebuilt
+        self.assertEqual('Lbombicola_ESL0228_00004', locus.locus_tag)
+        self.assertEqual(3, cache.misses)
+
+    def test_content_hash(self):
+        cache = LocusCache(self.cache_dir, hash_content=True)
+        copy = os.path.join(self.cache_dir, 'copy.gbk')
+        shutil.copy(new_prokka_file, copy)
+        cache.get_locus(new_prokka_file, 'Lbombicola_ESL0228_00004')
+        cached = cache.get_locus(copy, 'Lbombicola_ESL0228_00004')
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(copy, cached.gbk_file)
+
+    def test_eviction(self):
+        cache = LocusCache(self.cache_dir)
+        locus_tags = ['Lbombicola_ESL0228_00001', 'Lbombicola_ESL0228_00004', 'Lbombicola_ESL0228_00500']
+        for locus_tag in locus_tags:
+            cache.get_locus(new_prokka_file, locus_tag)
+        entry_size = cache.stats()['bytes'] / 3
+
+        # use the first entry, so the second is the least recently used
+        cache.get_locus(new_prokka_file, locus_tags[0])
+
+        cache.max_bytes = 2.5 * entry_size
+        cache.evict()
+        self.assertEqual(2, cache.stats()['entries'])
+        cache.get_locus(new_prokka_file, locus_tags[0])
+        cache.get_locus(new_prokka_file, locus_tags[2])
+        self.assertEqual(3, cache.hits)
+
+    def test_put(self):
+        cache = LocusCache(self.cache_dir)
+        locus = Locus(gbk_file=new_prokka_file, locus_tag='Lbombicola_ESL0228_00004')
+        cache.put('a', locus)
+        entry_size = cache.stats()['bytes']
+
+        # the directory is scanned only when the size of the entries exceeds max_bytes
+        cache._entries = None
+        cache.put('a', locus)
+        cache.put('b', locus)
+        self.assertEqual(2 * entry_size, cache._bytes)
+        del cache._entries
+        cache.max_bytes = 2.5 * entry_size
+        cache.put('c', locus)
+        self.assertEqual(2, cache.stats()['entries'])
+
+        # a failed write leaves no temporary file behind
+        with self.assertRaises((AttributeError, pickle.PicklingError)):
+            cache.put('d', lambda: None)
+        self.assertEqual(['b', 'c'], sorted(name.split('.')[0] for name in os.listdir(self.cache_dir)))
+
+        cache.clear()
+        cache.clear()
+        self.assertEqual(0, cache.stats()['entries'])
+
+    def test_generate(self):
+        cache = LocusCache(self.cache_dir)
+        loci_of_interest = [
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00004', title='title1'),
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00500', title='title2'),
+        ]
+        locus_to_color_dict = {locus['gene']: '#1984ff' for locus in loci_of_interest}
+
+        loci = Loci.generate(loci_of_interest, locus_to_color_dict=locus_to_color_dict, cache=cache)
+        cached_loci = Loci.generate(loci_of_interest, locus_to_color_dict=locus_to_color_dict, cache=cache)
+
+        self.assertEqual(dict(hits=2, misses=2), dict(hits=cache.hits, misses=cache.misses))
+        self.assertEqual(loci.locus_tags(), cached_loci.locus_tags())
+        self.assertEqual(['title1', 'title2'], [locus.title for locus in cached_loci.loci])
+        for locus in cached_loci.loci:
+            self.assertIn('#1984ff', [f.color for f in locus.graphic_record.features])
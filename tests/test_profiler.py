@@ -0,0 +1,65 @@
+import os
+from unittest import TestCase
+import matplotlib.pyplot as plt
+from gene_loci_comparison import Loci, Locus
+from gene_loci_comparison.Profiler import Profiler, stage
+
+assert os.path.isfile('tests/test_loci.py'), f'Please set working directory to git root!'
+
+new_prokka_file = 'tests/data/Prokka/Lbombicola_ESL0228.gbk'
+
+
+class TestProfiler(TestCase):
+    def test_stages(self):
+        recorded = []
+        loci_of_interest = [
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00004', title='title1'),
+            dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00500', title='title2'),
+        ]
+        with Profiler(trace_memory=True, callbacks=[lambda *args: recorded.append(args)]) as profiler:
+            loci = Loci.generate(loci_of_interest, locus_to_color_dict={'Lbombicola_ESL0228_00004': '#1984ff'})
+            loci.plot()
+        plt.close('all')
+
+        report = profiler.report()
+        self.assertEqual({'generate', 'resolve_loci', 'plot'}, set(report['panel']))
+        self.assertEqual({'Lbombicola_ESL0228_00004', 'Lbombicola_ESL0228_00500'}, set(report['loci']))
+
+        stages = report['loci']['Lbombicola_ESL0228_00004']
+        for name in ['translate_record', 'crop', 'colorize', 'plot', 'GraphicRecord.plot']:
+            self.assertEqual(1, stages[name]['calls'], name)
+            self.assertGreater(stages[name]['seconds'], 0)
+            self.assertIsNotNone(stages[name]['peak_kib'])
+
+        # nested stages are included in the enclosing stage
+        self.assertGreaterEqual(report['panel']['generate']['seconds'], report['panel']['resolve_loci']['seconds'])
+        self.assertGreaterEqual(report['panel']['generate']['peak_kib'], report['panel']['resolve_loci']['peak_kib'])
+
+        self.assertEqual(sum(s['calls'] for s in report['panel'].values()) +
+                         sum(s['calls'] for stages in report['loci'].values() for s in stages.values()), len(recorded))
+        self.assertIn('translate_record', str(profiler))
+
+    def test_no_profiler(self):
+        with Profiler() as profiler:
+            pass
+        Locus(gbk_file=new_prokka_file, locus_tag='Lbombicola_ESL0228_00004')
+        with stage('test'):
+            pass
+        self.assertEqual(dict(panel={}, loci={}), profiler.report())
+
+    def test_without_memory(self):
+        with Profiler() as profiler:
+            Locus(gbk_file=new_prokka_file, locus_tag='Lbombicola_ESL0228_00004')
+        stages = profiler.report()['loci']['Lbombicola_ESL0228_00004']
+        self.assertIsNone(stages['translate_record']['peak_kib'])
+        self.assertEqual(1, stages['get_scaffold_and_geneposition']['calls'])
+
+    def test_keyword_arguments(self):
+        # profiled staticmethod: works with keyword arguments, with and without profiler
+        loci_of_interest = [dict(gbk=new_prokka_file, gene='Lbombicola_ESL0228_00004', title='title1')]
+        loci = Loci.generate(loci_of_interest=loci_of_interest, locus_to_color_dict={})
+        self.assertEqual(1, len(loci.loci))
+        with Profiler() as profiler:
+            loci = Loci.generate(loci_of_interest=loci_of_interest, locus_to_color_dict={})
+        self.assertEqual(1, len(loci.loci))
+        self.assertEqual(1, profiler.report()['panel']['generate']['calls'])
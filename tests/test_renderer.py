@@ -0,0 +1,49 @@
+import os
+from unittest import TestCase
+from concurrent.futures import ThreadPoolExecutor
+import matplotlib.pyplot as plt
+from gene_loci_comparison import Locus
+from gene_loci_comparison.Renderer import Renderer
+
+assert os.path.isfile('tests/test_loci.py'), f'Please set working directory to git root!'
+
+new_prokka_file = 'tests/data/Prokka/Lbombicola_ESL0228.gbk'
+
+
+class TestRenderer(TestCase):
+    def setUp(self):
+        self.loci = [
+            Locus(gbk_file=new_prokka_file, locus_tag=locus_tag, title=locus_tag)
+            for locus_tag in ['Lbombicola_ESL0228_00004', 'Lbombicola_ESL0228_00500', 'Lbombicola_ESL0228_01500']
+        ]
+
+    def test_svg_and_png(self):
+        renderer = Renderer()
+        n_pyplot_figures = len(plt.get_fignums())
+
+        svg = renderer.to_svg(self.loci[0])
+        self.assertTrue(svg.startswith('<?xml'))
+        self.assertIn('Lbombicola_ESL0228_00004', svg)
+
+        png = renderer.to_png(self.loci[0])
+        self.assertTrue(png.startswith(b'\x89PNG'))
+
+        # the figure is reused, nothing is left open in pyplot
+        self.assertEqual(png, renderer.to_png(self.loci[0]))
+        self.assertEqual(1, renderer.n_figures)
+        self.assertEqual(n_pyplot_figures, len(plt.get_fignums()))
+
+    def test_threads(self):
+        renderer = Renderer()
+        expected = [renderer.to_png(locus) for locus in self.loci]
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            pngs = list(executor.map(renderer.to_png, self.loci * 3))
+
+        self.assertEqual(expected * 3, pngs)
+        self.assertLessEqual(renderer.n_figures, 3)
+
+    def test_plot_to_string_closes_figure(self):
+        n_pyplot_figures = len(plt.get_fignums())
+        self.loci[0].plot_to_string()
+        self.assertEqual(n_pyplot_figures, len(plt.get_fignums()))
@@ -0,0 +1,88 @@
+import os
+from unittest import TestCase
+from gene_loci_comparison.GenbankIndex import GenbankIndex
+from dna_features_viewer import GraphicFeature
+from gene_loci_comparison.utils import FeatureIndex, FeatureTable, get_feature_index, calc_gc_content, calc_gc_skew, \
+    strand_coverage
+
+assert os.path.isfile('tests/test_loci.py'), f'Please set working directory to git root!'
+
+new_prokka_file = 'tests/data/Prokka/Lbombicola_ESL0228.gbk'
+
+
+class TestUtils(TestCase):
+    def test_feature_index(self):
+        scaffold, gene_location = GenbankIndex.load(new_prokka_file).get_scaffold_and_geneposition('Lbombicola_ESL0228_00004')
+        index = FeatureIndex(scaffold.features)
+
+        for start, end in [(0, 100), (0, 3000), (1368, 1536), (5000, 9000), (len(scaffold) - 2000, len(scaffold))]:
+            expected = [
+                f for f in scaffold.features
+                if f.type != 'source' and f.location.start <= end and f.location.end >= start
+            ]
+            self.assertEqual(expected, index.overlapping(start, end))
+
+        self.assertIs(get_feature_index(scaffold), get_feature_index(scaffold))
+
+    def test_feature_table(self):
+        def feature(start, end, strand, locus_tag):
+            f = GraphicFeature(start=start, end=end, strand=strand, label=locus_tag)
+            f.data['qualifiers'] = {'locus_tag': [locus_tag]}
+            return f
+
+        table = FeatureTable([feature(0, 100, 1, 'a'), feature(50, 300, -1, 'b'), feature(50, 300, 1, 'a'),
+                              feature(400, 500, 1, 'c')])
+        self.assertEqual(['a', 'b', 'c'], table.tags)
+        self.assertEqual([0, 1, 0, 2], list(table.tag_id))
+        self.assertEqual({'a': [0, 2], 'b': [1], 'c': [3]}, table.rows)
+        self.assertEqual(-1, table.strand_of('b'))
+        self.assertEqual(175, table.gene_location('b'))
+        with self.assertRaises(KeyError):
+            table.row('d')
+
+        cropped = table.crop((100, 400))
+        self.assertEqual([(100, 100), (100, 300), (100, 300), (400, 400)], [(f.start, f.end) for f in cropped])
+        self.assertEqual(0, table.features[0].start)  # copies
+
+        # colors and labels are applied to the copies, the features of the table are not changed
+        table.set_colors({'a': '#ff0000'}, default_color='#ffffff')
+        table.set_labels({'b': 'B'})
+        copied = table.copy()
+        copied.set_labels({'c': 'C'}, remove_unspecified=True)
+        cropped = table.crop((100, 400))
+        self.assertEqual(['#ff0000', '#ffffff', '#ff0000', '#ffffff'], [f.color for f in cropped])
+        self.assertEqual(['a', 'B', 'a', 'c'], [f.label for f in cropped])
+        self.assertEqual([None, None, None, 'C'], [f.label for f in copied.crop((100, 400))])
+        self.assertEqual(['#000080', 'b'], [table.features[0].color, table.features[1].label])
+
+        # the gene or CDS of a locus tag, like GenbankIndex
+        gene = feature(50, 300, 1, 'e')
+        gene.data['type'] = 'gene'
+        table = FeatureTable([feature(0, 10, -1, 'e'), gene])
+        self.assertEqual(1, table.row('e'))
+        self.assertEqual(175, table.gene_location('e'))
+        self.assertEqual(1, table.strand_of('e'))
+
+    def test_strand_coverage(self):
+        features = [GraphicFeature(start=0, end=50, strand=1), GraphicFeature(start=25, end=75, strand=1),
+                    GraphicFeature(start=150, end=300, strand=-1), GraphicFeature(start=80, end=90)]
+        coverage = strand_coverage(features, (0, 200), [50, 100, 300])
+        starts, plus, minus = coverage[50]
+        self.assertEqual([0, 50, 100, 150], list(starts))
+        self.assertEqual([1, 0.5 + 0.2, 0, 0], list(plus))
+        self.assertEqual([0, 0, 0, 1], list(minus))
+        self.assertEqual([0.85, 0], list(coverage[100][1]))
+        self.assertAlmostEqual(50 / 300, coverage[300][2][0])  # the bin reaches beyond the window
+
+    def test_gc(self):
+        sequence = b'ATGCGGCCATTAGCNNgcGCATATATGGGCCCTA' * 7
+        window_bp = 10
+        for step in (1, 3):
+            starts, gc = calc_gc_content(sequence, window_bp=window_bp, step=step)
+            _, skew = calc_gc_skew(sequence, window_bp=window_bp, step=step)
+            self.assertEqual(list(range(0, len(sequence) - window_bp + 1, step)), list(starts))
+            for x, gc_x, skew_x in zip(starts, gc, skew):
+                window = sequence[x:x + window_bp].upper()
+                g, c = window.count(b'G'), window.count(b'C')
+                self.assertAlmostEqual((g + c) / window_bp, gc_x)
+                self.assertAlmostEqual((g - c) / (g + c) if g + c else 0, skew_x)